@@ -0,0 +1,327 @@
+"""Deteccion de camas que superan el SLA de su estado.
+
+``Programador`` guarda en un min-heap el vencimiento de cada cama que esta en
+un estado con SLA: ``estado_inicio`` mas los minutos de ``sla_estados`` para
+ese estado y la ubicacion mas cercana de la cama (sector, piso, torre o el
+valor por defecto, ``ubicacion_id`` 0). Su hilo duerme hasta el proximo
+vencimiento; al vencer inserta la alerta en ``alertas_sla`` y publica el
+evento ``alerta_sla`` en el canal SSE. Cuando la cama sale del estado, la
+alerta abierta se marca como resuelta.
+
+El heap se actualiza con el feed de ``cambios.py``: cada evento de cama
+publicado en este proceso despierta al hilo, que lee solo las camas con
+``cambio_seq`` mayor al ultimo visto. Cada ``ALERTAS_SLA_INTERVALO``
+segundos repite esa lectura para ver cambios de otros workers. Todas las
+camas se releen solo al tomar el turno y cuando cambia ``version_sla`` (que
+se incrementa al escribir ``sla_estados`` o ``ubicaciones``). Las entradas
+viejas del heap no se buscan para borrarlas: al salir se descartan si la
+cama ya esta en otro episodio.
+
+Un solo proceso ejecuta el programador a la vez: el turno es un lease en
+``parametros_sistema`` (``alertas_sla_turno``) que el titular renueva en cada
+lectura y que otro proceso toma si vence. Los demas workers, o un
+``flask alertas-sla`` aparte, esperan sin leer camas. El indice unico
+(cama_id, estado_inicio) evita alertas duplicadas si dos turnos se cruzan.
+"""
+import heapq
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, event, or_
+from sqlalchemy.orm import Session
+
+from eventos import canal
+from models import db, insert_upsert, AlertaSla, Cama, ParametroSistema, SlaEstado, Ubicacion
+import cambios
+import referencias
+
+logger = logging.getLogger('centro_comandos.sla')
+
+CLAVE_VERSION = 'version_sla'
+CLAVE_TURNO = 'alertas_sla_turno'
+TURNO_INTERVALOS = 3      # el turno vence si no se renueva en 3 intervalos
+ESCALA_TURNO = 10 ** 6    # valor = vence_ms * ESCALA_TURNO + sufijo del titular
+TAMANO_LOTE = 500
+EVENTOS_CAMBIO = {'cama', 'resync'}
+
+
+def incrementar_version(connection):
+    """Avisa al programador que cambiaron los SLA o la jerarquia de ubicaciones."""
+    referencias.incrementar_version(connection, CLAVE_VERSION)
+
+
+@event.listens_for(Session, 'after_flush')
+def _detectar_cambios(session, flush_context):
+    modificados = list(session.new) + list(session.deleted) + [o for o in session.dirty if session.is_modified(o)]
+    if any(isinstance(obj, (SlaEstado, Ubicacion)) for obj in modificados):
+        incrementar_version(session.connection())
+
+
+class Programador:
+    def __init__(self, app, intervalo=10):
+        self.app = app
+        self.intervalo = intervalo
+        self.alertas_emitidas = 0
+        self._detener = threading.Event()
+        self._heap = []          # (vence_en, cama_id, estado_inicio)
+        self._episodios = {}     # cama_id -> (estado_id, estado_inicio, ubicacion_id, minutos)
+        self._alertadas = {}     # cama_id -> estado_inicio de su alerta abierta
+        self._resueltas = []     # (cama_id, resuelta_en) pendientes de escribir
+        self._slas = {}          # (estado_id, ubicacion_id) -> minutos
+        self._ancestros = {}     # ubicacion_id -> (ubicacion_id, padre, ..., 0)
+        self._token = 0
+        self._version = None     # version_sla con que se armo el heap
+        self._turno = None       # valor del lease mientras este proceso lo tiene
+        self._sufijo = random.randrange(ESCALA_TURNO)
+
+    # ── estado en memoria ─────────────────────────────────────────
+    def _cargar_ubicaciones(self):
+        self._ancestros = {
+            id_: tuple(int(p) for p in reversed(ruta.strip('/').split('/'))) + (0,) if ruta else (id_, 0)
+            for id_, ruta in db.session.execute(db.select(Ubicacion.id, Ubicacion.ruta))
+        }
+
+    def _sla(self, estado_id, ubicacion_id):
+        if ubicacion_id not in self._ancestros:
+            self._cargar_ubicaciones()
+        for candidata in self._ancestros.get(ubicacion_id, (ubicacion_id, 0)):
+            minutos = self._slas.get((estado_id, candidata))
+            if minutos is not None:
+                return minutos
+        return None
+
+    def _actualizar(self, cama_id, estado_id, estado_inicio, ubicacion_id):
+        """Registra el episodio actual de la cama y agenda su vencimiento."""
+        alertada = self._alertadas.get(cama_id)
+        if alertada is not None and alertada != estado_inicio:
+            self._resueltas.append((cama_id, estado_inicio or datetime.utcnow()))
+            del self._alertadas[cama_id]
+
+        minutos = self._sla(estado_id, ubicacion_id) if estado_inicio else None
+        if minutos is None:
+            self._episodios.pop(cama_id, None)
+            return
+        episodio = (estado_id, estado_inicio, ubicacion_id, minutos)
+        if self._episodios.get(cama_id) == episodio:
+            return
+        self._episodios[cama_id] = episodio
+        if alertada != estado_inicio:
+            heapq.heappush(self._heap, (estado_inicio + timedelta(minutes=minutos), cama_id, estado_inicio))
+
+    def _quitar(self, cama_id):
+        self._episodios.pop(cama_id, None)
+        if self._alertadas.pop(cama_id, None) is not None:
+            self._resueltas.append((cama_id, datetime.utcnow()))
+
+    def _vencidas(self, ahora):
+        alertas = []
+        while self._heap and self._heap[0][0] <= ahora:
+            vence_en, cama_id, estado_inicio = heapq.heappop(self._heap)
+            episodio = self._episodios.get(cama_id)
+            if episodio is None or episodio[1] != estado_inicio:
+                continue  # la cama cambio de estado antes de vencer
+            estado_id, _, ubicacion_id, minutos = episodio
+            self._alertadas[cama_id] = estado_inicio
+            alertas.append({
+                'cama_id': cama_id, 'estado_id': estado_id, 'ubicacion_id': ubicacion_id,
+                'estado_inicio': estado_inicio, 'vence_en': vence_en, 'sla_minutos': minutos,
+                'detectada_en': ahora,
+            })
+        return alertas
+
+    def segundos_al_vencimiento(self):
+        if not self._heap:
+            return None
+        return max(0.0, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+
+    # ── lectura y escritura en la base ────────────────────────────
+    def reconstruir(self):
+        """Relee SLAs, ubicaciones, alertas abiertas y el episodio de cada cama."""
+        self._version = self._version_db()
+        self._token = cambios.token_actual()  # antes de leer las camas, como el monitor
+        self._slas = {(s.estado_id, s.ubicacion_id): s.minutos for s in SlaEstado.query}
+        self._cargar_ubicaciones()
+        self._alertadas = dict(db.session.execute(
+            db.select(AlertaSla.cama_id, AlertaSla.estado_inicio).where(AlertaSla.resuelta_en.is_(None))
+        ).all())
+        self._heap, self._episodios = [], {}
+        activas = set()
+        for cama_id, estado_id, estado_inicio, ubicacion_id in db.session.execute(
+            db.select(Cama.id, Cama.estado_id, Cama.estado_inicio, Cama.ubicacion_id).where(Cama.activo == True)
+        ):
+            activas.add(cama_id)
+            self._actualizar(cama_id, estado_id, estado_inicio, ubicacion_id)
+        for cama_id in set(self._alertadas) - activas:
+            self._quitar(cama_id)
+        heapq.heapify(self._heap)
+
+    def _version_db(self):
+        return db.session.query(ParametroSistema.valor).filter_by(clave=CLAVE_VERSION).scalar() or 0
+
+    def sincronizar(self):
+        """Rearma todo si cambiaron SLAs o ubicaciones; si no, solo lee los cambios."""
+        if self._version is None or self._version_db() != self._version:
+            self.reconstruir()
+        else:
+            self.ponerse_al_dia()
+
+    def ponerse_al_dia(self):
+        """Aplica las camas modificadas despues del ultimo token visto."""
+        while True:
+            filas = db.session.execute(
+                db.select(Cama.id, Cama.estado_id, Cama.estado_inicio, Cama.ubicacion_id, Cama.activo, Cama.cambio_seq)
+                .where(Cama.cambio_seq > self._token).order_by(Cama.cambio_seq).limit(TAMANO_LOTE)
+            ).all()
+            for cama_id, estado_id, estado_inicio, ubicacion_id, activo, _ in filas:
+                if activo:
+                    self._actualizar(cama_id, estado_id, estado_inicio, ubicacion_id)
+                else:
+                    self._quitar(cama_id)
+            if filas:
+                self._token = filas[-1].cambio_seq
+            if len(filas) < TAMANO_LOTE:
+                return
+
+    def _escribir(self, alertas):
+        """Inserta alertas nuevas y cierra las resueltas; publica solo las insertadas."""
+        tabla = AlertaSla.__table__
+        nuevas = []
+        for i in range(0, len(alertas), TAMANO_LOTE):
+            stmt = insert_upsert(tabla).values(alertas[i:i + TAMANO_LOTE]).on_conflict_do_nothing(
+                index_elements=['cama_id', 'estado_inicio']
+            ).returning(tabla.c.id, tabla.c.cama_id, tabla.c.estado_id, tabla.c.vence_en)
+            nuevas += db.session.execute(stmt).all()
+        if self._resueltas:
+            db.session.execute(
+                tabla.update().where(tabla.c.cama_id == bindparam('c'), tabla.c.resuelta_en.is_(None))
+                .values(resuelta_en=bindparam('r')),
+                [{'c': cama_id, 'r': fecha} for cama_id, fecha in self._resueltas]
+            )
+        db.session.commit()
+        self._resueltas = []
+        self.alertas_emitidas += len(nuevas)
+        for id_, cama_id, estado_id, vence_en in nuevas:
+            canal.publicar('alerta_sla', {
+                'id': id_, 'cama_id': cama_id, 'estado_id': estado_id, 'vence_en': vence_en.isoformat(),
+            })
+
+    # ── bucle ─────────────────────────────────────────────────────
+    def _esperar(self, cola, segundos):
+        """Tipos de evento recibidos hasta ``segundos`` (vacio si solo vencio el plazo)."""
+        if cola is None:
+            self._detener.wait(segundos)
+            return set()
+        tipos = set()
+        try:
+            tipos.add(cola.get(timeout=segundos)[0])
+            while True:
+                tipos.add(cola.get_nowait()[0])
+        except queue.Empty:
+            pass
+        return tipos
+
+    # ── turno (un solo programador activo) ────────────────────────
+    def renovar_turno(self):
+        """Toma o renueva el turno; False si lo tiene otro proceso vigente."""
+        tabla = ParametroSistema.__table__
+        ahora_ms = int(time.time() * 1000)
+        nuevo = (ahora_ms + TURNO_INTERVALOS * self.intervalo * 1000) * ESCALA_TURNO + self._sufijo
+        libre = tabla.c.valor < ahora_ms * ESCALA_TURNO
+        condicion = or_(libre, tabla.c.valor == self._turno) if self._turno is not None else libre
+        tomado = db.session.execute(
+            tabla.update().where(tabla.c.clave == CLAVE_TURNO, condicion).values(valor=nuevo)
+        ).rowcount
+        if not tomado:
+            tomado = db.session.execute(
+                insert_upsert(tabla).values(clave=CLAVE_TURNO, valor=nuevo).on_conflict_do_nothing(index_elements=['clave'])
+            ).rowcount
+        db.session.commit()
+        self._turno = nuevo if tomado else None
+        return bool(tomado)
+
+    def _soltar_turno(self):
+        if self._turno is not None:
+            tabla = ParametroSistema.__table__
+            db.session.execute(tabla.update().where(tabla.c.clave == CLAVE_TURNO, tabla.c.valor == self._turno).values(valor=0))
+            db.session.commit()
+        self._turno = None
+
+    def _olvidar(self):
+        """Descarta el estado en memoria al perder el turno; se rearma al recuperarlo."""
+        self._heap, self._episodios, self._alertadas, self._resueltas = [], {}, {}, []
+        self._version = None
+
+    # ── bucle ─────────────────────────────────────────────────────
+    def ejecutar(self, escuchar_canal=True):
+        """Bucle del programador; retorna cuando se llama ``detener()``.
+
+        Sin turno solo intenta tomarlo cada ``intervalo`` segundos. Con turno
+        escucha el canal (si ``escuchar_canal``) y duerme hasta el proximo
+        vencimiento, un evento de cama o la siguiente lectura de cambios.
+        """
+        cola = None
+        proxima_lectura = 0
+        try:
+            while not self._detener.is_set():
+                espera = proxima_lectura - time.monotonic()
+                vencimiento = self.segundos_al_vencimiento()
+                if vencimiento is not None:
+                    espera = min(espera, vencimiento)
+                tipos = self._esperar(cola, espera) if espera > 0 else set()
+                try:
+                    with self.app.app_context():
+                        if time.monotonic() >= proxima_lectura:
+                            proxima_lectura = time.monotonic() + self.intervalo
+                            if not self.renovar_turno():
+                                if cola is not None:
+                                    canal.desuscribir(cola)
+                                    cola = None
+                                self._olvidar()
+                                continue
+                            if escuchar_canal and cola is None:
+                                cola = canal.suscribir()
+                            self.sincronizar()
+                        elif tipos & EVENTOS_CAMBIO:
+                            self.ponerse_al_dia()
+                        alertas = self._vencidas(datetime.utcnow())
+                        if alertas or self._resueltas:
+                            self._escribir(alertas)
+                except Exception:
+                    logger.exception('error en el programador de alertas SLA')
+                    with self.app.app_context():
+                        db.session.rollback()
+                    self._version = None  # rearmar en la proxima lectura
+                    self._detener.wait(self.intervalo)
+        finally:
+            if cola is not None:
+                canal.desuscribir(cola)
+            with self.app.app_context():
+                self._soltar_turno()
+
+    def detener(self):
+        self._detener.set()
+
+
+_en_proceso = None  # (pid, Programador)
+_lock = threading.Lock()
+
+
+def iniciar_en_proceso(app):
+    """Arranca el hilo del programador una vez por proceso (tambien despues de un fork).
+
+    Cada worker tiene su hilo, pero solo el que tiene el turno lee camas.
+    """
+    global _en_proceso
+    if _en_proceso is not None and _en_proceso[0] == os.getpid():
+        return _en_proceso[1]
+    with _lock:
+        if _en_proceso is None or _en_proceso[0] != os.getpid():
+            programador = Programador(app, app.config.get('ALERTAS_SLA_INTERVALO', 10))
+            threading.Thread(target=programador.ejecutar, name='alertas-sla', daemon=True).start()
+            _en_proceso = (os.getpid(), programador)
+    return _en_proceso[1]
@@ -0,0 +1,81 @@
+"""Episodios de alta medica para el KPI de cierre exitoso.
+
+El KPI cuenta las camas que pasaron por Alta Medica en el rango y despues
+llegaron a Disponible o Proceso de Liberacion. Resolverlo sobre
+``historial_camas`` exige un EXISTS por cada alta del rango; ``altas_camas``
+guarda cada alta con la fecha de su cierre y el KPI queda en un conteo
+sobre un indice.
+
+``registrar()`` se llama con cada lote de historial insertado (los
+cambios de estado y la carga demo insertan con Core, sin eventos del ORM).
+``reconstruir()`` la arma desde el historial completo.
+"""
+from sqlalchemy import bindparam, func
+from sqlalchemy.orm import aliased
+
+from models import db, AltaCama, HistorialCama
+from referencias import cache as referencias
+
+ESTADO_ALTA = 'Alta Medica'
+ESTADOS_CIERRE = ('Disponible', 'Proceso de Liberacion')
+
+
+def _ids():
+    """``(alta_id, {ids de cierre})`` desde el cache de referencias."""
+    alta = referencias.estado(ESTADO_ALTA)
+    cierre = {e.id for e in map(referencias.estado, ESTADOS_CIERRE) if e}
+    return (alta.id if alta else None), cierre
+
+
+def registrar(filas):
+    """Aplica a ``altas_camas`` las filas de historial recien insertadas.
+
+    ``filas`` son los dicts del INSERT. Primero se insertan las altas y
+    despues se cierran, en orden cronologico, las abiertas anteriores a cada
+    llegada a un estado de cierre: el resultado no depende de como vengan
+    agrupadas las filas.
+    """
+    alta_id, cierre_ids = _ids()
+    if alta_id is None:
+        return
+    altas, cierres = [], []
+    for fila in filas:
+        if fila.get('created_at') is None:
+            continue
+        if fila['estado_nuevo_id'] == alta_id:
+            altas.append({'cama_id': fila['cama_id'], 'created_at': fila['created_at']})
+        elif fila['estado_nuevo_id'] in cierre_ids:
+            cierres.append({'c': fila['cama_id'], 'f': fila['created_at']})
+    tabla = AltaCama.__table__
+    if altas:
+        db.session.execute(tabla.insert(), altas)
+    if cierres:
+        cierres.sort(key=lambda c: c['f'])
+        db.session.execute(
+            tabla.update().where(
+                tabla.c.cama_id == bindparam('c'), tabla.c.cerrada_en.is_(None), tabla.c.created_at < bindparam('f')
+            ).values(cerrada_en=bindparam('f')),
+            cierres
+        )
+
+
+def reconstruir():
+    """Rearma ``altas_camas`` desde ``historial_camas``. Retorna las altas insertadas."""
+    db.session.query(AltaCama).delete()
+    alta_id, cierre_ids = _ids()
+    if alta_id is None or not cierre_ids:
+        return 0
+    posterior = aliased(HistorialCama)
+    cierre = db.select(func.min(posterior.created_at)).where(
+        posterior.cama_id == HistorialCama.cama_id,
+        posterior.estado_nuevo_id.in_(cierre_ids),
+        posterior.created_at > HistorialCama.created_at
+    ).scalar_subquery()
+    return db.session.execute(
+        AltaCama.__table__.insert().from_select(
+            ['cama_id', 'created_at', 'cerrada_en'],
+            db.select(HistorialCama.cama_id, HistorialCama.created_at, cierre).where(
+                HistorialCama.estado_nuevo_id == alta_id, HistorialCama.created_at.isnot(None)
+            )
+        )
+    ).rowcount
@@ -1,260 +1,206 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, session
-from models import db, Ubicacion, Cama, EstadoCama, HistorialCama, Perfil, Paciente
+from flask import Blueprint, Flask, Response, abort, current_app, render_template, request, jsonify, redirect, url_for, send_file, session, stream_with_context
+from config import Config, configurar_motor
+from models import (
+    db, AlertaSla, AltaCama, Ubicacion, Cama, EstadoCama, HistorialCama, Perfil, Paciente,
+    ResumenEstado, ResumenPerfil, ResumenUbicacion
+)
+from eventos import canal, evento_cama
+from jerarquia import ancestros, es_descendiente, filtro_subarbol
+from migraciones import esquema_al_dia, migrar
+import alertas_sla
+import altas
+import busqueda
+import cambios
+import duraciones
+import instrumentacion
+import maquina_estados
+import paginacion
+import resumen
+import semilla
+import serializacion
+from referencias import cache as referencias
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import case, func
+from sqlalchemy.orm import aliased, joinedload
+from sqlalchemy.orm.exc import StaleDataError
+import click
+import csv
 import io
-import qrcode
+import qr
+import threading
+import time
+
+# Rutas y comandos de la aplicacion; create_app() los registra en cada instancia
+bp = Blueprint('principal', __name__, cli_group=None)
+
+
+def cargar_arbol_monitor():
+    """Carga el arbol activo Torre/Piso/Sector con sus camas en dos consultas.
+
+    Retorna la lista de torres como diccionarios ya filtrados y ordenados
+    (``hijos`` y ``camas``), con el estado de cada cama precargado, para que
+    el template no dispare cargas lazy por cada nivel.
+    """
+    ubicaciones = Ubicacion.query.filter_by(activo=True).order_by(
+        Ubicacion.orden, Ubicacion.id
+    ).all()
+    camas = Cama.query.options(joinedload(Cama.estado)).filter_by(activo=True).order_by(
+        Cama.orden, Cama.id
+    ).all()
+
+    nodos = {
+        u.id: {
+            'id': u.id,
+            'nombre': u.nombre,
+            'tipo': u.tipo,
+            'camas_por_fila': u.camas_por_fila,
+            'hijos': [],
+            'camas': [],
+        }
+        for u in ubicaciones
+    }
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///centro_comandos.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'dev-secret-key-change-in-production'
+    torres = []
+    for u in ubicaciones:
+        if u.tipo == 'torre':
+            torres.append(nodos[u.id])
+        elif u.padre_id in nodos:
+            nodos[u.padre_id]['hijos'].append(nodos[u.id])
 
-db.init_app(app)
+    for cama in camas:
+        if cama.ubicacion_id in nodos:
+            nodos[cama.ubicacion_id]['camas'].append(cama)
 
+    return torres
 
-def init_datos_dummy():
-    """Inicializa datos dummy para la demo"""
-    # Perfiles de usuario — con nivel_acceso para RBAC (#18)
-    perfiles = [
-        {'nombre': 'Administrador',     'color': '#2F7E81', 'nivel_acceso': 1},
-        {'nombre': 'Staff de Limpieza', 'color': '#8AC52F', 'nivel_acceso': 2},
-        {'nombre': 'Enfermera',         'color': '#60B2B2', 'nivel_acceso': 2},
-        {'nombre': 'Movilizador',       'color': '#9C27B0', 'nivel_acceso': 3},
-    ]
 
-    for perfil_data in perfiles:
-        existing = Perfil.query.filter_by(nombre=perfil_data['nombre']).first()
-        if not existing:
-            perfil = Perfil(**perfil_data)
-            db.session.add(perfil)
-        else:
-            existing.nivel_acceso = perfil_data['nivel_acceso']
+@bp.route('/')
+def index():
+    """Vista principal - Monitor de camas"""
+    # El token se lee antes del arbol: un cambio entre ambas lecturas se
+    # vuelve a entregar en la primera sincronizacion, no se pierde
+    token_cambios = cambios.token_actual()
+    torres = cargar_arbol_monitor()
+    estados = referencias.estados()
+    perfiles = referencias.perfiles()
+    return render_template('index.html', torres=torres, estados=estados, perfiles=perfiles,
+                           token_cambios=token_cambios)
 
-    db.session.commit()
 
-    # Estados de cama — paleta oficial RedSalud (issue #13)
-    # border_color != None → estilo borde (fill transparente + borde coloreado)
-    estados = [
-        {'nombre': 'Disponible',                'color': '#4CAF50', 'border_color': None,      'descripcion': 'Cama lista para recibir paciente',                     'orden': 1},
-        {'nombre': 'Ocupada',                   'color': '#F44336', 'border_color': None,      'descripcion': 'Cama con paciente',                                    'orden': 2},
-        {'nombre': 'Alta Medica',               'color': '#F44336', 'border_color': '#F44336', 'descripcion': 'Alta medica con fecha definida en sistema',            'orden': 3},
-        {'nombre': 'Esperando Traslado',        'color': '#9C27B0', 'border_color': None,      'descripcion': 'Esperando traslado de paciente',                       'orden': 4},
-        {'nombre': 'Esperando Higiene',         'color': '#FFC107', 'border_color': None,      'descripcion': 'Cama esperando ser higienizada',                       'orden': 5},
-        {'nombre': 'Higiene Realizado',         'color': '#FFC107', 'border_color': '#FFC107', 'descripcion': 'Cama disponible — higiene ya realizado',               'orden': 6},
-        {'nombre': 'Proceso de Liberacion',     'color': '#4CAF50', 'border_color': '#4CAF50', 'descripcion': 'Cama en proceso de liberacion en sistema',             'orden': 7},
-        {'nombre': 'Bloqueada',                 'color': '#9E9E9E', 'border_color': None,      'descripcion': 'Cama no disponible',                                   'orden': 8},
-    ]
+@bp.route('/api/ubicacion/<int:ubicacion_id>/camas')
+def get_camas_ubicacion(ubicacion_id):
+    """Obtiene las camas de una ubicacion"""
+    ubicacion = Ubicacion.query.get_or_404(ubicacion_id)
+    return serializacion.respuesta_json({
+        'ubicacion': ubicacion.to_dict(),
+        'camas': serializacion.camas(Cama.ubicacion_id == ubicacion_id)
+    })
 
-    for estado_data in estados:
-        existing = EstadoCama.query.filter_by(nombre=estado_data['nombre']).first()
-        if not existing:
-            estado = EstadoCama(**estado_data)
-            db.session.add(estado)
-        else:
-            # Actualizar colores si ya existe
-            existing.color = estado_data['color']
-            existing.border_color = estado_data['border_color']
-            existing.orden = estado_data['orden']
 
-    db.session.commit()
+@bp.route('/api/camas/cambios')
+def get_cambios_camas():
+    """Camas modificadas despues de ?since=<token>, con tombstones y token nuevo"""
+    desde = request.args.get('since', '0')
+    if not desde.isdigit():
+        return jsonify({'error': 'token invalido'}), 400
+    limite = min(max(request.args.get('limite', cambios.LIMITE_CAMBIOS, type=int), 1), cambios.LIMITE_CAMBIOS)
+    return serializacion.respuesta_json(cambios.cambios_desde(int(desde), limite))
 
-    # Ubicaciones - Estructura jerarquica
-    estructuras = [
-        {
-            'nombre': 'Torre A',
-            'tipo': 'torre',
-            'pisos': [
-                {'nombre': 'Piso 1', 'sectores': ['UCI', 'Urgencias']},
-                {'nombre': 'Piso 2', 'sectores': ['Medicina General', 'Cardiologia']},
-                {'nombre': 'Piso 3', 'sectores': ['Cirugia', 'Traumatologia']},
-            ]
-        },
-        {
-            'nombre': 'Torre B',
-            'tipo': 'torre',
-            'pisos': [
-                {'nombre': 'Piso 1', 'sectores': ['Pediatria', 'Neonatologia']},
-                {'nombre': 'Piso 2', 'sectores': ['Maternidad', 'Ginecologia']},
-            ]
-        },
-    ]
 
-    # Obtener todos los estados
-    estado_disponible = EstadoCama.query.filter_by(nombre='Disponible').first()
-    estado_ocupada = EstadoCama.query.filter_by(nombre='Ocupada').first()
-    estado_esp_transporte = EstadoCama.query.filter_by(nombre='Esperando Transporte').first()
-    estado_esp_limpieza = EstadoCama.query.filter_by(nombre='Esperando Limpieza').first()
-    estado_en_limpieza = EstadoCama.query.filter_by(nombre='En Limpieza').first()
-
-    estados_demo = [
-        estado_disponible, estado_ocupada, estado_ocupada,
-        estado_esp_transporte, estado_esp_limpieza, estado_en_limpieza,
-        estado_disponible, estado_ocupada
-    ]
+@bp.route('/api/cama/<int:cama_id>')
+def get_cama(cama_id):
+    """Obtiene los datos de una cama"""
+    cama = Cama.query.get_or_404(cama_id)
+    return jsonify(cama.to_dict())
 
-    import random
-
-    # Crear pacientes dummy
-    pacientes_dummy = [
-        {'nombre': 'Juan Pérez', 'rut': '12.345.678-9'},
-        {'nombre': 'María González', 'rut': '9.876.543-2'},
-        {'nombre': 'Pedro Soto', 'rut': '15.432.167-K'},
-        {'nombre': 'Ana Martínez', 'rut': '8.765.432-1'},
-        {'nombre': 'Carlos Rojas', 'rut': '11.222.333-4'},
-        {'nombre': 'Lucía Fernández', 'rut': '14.555.666-7'},
-        {'nombre': 'Roberto Silva', 'rut': '7.888.999-0'},
-        {'nombre': 'Carmen López', 'rut': '16.111.222-3'},
-    ]
 
-    for paciente_data in pacientes_dummy:
-        if not Paciente.query.filter_by(rut=paciente_data['rut']).first():
-            paciente = Paciente(**paciente_data)
-            db.session.add(paciente)
+def _pagina_historial(filtro):
+    """Lee ?cursor=&limite= y retorna la pagina de historial como JSON."""
+    limite = min(max(request.args.get('limite', paginacion.LIMITE_POR_DEFECTO, type=int), 1), paginacion.LIMITE_MAXIMO)
+    cursor = request.args.get('cursor')
+    try:
+        cursor = paginacion.decodificar_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': 'cursor invalido'}), 400
+    return serializacion.respuesta_json(paginacion.pagina_historial(filtro, cursor, limite))
 
-    db.session.commit()
 
-    pacientes = Paciente.query.all()
-    perfiles = Perfil.query.all()
+@bp.route('/api/cama/<int:cama_id>/historial')
+def get_historial_cama(cama_id):
+    """Linea de tiempo de la cama, paginada con ?cursor= (mas reciente primero)"""
+    Cama.query.get_or_404(cama_id)
+    return _pagina_historial(HistorialCama.cama_id == cama_id)
 
-    for torre_data in estructuras:
-        if Ubicacion.query.filter_by(nombre=torre_data['nombre'], tipo='torre').first():
-            continue
 
-        torre = Ubicacion(nombre=torre_data['nombre'], tipo='torre', camas_por_fila=4)
-        db.session.add(torre)
-        db.session.flush()
+@bp.route('/api/paciente/<int:paciente_id>/historial')
+def get_historial_paciente(paciente_id):
+    """Movimientos del paciente, paginados con ?cursor= (mas reciente primero)"""
+    Paciente.query.get_or_404(paciente_id)
+    return _pagina_historial(HistorialCama.paciente_id == paciente_id)
 
-        for piso_data in torre_data['pisos']:
-            piso = Ubicacion(
-                nombre=piso_data['nombre'],
-                tipo='piso',
-                padre_id=torre.id,
-                camas_por_fila=3
-            )
-            db.session.add(piso)
-            db.session.flush()
 
-            for sector_nombre in piso_data['sectores']:
-                sector = Ubicacion(
-                    nombre=sector_nombre,
-                    tipo='sector',
-                    padre_id=piso.id,
-                    camas_por_fila=3
-                )
-                db.session.add(sector)
-                db.session.flush()
+MAX_CAMBIOS_LOTE = 100
+REINTENTOS_CONFLICTO = 3
 
-                # Crear camas para cada sector
-                num_camas = random.randint(4, 9)
-                for i in range(1, num_camas + 1):
-                    estado_cama = random.choice(estados_demo)
-                    # Tiempo aleatorio: 15-58 minutos con segundos únicos usando random()
-                    # Usamos random.random() para obtener fracciones de segundo únicas
-                    total_segundos = random.randint(15 * 60, 58 * 60) + random.random() * 59
-                    tiempo_random = timedelta(seconds=total_segundos)
-                    estado_inicio = datetime.utcnow() - tiempo_random
-
-                    # Asignar paciente solo si la cama está ocupada o en transporte
-                    paciente_id = None
-                    if estado_cama.nombre in ['Ocupada', 'Esperando Transporte']:
-                        paciente_id = random.choice(pacientes).id if pacientes else None
-
-                    cama = Cama(
-                        codigo=f'{sector_nombre[:3].upper()}-{i:02d}',
-                        nombre=f'Cama {i}',
-                        ubicacion_id=sector.id,
-                        estado_id=estado_cama.id,
-                        paciente_id=paciente_id,
-                        estado_inicio=estado_inicio,
-                        orden=i
-                    )
-                    db.session.add(cama)
 
-    db.session.commit()
+def _version_vigente(cama, data):
+    """False si el cliente envio la ``version`` que vio y la cama ya cambio."""
+    esperada = data.get('version')
+    if esperada in (None, ''):
+        return True
+    try:
+        return int(esperada) == cama.version
+    except (TypeError, ValueError):
+        return False
 
-    # Generar historial dummy para estadísticas (últimas 6 semanas)
-    camas = Cama.query.all()
-    for semana in range(6):
-        for _ in range(random.randint(15, 40)):
-            cama = random.choice(camas)
-            perfil = random.choice(perfiles)
-            estado_anterior = random.choice(estados_demo)
-            estado_nuevo = random.choice(estados_demo)
-
-            fecha = datetime.utcnow() - timedelta(weeks=semana, days=random.randint(0, 6), hours=random.randint(0, 23))
-
-            historial = HistorialCama(
-                cama_id=cama.id,
-                estado_anterior_id=estado_anterior.id,
-                estado_nuevo_id=estado_nuevo.id,
-                perfil_id=perfil.id,
-                usuario=f'Usuario {perfil.nombre}',
-                created_at=fecha
-            )
-            db.session.add(historial)
 
-    db.session.commit()
-
-
-@app.route('/')
-def index():
-    """Vista principal - Monitor de camas"""
-    torres = Ubicacion.query.filter_by(tipo='torre', activo=True).all()
-    estados = EstadoCama.query.filter_by(activo=True).order_by(EstadoCama.orden).all()
-    perfiles = Perfil.query.filter_by(activo=True).all()
-    return render_template('index.html', torres=torres, estados=estados, perfiles=perfiles)
+def _error_transicion(cama, nuevo_estado):
+    """``(mensaje, status)`` si la maquina de estados no permite el cambio."""
+    nivel = maquina_estados.nivel_requerido(cama.estado_id, nuevo_estado.id)
+    if nivel is None:
+        actual = referencias.estado_por_id(cama.estado_id)
+        return f'No se puede pasar de "{actual.nombre if actual else cama.estado_id}" a "{nuevo_estado.nombre}"', 409
+    if _nivel_actual() > nivel:
+        return f'Sin permiso. Se requiere Nivel {nivel} para pasar a "{nuevo_estado.nombre}".', 403
+    return None
 
 
-@app.route('/api/ubicacion/<int:ubicacion_id>/camas')
-def get_camas_ubicacion(ubicacion_id):
-    """Obtiene las camas de una ubicacion"""
-    ubicacion = Ubicacion.query.get_or_404(ubicacion_id)
-    camas = Cama.query.filter_by(ubicacion_id=ubicacion_id, activo=True).order_by(Cama.orden).all()
+def _respuesta_conflicto(cama):
     return jsonify({
-        'ubicacion': ubicacion.to_dict(),
-        'camas': [c.to_dict() for c in camas]
-    })
-
-
-@app.route('/api/cama/<int:cama_id>')
-def get_cama(cama_id):
-    """Obtiene los datos de una cama"""
-    cama = Cama.query.get_or_404(cama_id)
-    return jsonify(cama.to_dict())
+        'error': 'La cama fue modificada por otro usuario. Revise su estado actual.',
+        'conflicto': True,
+        'cama': cama.to_dict()
+    }), 409
 
 
-@app.route('/api/cama/<int:cama_id>/estado', methods=['POST'])
-def cambiar_estado_cama(cama_id):
-    """Cambia el estado de una cama"""
-    cama = Cama.query.get_or_404(cama_id)
-    data = request.get_json()
+def _aplicar_cambio_estado(cama, nuevo_estado, data, historial, ahora=None):
+    """Aplica a ``cama`` las reglas de cambio de estado sin confirmar.
 
-    nuevo_estado_id = data.get('estado_id')
+    Las filas de historial se agregan a ``historial`` para insertarlas juntas.
+    Retorna ``(advertencia, cama_anterior)``; si hay advertencia de traslado
+    la cama no se modifica.
+    """
+    ahora = ahora or datetime.utcnow()
     perfil_id = data.get('perfil_id')
     comentario = data.get('comentario', '')
-    paciente_nombre = data.get('paciente_nombre', '').strip()
-    paciente_rut = data.get('paciente_rut', '').strip()
+    paciente_nombre = (data.get('paciente_nombre') or '').strip()
+    paciente_rut = (data.get('paciente_rut') or '').strip()
     paciente_id = data.get('paciente_id')
     confirmar_traslado = data.get('confirmar_traslado', False)
 
-    if not nuevo_estado_id:
-        return jsonify({'error': 'estado_id es requerido'}), 400
-
-    nuevo_estado = EstadoCama.query.get_or_404(nuevo_estado_id)
-
     cama_anterior = None  # Para registrar si hubo traslado
+    efectos = maquina_estados.efectos(nuevo_estado.id)
 
-    # Manejar paciente si el nuevo estado es "Ocupada"
-    if nuevo_estado.nombre == 'Ocupada':
+    # Asignar el paciente indicado (estado "Ocupada")
+    if 'asignar_paciente' in efectos:
         paciente = None
 
         if paciente_id:
             # Usar paciente existente por ID
             paciente = Paciente.query.get(paciente_id)
         elif paciente_rut:
-            # Buscar por RUT primero
-            paciente = Paciente.query.filter_by(rut=paciente_rut).first()
+            # Buscar por RUT primero (sin importar puntos ni guion)
+            paciente = busqueda.por_rut(paciente_rut)
             if not paciente:
                 paciente = Paciente(nombre=paciente_nombre, rut=paciente_rut)
                 db.session.add(paciente)
@@ -269,63 +215,112 @@ def cambiar_estado_cama(cama_id):
             # Verificar si el paciente ya está en otra cama
             cama_actual_paciente = Cama.query.filter(
                 Cama.paciente_id == paciente.id,
-                Cama.id != cama_id,
+                Cama.id != cama.id,
                 Cama.activo == True
             ).first()
 
             if cama_actual_paciente and not confirmar_traslado:
                 # Advertir al usuario sobre el traslado
-                return jsonify({
+                return {
                     'warning': True,
                     'message': f'El paciente {paciente.nombre or paciente.rut} ya está asignado a la cama {cama_actual_paciente.codigo}. ¿Desea trasladarlo?',
                     'paciente': paciente.to_dict(),
                     'cama_anterior': cama_actual_paciente.to_dict()
-                })
+                }, None
 
             # Si hay cama anterior y se confirma el traslado, liberarla
-            if cama_actual_paciente and confirmar_traslado:
+            if cama_actual_paciente and confirmar_traslado and 'liberar_anterior' in efectos:
                 cama_anterior = cama_actual_paciente
-                # Poner la cama anterior en estado "Esperando Limpieza"
-                estado_limpieza = EstadoCama.query.filter_by(nombre='Esperando Limpieza').first()
-                if estado_limpieza:
+                # La cama anterior pasa al estado posterior a un traslado ("Esperando Higiene")
+                estado_liberada = maquina_estados.estado_tras_traslado()
+                if estado_liberada:
                     # Guardar historial de la cama anterior
-                    historial_anterior = HistorialCama(
+                    historial.append(dict(
                         cama_id=cama_anterior.id,
                         estado_anterior_id=cama_anterior.estado_id,
-                        estado_nuevo_id=estado_limpieza.id,
+                        estado_nuevo_id=estado_liberada.id,
                         perfil_id=perfil_id,
                         paciente_id=paciente.id,
                         comentario=f'Paciente trasladado a cama {cama.codigo}',
-                        usuario='Demo User'
-                    )
-                    db.session.add(historial_anterior)
-                    cama_anterior.estado_id = estado_limpieza.id
-                    cama_anterior.estado_inicio = datetime.utcnow()
+                        usuario='Demo User',
+                        created_at=ahora
+                    ))
+                    cama_anterior.estado_id = estado_liberada.id
+                    cama_anterior.estado_inicio = ahora
 
                 cama_anterior.paciente_id = None
 
             cama.paciente_id = paciente.id
 
-    elif nuevo_estado.nombre == 'Disponible':
+    elif 'limpiar_paciente' in efectos:
         # Limpiar paciente cuando la cama queda disponible
         cama.paciente_id = None
 
     # Guardar historial
-    historial = HistorialCama(
+    historial.append(dict(
         cama_id=cama.id,
         estado_anterior_id=cama.estado_id,
-        estado_nuevo_id=nuevo_estado_id,
+        estado_nuevo_id=nuevo_estado.id,
         perfil_id=perfil_id,
         paciente_id=cama.paciente_id,
         comentario=comentario,
-        usuario='Demo User'
-    )
-    db.session.add(historial)
+        usuario='Demo User',
+        created_at=ahora
+    ))
 
     # Actualizar estado y resetear tiempo
-    cama.estado_id = nuevo_estado_id
-    cama.estado_inicio = datetime.utcnow()
-    db.session.commit()
+    cama.estado_id = nuevo_estado.id
+    cama.estado_inicio = ahora
+    return None, cama_anterior
+
+
+def _insertar_historial(filas):
+    """Un solo INSERT (executemany) para todas las filas de historial."""
+    if filas:
+        db.session.execute(HistorialCama.__table__.insert(), filas)
+        altas.registrar(filas)
+
+
+@bp.route('/api/cama/<int:cama_id>/estado', methods=['POST'])
+def cambiar_estado_cama(cama_id):
+    """Cambia el estado de una cama"""
+    data = request.get_json()
+
+    nuevo_estado_id = data.get('estado_id')
+    if not nuevo_estado_id:
+        return jsonify({'error': 'estado_id es requerido'}), 400
+
+    nuevo_estado = referencias.estado_por_id(nuevo_estado_id) or abort(404)
+
+    # Si otro request cambio la cama entre la lectura y el UPDATE, el flush
+    # falla con StaleDataError: se relee la cama y se reaplican las reglas
+    for _ in range(REINTENTOS_CONFLICTO):
+        cama = Cama.query.get_or_404(cama_id)
+        if not _version_vigente(cama, data):
+            return _respuesta_conflicto(cama)
+        error = _error_transicion(cama, nuevo_estado)
+        if error:
+            mensaje, status = error
+            return jsonify({'error': mensaje, 'transicion_invalida': True, 'cama': cama.to_dict()}), status
+
+        historial = []
+        advertencia, cama_anterior = _aplicar_cambio_estado(cama, nuevo_estado, data, historial)
+        if advertencia:
+            return jsonify(advertencia)
+        try:
+            db.session.flush()
+        except StaleDataError:
+            db.session.rollback()
+            continue
+        _insertar_historial(historial)
+        db.session.commit()
+        break
+    else:
+        return _respuesta_conflicto(cama)
+
+    canal.publicar('cama', evento_cama(cama))
+    if cama_anterior:
+        canal.publicar('cama', evento_cama(cama_anterior))
 
     response_data = {
         'success': True,
@@ -339,8 +334,126 @@ def cambiar_estado_cama(cama_id):
     return jsonify(response_data)
 
 
-@app.route('/ubicaciones')
-@app.route('/api/ubicacion', methods=['POST'])
+def _id_entero(valor):
+    """``valor`` como id entero (acepta ``5`` o ``"5"``); None si no lo es."""
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, int):
+        return valor
+    if isinstance(valor, str) and valor.strip().isdigit():
+        return int(valor)
+    return None
+
+
+def _aplicar_lote(cambios, comunes):
+    """Aplica y confirma un lote; lanza StaleDataError si hubo escritura concurrente."""
+    camas = {
+        c.id: c for c in Cama.query.filter(Cama.id.in_([c.get('cama_id') for c in cambios]))
+    }
+
+    ahora = datetime.utcnow()
+    historial = []
+    resultados = []
+    aplicados = []
+    for cambio in cambios:
+        datos = {**comunes, **cambio}
+        cama = camas.get(datos.get('cama_id'))
+        nuevo_estado = referencias.estado_por_id(datos.get('estado_id'))
+        if cama is None:
+            resultados.append({'cama_id': datos.get('cama_id'), 'error': 'Cama no encontrada'})
+            continue
+        if nuevo_estado is None:
+            resultados.append({'cama_id': cama.id, 'error': 'Estado no encontrado'})
+            continue
+        if not _version_vigente(cama, datos):
+            resultados.append({
+                'cama_id': cama.id, 'conflicto': True, 'version': cama.version,
+                'error': 'La cama fue modificada por otro usuario'
+            })
+            continue
+        error = _error_transicion(cama, nuevo_estado)
+        if error:
+            resultados.append({'cama_id': cama.id, 'transicion_invalida': True, 'error': error[0]})
+            continue
+
+        advertencia, cama_anterior = _aplicar_cambio_estado(cama, nuevo_estado, datos, historial, ahora)
+        if advertencia:
+            resultados.append({'cama_id': cama.id, **advertencia})
+            continue
+        resultado = {'cama_id': cama.id, 'success': True}
+        resultados.append(resultado)
+        aplicados.append((resultado, cama, cama_anterior))
+
+    modificadas = {c.id for _, cama, anterior in aplicados for c in (cama, anterior) if c}
+    if aplicados:
+        db.session.flush()
+        _insertar_historial(historial)
+        db.session.commit()
+    return resultados, aplicados, modificadas
+
+
+@bp.route('/api/camas/estado', methods=['POST'])
+def cambiar_estado_camas():
+    """Aplica varios cambios de estado en una sola transaccion.
+
+    Recibe ``{"cambios": [{"cama_id", "estado_id", "version"?, ...}, ...]}``;
+    los demas campos del cuerpo (``perfil_id``, ``comentario``...) son valores
+    por defecto de cada cambio. Las camas con error, conflicto de version o
+    advertencia de traslado se informan en su resultado y no se modifican.
+    """
+    data = request.get_json() or {}
+    cambios = data.get('cambios')
+    if not isinstance(cambios, list) or not cambios:
+        return jsonify({'error': 'cambios es requerido'}), 400
+    if len(cambios) > MAX_CAMBIOS_LOTE:
+        return jsonify({'error': f'Máximo {MAX_CAMBIOS_LOTE} cambios por lote'}), 400
+    if not all(isinstance(c, dict) for c in cambios):
+        return jsonify({'error': 'Cada cambio debe ser un objeto'}), 400
+
+    comunes = {k: v for k, v in data.items() if k != 'cambios'}
+    # Ids normalizados a int antes de consultar: el IN y la busqueda por id
+    # deben ver el mismo valor
+    normalizados = []
+    for indice, cambio in enumerate(cambios):
+        datos = {**comunes, **cambio}
+        ids = {campo: _id_entero(datos.get(campo)) for campo in ('cama_id', 'estado_id')}
+        for campo, valor in ids.items():
+            if valor is None:
+                return jsonify({'error': f'cambios[{indice}].{campo} debe ser un entero', 'indice': indice}), 400
+        normalizados.append({**cambio, **ids})
+    cambios = normalizados
+
+    for _ in range(REINTENTOS_CONFLICTO):
+        try:
+            resultados, aplicados, modificadas = _aplicar_lote(cambios, comunes)
+            break
+        except StaleDataError:
+            db.session.rollback()
+    else:
+        return jsonify({'error': 'Las camas están siendo modificadas por otro usuario', 'conflicto': True}), 409
+
+    if aplicados:
+        # Recarga en una consulta todas las camas expiradas por el commit
+        Cama.query.options(joinedload(Cama.estado), joinedload(Cama.paciente)).filter(
+            Cama.id.in_(modificadas)
+        ).all()
+
+        for resultado, cama, cama_anterior in aplicados:
+            resultado['cama'] = cama.to_dict()
+            if cama_anterior:
+                resultado['traslado'] = True
+                resultado['cama_anterior'] = cama_anterior.to_dict()
+        for cama_id in modificadas:
+            canal.publicar('cama', evento_cama(db.session.get(Cama, cama_id)))
+
+    return jsonify({
+        'success': True,
+        'aplicados': len(aplicados),
+        'resultados': resultados
+    })
+
+
+@bp.route('/api/ubicacion', methods=['POST'])
 def crear_ubicacion():
     """Crea una nueva ubicacion — requiere nivel 1"""
     if _nivel_actual() > 1:
@@ -357,7 +470,7 @@ def crear_ubicacion():
     return jsonify({'success': True, 'ubicacion': ubicacion.to_dict()})
 
 
-@app.route('/api/ubicacion/<int:ubicacion_id>', methods=['PUT'])
+@bp.route('/api/ubicacion/<int:ubicacion_id>', methods=['PUT'])
 def actualizar_ubicacion(ubicacion_id):
     """Actualiza una ubicacion — requiere nivel 1"""
     if _nivel_actual() > 1:
@@ -366,11 +479,56 @@ def actualizar_ubicacion(ubicacion_id):
     data = request.get_json()
     ubicacion.nombre = data.get('nombre', ubicacion.nombre)
     ubicacion.camas_por_fila = data.get('camas_por_fila', ubicacion.camas_por_fila)
+
+    # Mover bajo otro padre: la ruta del subarbol se reescribe al hacer flush
+    if 'padre_id' in data and data['padre_id'] != ubicacion.padre_id:
+        nuevo_padre_id = data['padre_id']
+        if nuevo_padre_id is not None:
+            Ubicacion.query.get_or_404(nuevo_padre_id)
+            if es_descendiente(ubicacion, nuevo_padre_id):
+                return jsonify({'error': 'No se puede mover una ubicacion dentro de su propio subarbol'}), 400
+        ubicacion.padre_id = nuevo_padre_id
+
     db.session.commit()
     return jsonify({'success': True, 'ubicacion': ubicacion.to_dict()})
 
 
-@app.route('/api/ubicacion/<int:ubicacion_id>', methods=['DELETE'])
+@bp.route('/api/ubicacion/<int:ubicacion_id>/resumen')
+def resumen_ubicacion(ubicacion_id):
+    """Resumen agregado de camas de todo el subarbol de una ubicacion"""
+    ubicacion = Ubicacion.query.get_or_404(ubicacion_id)
+
+    filas = db.session.query(
+        Cama.estado_id,
+        func.count(Cama.id),
+        func.count(Cama.paciente_id),
+        func.min(Cama.estado_inicio)
+    ).join(Ubicacion, Cama.ubicacion_id == Ubicacion.id).filter(
+        Cama.activo == True,
+        Ubicacion.activo == True,
+        filtro_subarbol(Cama.ubicacion_id, ubicacion)
+    ).group_by(Cama.estado_id).all()
+
+    estados = {e.id: e for e in referencias.estados(activos=False)}
+    por_estado = {}
+    for estado_id, count, con_paciente, inicio_mas_antiguo in filas:
+        estado = estados.get(estado_id)
+        por_estado[estado.nombre if estado else estado_id] = {
+            'count': count,
+            'con_paciente': con_paciente,
+            'estado_inicio_mas_antiguo': inicio_mas_antiguo.isoformat() if inicio_mas_antiguo else None
+        }
+
+    return jsonify({
+        'ubicacion': ubicacion.to_dict(),
+        'ancestros': [u.to_dict() for u in ancestros(ubicacion.id)],
+        'total_camas': sum(f[1] for f in filas),
+        'pacientes': sum(f[2] for f in filas),
+        'por_estado': por_estado
+    })
+
+
+@bp.route('/api/ubicacion/<int:ubicacion_id>', methods=['DELETE'])
 def eliminar_ubicacion(ubicacion_id):
     """Elimina (desactiva) una ubicacion"""
     ubicacion = Ubicacion.query.get_or_404(ubicacion_id)
@@ -379,18 +537,23 @@ def eliminar_ubicacion(ubicacion_id):
     return jsonify({'success': True})
 
 
-@app.route('/api/cama', methods=['POST'])
+@bp.route('/api/cama', methods=['POST'])
 def crear_cama():
     """Crea una nueva cama"""
     data = request.get_json()
 
-    estado_default = EstadoCama.query.filter_by(nombre='Disponible').first()
+    estado_id = data.get('estado_id')
+    if not estado_id:
+        estado_default = referencias.estado('Disponible')
+        if not estado_default:
+            return jsonify({'error': 'No existe el estado inicial "Disponible"; ejecute flask migrar'}), 409
+        estado_id = estado_default.id
 
     cama = Cama(
         codigo=data['codigo'],
         nombre=data.get('nombre', ''),
         ubicacion_id=data['ubicacion_id'],
-        estado_id=data.get('estado_id', estado_default.id)
+        estado_id=estado_id
     )
     db.session.add(cama)
     db.session.commit()
@@ -398,7 +561,7 @@ def crear_cama():
     return jsonify({'success': True, 'cama': cama.to_dict()})
 
 
-@app.route('/api/cama/<int:cama_id>', methods=['DELETE'])
+@bp.route('/api/cama/<int:cama_id>', methods=['DELETE'])
 def eliminar_cama(cama_id):
     """Elimina (desactiva) una cama"""
     cama = Cama.query.get_or_404(cama_id)
@@ -407,15 +570,32 @@ def eliminar_cama(cama_id):
     return jsonify({'success': True})
 
 
-@app.route('/api/estadisticas')
+@bp.route('/api/estadisticas')
 def estadisticas():
-    """Obtiene estadisticas generales"""
-    total_camas = Cama.query.filter_by(activo=True).count()
-    estados = EstadoCama.query.filter_by(activo=True).order_by(EstadoCama.orden).all()
+    """Obtiene estadisticas generales o de un subarbol (?ubicacion_id=)"""
+    ubicacion_id = request.args.get('ubicacion_id', type=int)
+    ubicacion = Ubicacion.query.get_or_404(ubicacion_id) if ubicacion_id else None
+
+    estados = referencias.estados()
+
+    # Un solo agregado agrupado por ubicacion y estado
+    consulta = db.session.query(
+        Cama.ubicacion_id, Cama.estado_id, func.count(Cama.id)
+    ).filter(Cama.activo == True)
+    if ubicacion:
+        consulta = consulta.filter(filtro_subarbol(Cama.ubicacion_id, ubicacion))
+    filas = consulta.group_by(Cama.ubicacion_id, Cama.estado_id).all()
+
+    conteo_estado = {}
+    conteo_ubicacion = {}
+    for ubic_id, estado_id, count in filas:
+        conteo_estado[estado_id] = conteo_estado.get(estado_id, 0) + count
+        conteo_ubicacion.setdefault(ubic_id, {})[estado_id] = count
+    total_camas = sum(conteo_estado.values())
 
     stats = {}
     for estado in estados:
-        count = Cama.query.filter_by(estado_id=estado.id, activo=True).count()
+        count = conteo_estado.get(estado.id, 0)
         stats[estado.nombre] = {
             'count': count,
             'color': estado.color,
@@ -424,65 +604,184 @@ def estadisticas():
             'porcentaje': round((count / total_camas * 100) if total_camas > 0 else 0, 1)
         }
 
-    return jsonify({
+    resultado = {
         'total': total_camas,
         'por_estado': stats
-    })
+    }
 
+    if ubicacion:
+        # Desglose por sector para jefaturas de piso/torre
+        resultado['ubicacion'] = ubicacion.to_dict()
+        resultado['por_ubicacion'] = {
+            ubic_id: {
+                'total': sum(conteos.values()),
+                'por_estado': {e.nombre: conteos.get(e.id, 0) for e in estados}
+            }
+            for ubic_id, conteos in conteo_ubicacion.items()
+        }
 
-@app.route('/dashboard')
+    return jsonify(resultado)
+
+
+@bp.route('/dashboard')
 def dashboard():
     """Vista del dashboard con estadísticas"""
-    perfiles = Perfil.query.filter_by(activo=True).all()
-    estados = EstadoCama.query.filter_by(activo=True).order_by(EstadoCama.orden).all()
+    perfiles = referencias.perfiles()
+    estados = referencias.estados()
     return render_template('dashboard.html', perfiles=perfiles, estados=estados)
 
 
-@app.route('/api/dashboard/registros-semana')
-def registros_por_semana():
-    """Obtiene registros históricos agrupados por semana y perfil"""
-    perfiles = Perfil.query.filter_by(activo=True).all()
+def _marca_resumen(desde=None, hasta=None):
+    """Marca del resumen diario si sirve para el rango pedido; si no, None.
 
-    # Obtener las últimas 6 semanas
-    hoy = datetime.utcnow()
-    semanas = []
+    No lo actualiza (eso lo hace resumen.py fuera del request): quien lo lee
+    suma el historial crudo con id mayor a la marca. Si la marca quedo mas
+    de ``RESUMEN_MAX_PENDIENTES`` filas atras se usa solo el historial crudo.
+    """
+    if not current_app.config.get('RESUMEN_HISTORIAL'):
+        return None
+    if not (resumen.alineado_a_dia(desde) and resumen.alineado_a_dia(hasta)):
+        return None
+    marca, pendientes = resumen.pendientes()
+    if marca is None or pendientes > current_app.config['RESUMEN_MAX_PENDIENTES']:
+        return None
+    return marca
 
-    for i in range(5, -1, -1):
-        inicio_semana = hoy - timedelta(weeks=i, days=hoy.weekday())
-        inicio_semana = inicio_semana.replace(hour=0, minute=0, second=0, microsecond=0)
-        fin_semana = inicio_semana + timedelta(days=6, hours=23, minutes=59, seconds=59)
 
-        semana_data = {
-            'semana': inicio_semana.strftime('%d/%m/%Y'),
-            'perfiles': {}
-        }
+def _historial_posterior(marca):
+    """``HistorialCama`` restringido a las filas con id mayor a la marca del resumen.
+
+    La CTE materializada obliga a leer primero el rango de la clave primaria;
+    con filtros de fecha o perfil el planificador elegiria esos indices y
+    recorreria todo el rango de fechas para contar unas pocas filas.
+    """
+    cola = db.select(HistorialCama).where(HistorialCama.id > marca).cte('historial_posterior')
+    return aliased(HistorialCama, cola.prefix_with('MATERIALIZED'))
+
+
+def _bucket_fecha(columna, granularidad):
+    """Expresion SQL que trunca una fecha al dia o al lunes de su semana ISO."""
+    if db.engine.dialect.name == 'postgresql':
+        return func.date(func.date_trunc('week' if granularidad == 'semana' else 'day', columna))
+    if granularidad == 'semana':
+        # 'weekday 0' avanza al domingo (o lo mantiene); -6 dias = lunes ISO
+        return func.date(columna, 'weekday 0', '-6 days')
+    return func.date(columna)
+
+
+MAX_BUCKETS_REGISTROS = 400
 
-        for perfil in perfiles:
-            count = HistorialCama.query.filter(
-                HistorialCama.perfil_id == perfil.id,
-                HistorialCama.created_at >= inicio_semana,
-                HistorialCama.created_at <= fin_semana
-            ).count()
-            semana_data['perfiles'][perfil.nombre] = count
 
-        semanas.append(semana_data)
+@bp.route('/api/dashboard/registros-semana')
+def registros_por_semana():
+    """Obtiene registros históricos agrupados por semana (o dia) y perfil.
+
+    Parametros: ?semanas= (por defecto 6), ?desde=&hasta= (reemplazan el
+    rango por semanas) y ?granularidad=semana|dia. Todo sale de una sola
+    consulta agrupada, sin importar el rango ni la cantidad de perfiles.
+    """
+    granularidad = request.args.get('granularidad', 'semana')
+    if granularidad not in ('semana', 'dia'):
+        return jsonify({'error': 'granularidad debe ser semana o dia'}), 400
+    try:
+        desde, hasta = _rango_fechas()
+    except ValueError:
+        return jsonify({'error': 'Fecha invalida, use formato ISO (YYYY-MM-DD)'}), 400
+
+    hoy = datetime.utcnow()
+    if not desde:
+        num_semanas = max(1, request.args.get('semanas', 6, type=int))
+        desde = hoy - timedelta(weeks=num_semanas - 1, days=hoy.weekday())
+    desde = desde.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularidad == 'semana':
+        desde -= timedelta(days=desde.weekday())
+    fin = hasta or hoy
+
+    # Todos los buckets del rango, incluso los sin registros
+    paso = timedelta(weeks=1) if granularidad == 'semana' else timedelta(days=1)
+    buckets = []
+    inicio = desde
+    while inicio < fin:
+        buckets.append(inicio.date())
+        inicio += paso
+        if len(buckets) > MAX_BUCKETS_REGISTROS:
+            return jsonify({'error': f'El rango supera {MAX_BUCKETS_REGISTROS} periodos'}), 400
+
+    perfiles = referencias.perfiles()
+    nombres_perfil = {p.id: p.nombre for p in perfiles}
+
+    # (fecha, perfil, conteo, desde, hasta) de cada fuente
+    marca = _marca_resumen(desde, hasta)
+    if marca is None:
+        fuentes = [(HistorialCama.created_at, HistorialCama.perfil_id, func.count(HistorialCama.id), desde, hasta)]
+    else:
+        # Dias resumidos mas el historial que aun no entra al resumen
+        posterior = _historial_posterior(marca)
+        fuentes = [
+            (ResumenPerfil.dia, ResumenPerfil.perfil_id, func.sum(ResumenPerfil.entradas),
+             desde.date(), hasta.date() if hasta else None),
+            (posterior.created_at, posterior.perfil_id, func.count(posterior.id), desde, hasta),
+        ]
+
+    conteos = {}
+    for fecha, perfil, conteo, inicio, fin_rango in fuentes:
+        bucket = _bucket_fecha(fecha, granularidad)
+        consulta = db.session.query(bucket, perfil, conteo).filter(
+            fecha >= inicio,
+            perfil.in_(list(nombres_perfil))
+        )
+        if fin_rango:
+            consulta = consulta.filter(fecha < fin_rango)
+        for dia, perfil_id, count in consulta.group_by(bucket, perfil):
+            clave = (str(dia)[:10], perfil_id)
+            conteos[clave] = conteos.get(clave, 0) + count
+
+    semanas = []
+    for dia in buckets:
+        clave = dia.isoformat()
+        semanas.append({
+            'semana': dia.strftime('%d/%m/%Y'),
+            'perfiles': {nombre: conteos.get((clave, perfil_id), 0) for perfil_id, nombre in nombres_perfil.items()}
+        })
 
     return jsonify({
+        'granularidad': granularidad,
         'semanas': semanas,
         'perfiles': [{'nombre': p.nombre, 'color': p.color} for p in perfiles]
     })
 
 
-@app.route('/api/dashboard/tiempos-por-estado')
+@bp.route('/api/dashboard/tiempos-por-estado')
 def tiempos_por_estado():
     """Obtiene las camas agrupadas por estado con tiempo transcurrido"""
     # Estados que queremos mostrar con tiempos
-    estados_tiempo = ['Esperando Transporte', 'Esperando Limpieza', 'En Limpieza']
+    estados_tiempo = ['Esperando Traslado', 'Esperando Higiene', 'Higiene Realizado']
 
     resultado = {}
 
+    # Permanencia promedio historica por estado (episodios cerrados en los
+    # ultimos 30 dias). Desde el resumen, donde los episodios posteriores a
+    # la marca no alteran el promedio; sin resumen, del historial crudo
+    desde = datetime.combine(datetime.utcnow().date() - timedelta(days=30), datetime.min.time())
+    if _marca_resumen(desde) is not None:
+        promedios = {
+            estado_id: segundos / salidas
+            for estado_id, segundos, salidas in db.session.query(
+                ResumenEstado.estado_id,
+                func.sum(ResumenEstado.segundos_en_estado),
+                func.sum(ResumenEstado.salidas)
+            ).filter(ResumenEstado.dia >= desde.date()).group_by(ResumenEstado.estado_id)
+            if salidas
+        }
+    else:
+        ids = {e.id for e in map(referencias.estado, estados_tiempo) if e}
+        promedios = {
+            fila['estado_id']: fila['promedio_segundos']
+            for fila in duraciones.calcular(desde, estados=ids, cuantiles=())
+        }
+
     for estado_nombre in estados_tiempo:
-        estado = EstadoCama.query.filter_by(nombre=estado_nombre).first()
+        estado = referencias.estado(estado_nombre)
         if estado:
             camas = Cama.query.filter_by(estado_id=estado.id, activo=True).all()
             camas_data = []
@@ -498,27 +797,112 @@ def tiempos_por_estado():
             camas_data.sort(key=lambda x: x['tiempo_segundos'], reverse=True)
             resultado[estado_nombre] = {
                 'color': estado.color,
-                'camas': camas_data
+                'camas': camas_data,
+                'promedio_historico_segundos': int(promedios[estado.id]) if estado.id in promedios else None
             }
 
     return jsonify(resultado)
 
 
-@app.route('/api/perfiles')
+@bp.route('/api/dashboard/duraciones')
+def dashboard_duraciones():
+    """Percentiles p50/p90/p99 de permanencia por estado desde el historial.
+
+    Parametros: ?desde=&hasta=, ?ubicacion_id= (subarbol), ?estados=1,5
+    (ids) y ?agrupar=sector,semana|dia. Sin ``desde`` cubre los ultimos 7
+    dias; cualquier rango se recorre en streaming con memoria acotada.
+    """
+    try:
+        desde, hasta = _rango_fechas()
+        estados_ids = {int(e) for e in request.args.get('estados', '').split(',') if e}
+    except ValueError:
+        return jsonify({'error': 'Parametros invalidos: fechas ISO y estados como ids separados por coma'}), 400
+    desde = desde or (hasta or datetime.utcnow()) - duraciones.VENTANA_POR_DEFECTO
+    agrupar = {a for a in request.args.get('agrupar', '').split(',') if a}
+    if not agrupar <= {'sector', 'semana', 'dia'} or {'semana', 'dia'} <= agrupar:
+        return jsonify({'error': 'agrupar acepta sector y una ventana: semana o dia'}), 400
+
+    filtros = []
+    ubicacion_id = request.args.get('ubicacion_id', type=int)
+    if ubicacion_id:
+        filtros.append(filtro_subarbol(Cama.ubicacion_id, Ubicacion.query.get_or_404(ubicacion_id)))
+
+    filas = duraciones.calcular(desde, hasta, filtros, agrupar, estados_ids)
+
+    estados = {e.id: e for e in referencias.estados(activos=False)}
+    for fila in filas:
+        estado = estados.get(fila['estado_id'])
+        fila['estado'] = estado.nombre if estado else None
+
+    return jsonify({
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat() if hasta else None,
+        'agrupar': sorted(agrupar),
+        'duraciones': filas
+    })
+
+
+@bp.route('/api/perfiles')
 def get_perfiles():
     """Obtiene todos los perfiles activos"""
-    perfiles = Perfil.query.filter_by(activo=True).all()
+    perfiles = referencias.perfiles()
     return jsonify([p.to_dict() for p in perfiles])
 
 
-@app.route('/api/pacientes')
+@bp.route('/api/estados/transiciones')
+def get_transiciones_estados():
+    """Mapa de transiciones permitidas (origen -> destino -> nivel) y nivel de la sesion"""
+    return jsonify({**maquina_estados.mapa().to_dict(), 'nivel_acceso': _nivel_actual()})
+
+
+@bp.route('/api/alertas')
+def get_alertas():
+    """Alertas de SLA, mas recientes primero.
+
+    ``?todas=1`` incluye las resueltas; ``?ubicacion_id=`` filtra el subarbol.
+    """
+    limite = min(max(request.args.get('limite', 100, type=int), 1), 500)
+    consulta = db.session.query(AlertaSla, Cama.codigo).join(Cama, Cama.id == AlertaSla.cama_id)
+    if not request.args.get('todas', type=int):
+        consulta = consulta.filter(AlertaSla.resuelta_en.is_(None))
+    ubicacion_id = request.args.get('ubicacion_id', type=int)
+    if ubicacion_id:
+        consulta = consulta.filter(filtro_subarbol(AlertaSla.ubicacion_id, Ubicacion.query.get_or_404(ubicacion_id)))
+
+    alertas = []
+    for alerta, codigo in consulta.order_by(AlertaSla.detectada_en.desc(), AlertaSla.id.desc()).limit(limite):
+        estado = referencias.estado_por_id(alerta.estado_id)
+        alertas.append({**alerta.to_dict(), 'cama': codigo, 'estado': estado.nombre if estado else None})
+    return serializacion.respuesta_json({'alertas': alertas})
+
+
+@bp.route('/api/cache/referencias')
+def stats_cache_referencias():
+    """Contadores hit/miss del cache de estados y perfiles"""
+    return jsonify(referencias.stats())
+
+
+@bp.route('/metrics')
+def metricas_prometheus():
+    """Latencia, sentencias SQL y tiempo en SQL por endpoint (formato Prometheus)"""
+    return Response(instrumentacion.metricas.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/api/pacientes')
 def get_pacientes():
     """Obtiene todos los pacientes activos"""
-    pacientes = Paciente.query.filter_by(activo=True).all()
-    return jsonify([p.to_dict() for p in pacientes])
+    return serializacion.respuesta_json(serializacion.pacientes())
+
+
+@bp.route('/api/pacientes/buscar')
+def buscar_pacientes():
+    """Busqueda type-ahead por nombre o RUT: ?q=&limite="""
+    q = request.args.get('q', '').strip()
+    limite = min(max(request.args.get('limite', busqueda.LIMITE_POR_DEFECTO, type=int), 1), busqueda.LIMITE_MAXIMO)
+    return serializacion.respuesta_json(busqueda.buscar(q, limite))
 
 
-@app.route('/api/paciente', methods=['POST'])
+@bp.route('/api/paciente', methods=['POST'])
 def crear_paciente():
     """Crea un nuevo paciente"""
     data = request.get_json()
@@ -531,7 +915,7 @@ def crear_paciente():
 
     # Verificar si el paciente ya existe por RUT
     if rut:
-        paciente_existente = Paciente.query.filter_by(rut=rut).first()
+        paciente_existente = busqueda.por_rut(rut)
         if paciente_existente:
             return jsonify({'success': True, 'paciente': paciente_existente.to_dict(), 'existente': True})
 
@@ -545,34 +929,86 @@ def crear_paciente():
 # ─────────────────────────────────────────────────────────────────
 # #16 — Dashboard KPIs
 # ─────────────────────────────────────────────────────────────────
-@app.route('/api/dashboard/kpis')
+def _rango_fechas():
+    """Lee ?desde=&hasta= (ISO) del query string.
+
+    Una fecha sin hora en ``hasta`` incluye el dia completo. Retorna
+    ``(desde, hasta_exclusivo)``; lanza ValueError si el formato es invalido.
+    """
+    desde = request.args.get('desde')
+    hasta = request.args.get('hasta')
+    desde = datetime.fromisoformat(desde) if desde else None
+    if hasta:
+        hasta_dt = datetime.fromisoformat(hasta)
+        hasta = hasta_dt + timedelta(days=1) if len(hasta) == 10 else hasta_dt
+    return desde, hasta or None
+
+
+def _filtros_historial(historial, desde, hasta, ubicacion):
+    """Filtros de rango y subarbol sobre ``historial`` (la tabla, un alias o ``AltaCama``)."""
+    filtros = []
+    if desde:
+        filtros.append(historial.created_at >= desde)
+    if hasta:
+        filtros.append(historial.created_at < hasta)
+    if ubicacion:
+        filtros.append(historial.cama_id.in_(
+            db.select(Cama.id).where(filtro_subarbol(Cama.ubicacion_id, ubicacion))
+        ))
+    return filtros
+
+
+@bp.route('/api/dashboard/kpis')
 def dashboard_kpis():
-    """KPIs calculados desde el historial de movimientos de estados."""
-    total = HistorialCama.query.count()
+    """KPIs calculados desde el historial de movimientos de estados.
 
-    estado_alta = EstadoCama.query.filter_by(nombre='Alta Medica').first()
-    estado_disp = EstadoCama.query.filter_by(nombre='Disponible').first()
-    estado_lib  = EstadoCama.query.filter_by(nombre='Proceso de Liberacion').first()
+    Acepta ?desde=&hasta= y ?ubicacion_id= (subarbol) como filtros.
+    """
+    try:
+        desde, hasta = _rango_fechas()
+    except ValueError:
+        return jsonify({'error': 'Fecha invalida, use formato ISO (YYYY-MM-DD)'}), 400
+    ubicacion_id = request.args.get('ubicacion_id', type=int)
+    ubicacion = Ubicacion.query.get_or_404(ubicacion_id) if ubicacion_id else None
+
+    estado_alta = referencias.estado('Alta Medica')
 
     # Altas gestionadas = registros cuyo estado_nuevo es Alta Medica
-    gestionadas = HistorialCama.query.filter_by(
-        estado_nuevo_id=estado_alta.id if estado_alta else -1
-    ).count() if estado_alta else 0
-
-    # Cierre exitoso = camas que pasaron por Alta Medica Y luego llegaron a Disponible o Proceso de Liberacion
-    ids_cierre = set()
-    if estado_alta and (estado_disp or estado_lib):
-        ids_destino = [e.id for e in [estado_disp, estado_lib] if e]
-        altas = HistorialCama.query.filter_by(estado_nuevo_id=estado_alta.id).all()
-        for h in altas:
-            posterior = HistorialCama.query.filter(
-                HistorialCama.cama_id == h.cama_id,
-                HistorialCama.estado_nuevo_id.in_(ids_destino),
-                HistorialCama.created_at > h.created_at
-            ).first()
-            if posterior:
-                ids_cierre.add(h.cama_id)
-    cierre_exitoso = len(ids_cierre)
+    alta_id = estado_alta.id if estado_alta else -1
+    marca = _marca_resumen(desde, hasta)
+    crudo = HistorialCama
+    total = gestionadas = 0
+    if marca is not None:
+        # Dias resumidos (por sector solo si se filtra por ubicacion) mas el
+        # historial que aun no entra al resumen
+        tabla = ResumenUbicacion if ubicacion else ResumenEstado
+        filtros_resumen = []
+        if desde:
+            filtros_resumen.append(tabla.dia >= desde.date())
+        if hasta:
+            filtros_resumen.append(tabla.dia < hasta.date())
+        if ubicacion:
+            filtros_resumen.append(filtro_subarbol(tabla.ubicacion_id, ubicacion))
+        total, gestionadas = db.session.query(
+            func.coalesce(func.sum(tabla.entradas), 0),
+            func.coalesce(func.sum(case((tabla.estado_id == alta_id, tabla.entradas), else_=0)), 0)
+        ).filter(*filtros_resumen).one()
+        crudo = _historial_posterior(marca)
+    total_crudo, gestionadas_crudo = db.session.query(
+        func.count(crudo.id),
+        func.count(case((crudo.estado_nuevo_id == alta_id, 1)))
+    ).filter(*_filtros_historial(crudo, desde, hasta, ubicacion)).one()
+    total += total_crudo
+    gestionadas += gestionadas_crudo
+
+    # Cierre exitoso = camas que pasaron por Alta Medica Y luego llegaron a
+    # Disponible o Proceso de Liberacion (episodios de alta, ver altas.py).
+    # count(*) sobre SELECT DISTINCT: SQLite recorre el indice ya ordenado por
+    # cama, mientras que count(DISTINCT) arma un arbol temporal
+    camas_cerradas = db.select(AltaCama.cama_id).where(
+        AltaCama.cerrada_en.isnot(None), *_filtros_historial(AltaCama, desde, hasta, ubicacion)
+    ).distinct().subquery()
+    cierre_exitoso = db.session.query(func.count()).select_from(camas_cerradas).scalar()
 
     pct_gestionadas = round((gestionadas / total * 100) if total > 0 else 0, 1)
     pct_cierre      = round((cierre_exitoso / gestionadas * 100) if gestionadas > 0 else 0, 1)
@@ -588,6 +1024,108 @@ def dashboard_kpis():
     })
 
 
+# ─────────────────────────────────────────────────────────────────
+# Exportación del historial de movimientos (auditoría)
+# ─────────────────────────────────────────────────────────────────
+TAMANO_EXPORT = 1000
+
+COLUMNAS_EXPORT = [
+    'id', 'created_at', 'cama_id', 'cama', 'ubicacion_id', 'ubicacion',
+    'estado_anterior_id', 'estado_anterior', 'estado_nuevo_id', 'estado_nuevo',
+    'perfil_id', 'perfil', 'paciente_id', 'paciente', 'paciente_rut', 'usuario', 'comentario',
+]
+
+
+def _consulta_export(desde, hasta, ubicacion, perfil_id, estados_ids):
+    """SELECT plano del historial con los nombres resueltos por JOIN."""
+    anterior = aliased(EstadoCama)
+    nuevo = aliased(EstadoCama)
+    consulta = db.select(
+        HistorialCama.id, HistorialCama.created_at, HistorialCama.cama_id, Cama.codigo,
+        Cama.ubicacion_id, Ubicacion.nombre,
+        HistorialCama.estado_anterior_id, anterior.nombre, HistorialCama.estado_nuevo_id, nuevo.nombre,
+        HistorialCama.perfil_id, Perfil.nombre, HistorialCama.paciente_id, Paciente.nombre, Paciente.rut,
+        HistorialCama.usuario, HistorialCama.comentario
+    ).join(Cama, Cama.id == HistorialCama.cama_id) \
+        .join(Ubicacion, Ubicacion.id == Cama.ubicacion_id) \
+        .outerjoin(anterior, anterior.id == HistorialCama.estado_anterior_id) \
+        .outerjoin(nuevo, nuevo.id == HistorialCama.estado_nuevo_id) \
+        .outerjoin(Perfil, Perfil.id == HistorialCama.perfil_id) \
+        .outerjoin(Paciente, Paciente.id == HistorialCama.paciente_id)
+    if desde:
+        consulta = consulta.where(HistorialCama.created_at >= desde)
+    if hasta:
+        consulta = consulta.where(HistorialCama.created_at < hasta)
+    if ubicacion:
+        consulta = consulta.where(filtro_subarbol(Cama.ubicacion_id, ubicacion))
+    if perfil_id:
+        consulta = consulta.where(HistorialCama.perfil_id == perfil_id)
+    if estados_ids:
+        consulta = consulta.where(HistorialCama.estado_nuevo_id.in_(estados_ids))
+    # yield_per: cursor del lado del servidor en PostgreSQL, fetch incremental en SQLite
+    return consulta.order_by(HistorialCama.id).execution_options(yield_per=TAMANO_EXPORT)
+
+
+def _lineas_csv(filas):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # BOM para que Excel abra el UTF-8 con tildes correctamente
+    buf.write('\ufeff')
+    writer.writerow(COLUMNAS_EXPORT)
+    yield buf.getvalue()
+    for particion in filas.partitions():
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(
+            (f[0], f[1].isoformat() if f[1] else '', *f[2:]) for f in particion
+        )
+        yield buf.getvalue()
+
+
+def _lineas_ndjson(filas):
+    for particion in filas.partitions():
+        yield b''.join(serializacion.dumps(dict(zip(COLUMNAS_EXPORT, f))) + b'\n' for f in particion)
+
+
+@bp.route('/api/historial/export')
+def exportar_historial():
+    """Descarga el historial de movimientos en CSV o NDJSON (streaming).
+
+    Filtros: ``desde``/``hasta`` (ISO), ``ubicacion_id`` (subarbol),
+    ``perfil_id`` y ``estados`` (ids de estado nuevo separados por coma).
+    """
+    formato = request.args.get('formato', 'csv')
+    if formato not in ('csv', 'ndjson'):
+        return jsonify({'error': 'formato debe ser csv o ndjson'}), 400
+    try:
+        desde, hasta = _rango_fechas()
+        estados_ids = {int(e) for e in request.args.get('estados', '').split(',') if e}
+    except ValueError:
+        return jsonify({'error': 'Parametros invalidos: fechas ISO y estados como ids separados por coma'}), 400
+    ubicacion_id = request.args.get('ubicacion_id', type=int)
+    ubicacion = Ubicacion.query.get_or_404(ubicacion_id) if ubicacion_id else None
+    perfil_id = request.args.get('perfil_id', type=int)
+
+    consulta = _consulta_export(desde, hasta, ubicacion, perfil_id, estados_ids)
+
+    def generar():
+        filas = db.session.execute(consulta)
+        try:
+            yield from (_lineas_csv(filas) if formato == 'csv' else _lineas_ndjson(filas))
+        finally:
+            filas.close()
+
+    nombre = f"historial_{datetime.utcnow():%Y%m%d_%H%M}.{formato}"
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/csv' if formato == 'csv' else 'application/x-ndjson',
+        headers={
+            'Content-Disposition': f'attachment; filename="{nombre}"',
+            'X-Accel-Buffering': 'no',
+        }
+    )
+
+
 # ─────────────────────────────────────────────────────────────────
 # #17 — QR: generar imagen y confirmar hito
 # ─────────────────────────────────────────────────────────────────
@@ -604,20 +1142,67 @@ QR_ACCIONES = {
     },
 }
 
-@app.route('/qr/img/<int:cama_id>/<accion>')
+QR_MAX_AGE = 24 * 3600
+QR_MAX_ETIQUETAS = 400  # 20 paginas A4
+
+
+def _url_confirmacion(cama_id, accion):
+    return request.host_url.rstrip('/') + f'/qr/confirmar/{cama_id}/{accion}'
+
+
+@bp.route('/qr/img/<int:cama_id>/<accion>')
 def qr_imagen(cama_id, accion):
-    """Genera y devuelve el QR como imagen PNG."""
+    """Devuelve el QR como imagen PNG (cacheada, con ETag)."""
     if accion not in QR_ACCIONES:
         return 'Acción inválida', 400
-    url = request.host_url.rstrip('/') + f'/qr/confirmar/{cama_id}/{accion}'
-    img = qrcode.make(url)
-    buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
+    png, etag = qr.cache.obtener(_url_confirmacion(cama_id, accion))
+    # send_file responde 304 si el navegador ya tiene este ETag
+    return send_file(io.BytesIO(png), mimetype='image/png', etag=etag, max_age=QR_MAX_AGE)
+
+
+@bp.route('/qr/hoja/<int:ubicacion_id>')
+def qr_hoja(ubicacion_id):
+    """Hoja imprimible con todos los QR de las camas de una torre, piso o sector.
+
+    ``formato=pdf`` (por defecto) entrega todas las paginas; ``formato=png``
+    entrega la pagina ``pagina`` (desde 1).
+    """
+    ubicacion = Ubicacion.query.get_or_404(ubicacion_id)
+    formato = request.args.get('formato', 'pdf')
+    if formato not in ('pdf', 'png'):
+        return jsonify({'error': 'formato debe ser pdf o png'}), 400
+
+    camas = Cama.query.join(Ubicacion, Ubicacion.id == Cama.ubicacion_id).filter(
+        Cama.activo == True, filtro_subarbol(Cama.ubicacion_id, ubicacion)
+    ).order_by(Ubicacion.ruta, Cama.orden, Cama.id).all()
+    etiquetas = [
+        (_url_confirmacion(cama.id, accion), cama.codigo, info['label'])
+        for cama in camas
+        for accion, info in QR_ACCIONES.items()
+    ]
+    if not etiquetas:
+        return jsonify({'error': 'La ubicación no tiene camas activas'}), 404
+    if len(etiquetas) > QR_MAX_ETIQUETAS:
+        return jsonify({'error': f'Máximo {QR_MAX_ETIQUETAS} códigos por hoja; elija un piso o sector'}), 400
+
+    total = qr.total_paginas(etiquetas)
+    pagina = None
+    if formato == 'png':
+        pagina = request.args.get('pagina', 1, type=int)
+        if not 1 <= pagina <= total:
+            return jsonify({'error': f'pagina debe estar entre 1 y {total}'}), 400
+
+    datos = qr.exportar(qr.componer_hoja(ubicacion.nombre, etiquetas, pagina), formato)
+    respuesta = send_file(
+        io.BytesIO(datos),
+        mimetype='application/pdf' if formato == 'pdf' else 'image/png',
+        download_name=f'qr_{ubicacion.nombre}.{formato}'.replace(' ', '_')
+    )
+    respuesta.headers['X-Total-Paginas'] = str(total)
+    return respuesta
 
 
-@app.route('/qr/confirmar/<int:cama_id>/<accion>', methods=['GET', 'POST'])
+@bp.route('/qr/confirmar/<int:cama_id>/<accion>', methods=['GET', 'POST'])
 def qr_confirmar(cama_id, accion):
     """Página mobile de confirmación de hito (GET) y acción (POST)."""
     if accion not in QR_ACCIONES:
@@ -626,25 +1211,72 @@ def qr_confirmar(cama_id, accion):
     info = QR_ACCIONES[accion]
 
     if request.method == 'POST':
-        estado_dest = EstadoCama.query.filter_by(nombre=info['estado_destino']).first()
+        estado_dest = referencias.estado(info['estado_destino'])
         if not estado_dest:
             return render_template('qr_confirm.html', cama=cama, info=info, error='Estado destino no encontrado', accion=accion)
-        estado_anterior_id = cama.estado_id
-        cama.estado_id    = estado_dest.id
-        cama.estado_inicio = datetime.utcnow()
-        historial = HistorialCama(
-            cama_id            = cama.id,
-            estado_anterior_id = estado_anterior_id,
-            estado_nuevo_id    = estado_dest.id,
-            comentario         = f'Confirmado via QR: {info["label"]}',
-        )
-        db.session.add(historial)
-        db.session.commit()
-        return render_template('qr_confirm.html', cama=cama, info=info, success=True, accion=accion)
+        for _ in range(REINTENTOS_CONFLICTO):
+            if not _version_vigente(cama, request.form):
+                # La cama cambio desde que se abrio la pagina: se muestra su estado actual
+                error = f'La cama cambió a "{cama.estado.nombre}" mientras confirmaba. Revise antes de continuar.'
+                return render_template('qr_confirm.html', cama=cama, info=info, error=error, accion=accion), 409
+            error = _error_transicion(cama, estado_dest)
+            if error:
+                mensaje, status = error
+                return render_template('qr_confirm.html', cama=cama, info=info, error=mensaje, accion=accion), status
+            ahora = datetime.utcnow()
+            # Por _insertar_historial, como los demas cambios, para que
+            # altas_camas vea la transicion
+            historial = dict(
+                cama_id            = cama.id,
+                estado_anterior_id = cama.estado_id,
+                estado_nuevo_id    = estado_dest.id,
+                paciente_id        = cama.paciente_id,
+                comentario         = f'Confirmado via QR: {info["label"]}',
+                created_at         = ahora,
+            )
+            cama.estado_id    = estado_dest.id
+            cama.estado_inicio = ahora
+            try:
+                db.session.flush()
+            except StaleDataError:
+                db.session.rollback()
+                cama = Cama.query.get_or_404(cama_id)
+                continue
+            _insertar_historial([historial])
+            db.session.commit()
+            canal.publicar('cama', evento_cama(cama))
+            return render_template('qr_confirm.html', cama=cama, info=info, success=True, accion=accion)
+        return render_template('qr_confirm.html', cama=cama, info=info, error='La cama está siendo modificada, intente nuevamente', accion=accion), 409
 
     return render_template('qr_confirm.html', cama=cama, info=info, success=False, accion=accion)
 
 
+# ─────────────────────────────────────────────────────────────────
+# Eventos en vivo (SSE) — reemplaza recargas y polling
+# ─────────────────────────────────────────────────────────────────
+@bp.route('/api/eventos')
+def stream_eventos():
+    """Stream text/event-stream con los cambios de estado de camas.
+
+    Cada stream ocupa un hilo del worker mientras esta abierto. Sobre
+    ``SSE_MAX_CLIENTES`` responde 503 y el navegador pasa a polling
+    (main.js); cada stream se cierra a los ``SSE_MAX_SEGUNDOS`` para que los
+    cupos roten.
+    """
+    cola = canal.suscribir_stream(current_app.config['SSE_MAX_CLIENTES'])
+    if cola is None:
+        return jsonify({'error': 'Sin cupo para mas streams; use /api/camas/cambios', 'polling': True}), \
+            503, {'Retry-After': '60'}
+    respuesta = Response(
+        canal.stream(cola, duracion=current_app.config['SSE_MAX_SEGUNDOS']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Libera el cupo aunque el generador nunca llegue a iterarse
+    respuesta.call_on_close(lambda: canal.desuscribir(cola))
+    return respuesta
+
+
 # ─────────────────────────────────────────────────────────────────
 # #18 — RBAC: sesión de perfil demo + protección de endpoints
 # ─────────────────────────────────────────────────────────────────
@@ -652,35 +1284,123 @@ def _nivel_actual():
     """Retorna el nivel_acceso del perfil activo en sesión (1 por defecto)."""
     perfil_id = session.get('perfil_id')
     if perfil_id:
-        p = Perfil.query.get(perfil_id)
+        p = referencias.perfil_por_id(perfil_id)
         if p:
             return p.nivel_acceso
     return 1  # Administrador por defecto
 
 
-@app.route('/api/session/perfil', methods=['POST'])
+@bp.route('/api/session/perfil', methods=['POST'])
 def set_perfil_sesion():
     """Cambia el perfil activo en sesión (demo RBAC)."""
     data = request.get_json()
     perfil_id = data.get('perfil_id')
-    perfil = Perfil.query.get_or_404(perfil_id)
+    perfil = referencias.perfil_por_id(perfil_id) or abort(404)
     session['perfil_id'] = perfil.id
     return jsonify({'ok': True, 'perfil': perfil.to_dict()})
 
 
-@app.route('/ubicaciones')
+@bp.route('/ubicaciones')
 def ubicaciones():
     torres = Ubicacion.query.filter_by(tipo='torre', activo=True).all()
-    perfiles = Perfil.query.filter_by(activo=True).all()
+    perfiles = referencias.perfiles()
     nivel = _nivel_actual()
     perfil_activo_id = session.get('perfil_id', perfiles[0].id if perfiles else None)
     return render_template('ubicaciones.html', torres=torres, perfiles=perfiles,
                            nivel_acceso=nivel, perfil_activo_id=perfil_activo_id)
 
 
-with app.app_context():
-    db.create_all()
-    init_datos_dummy()
+@bp.cli.command('migrar')
+def migrar_comando():
+    """Aplica las migraciones de esquema pendientes."""
+    aplicadas = migrar()
+    print(f'Migraciones aplicadas: {aplicadas}' if aplicadas else 'Esquema al dia')
+
+
+@bp.cli.command('seed-demo')
+@click.option('--historial', default=semilla.HISTORIAL_POR_DEFECTO, show_default=True,
+              help='Filas aproximadas de historial para las camas nuevas')
+@click.option('--dias', default=semilla.DIAS_POR_DEFECTO, show_default=True,
+              help='Dias hacia atras que cubre el historial')
+@click.option('--semilla', 'semilla_aleatoria', type=int, help='Semilla aleatoria para datos reproducibles')
+def seed_demo_comando(historial, dias, semilla_aleatoria):
+    """Carga los datos de demostracion que falten (idempotente)."""
+    inicio = time.perf_counter()
+    resultado = semilla.sembrar(historial=historial, dias=dias, semilla=semilla_aleatoria)
+    print(f"Camas nuevas: {resultado['camas']}, historial: {resultado['historial']} filas "
+          f"({time.perf_counter() - inicio:.1f} s)")
+
+
+@bp.cli.command('alertas-sla')
+def alertas_sla_comando():
+    """Corre el programador de alertas de SLA en primer plano (sidecar)."""
+    programador = alertas_sla.Programador(current_app._get_current_object(), current_app.config['ALERTAS_SLA_INTERVALO'])
+    print(f"Programador de alertas SLA iniciado (lectura de cambios cada {programador.intervalo} s)")
+    try:
+        programador.ejecutar(escuchar_canal=False)
+    except KeyboardInterrupt:
+        print(f'Detenido; alertas emitidas: {programador.alertas_emitidas}')
+
+
+@bp.cli.command('resumen-backfill')
+def resumen_backfill_comando():
+    """Reconstruye el resumen diario desde historial_camas."""
+    print(f'Filas de historial procesadas: {resumen.backfill()}')
+
+
+@bp.cli.command('resumen-actualizar')
+@click.option('--cada', type=int, default=0, help='repetir cada N segundos (0 = una sola pasada)')
+def resumen_actualizar_comando(cada):
+    """Pone al dia el resumen diario (para cron o un sidecar con RESUMEN_ACTUALIZAR=no)."""
+    if not cada:
+        print(f'Filas de historial procesadas: {resumen.actualizar()}')
+        return
+    print(f'Actualizando el resumen cada {cada} s')
+    try:
+        resumen.ejecutar(current_app._get_current_object(), cada, threading.Event())
+    except KeyboardInterrupt:
+        pass
+
+
+@bp.cli.command('resumen-verificar')
+def resumen_verificar_comando():
+    """Compara el resumen diario contra historial_camas."""
+    resumen.actualizar()
+    diferencias = resumen.verificar()
+    for d in diferencias:
+        print(f"{d['tabla']} {d['dia']} {d['clave']} {d['campo']}: resumen={d['resumen']} historial={d['historial']}")
+    print('Resumen consistente' if not diferencias else f'{len(diferencias)} diferencias')
+
+
+def create_app(config=Config):
+    """Crea la aplicacion.
+
+    Solo configura el motor y revisa la version del esquema (una consulta);
+    ``create_all`` y las migraciones corren unicamente si la base esta
+    atrasada. Los datos demo se cargan aparte con ``flask seed-demo``.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    app.register_blueprint(bp)
+
+    with app.app_context():
+        configurar_motor(db.engine)
+        instrumentacion.instalar(app, db.engine)
+        if not esquema_al_dia():
+            migrar()
+
+    if app.config.get('RESUMEN_HISTORIAL') and app.config.get('RESUMEN_ACTUALIZAR') == 'proceso':
+        @app.before_request
+        def _iniciar_resumen():
+            resumen.iniciar_en_proceso(app)
+    if app.config.get('ALERTAS_SLA') == 'proceso':
+        # En el primer request de cada worker, despues del fork de gunicorn
+        @app.before_request
+        def _iniciar_alertas_sla():
+            alertas_sla.iniciar_en_proceso(app)
+    return app
+
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1 @@
+"""Scripts de carga y verificacion; se ejecutan a mano, no se despliegan."""
@@ -0,0 +1,113 @@
+"""Tiempo de arranque en frio: import, ``create_app()`` y primer request.
+
+Cada repeticion corre en un interprete nuevo (como un worker de gunicorn o
+un cold start de Cloud Run) y mide por separado:
+
+* ``deps``: importar Flask, SQLAlchemy y los modelos,
+* ``import``: importar ``app`` sobre lo anterior,
+* ``create_app``: configurar el motor y revisar/aplicar el esquema,
+* ``primer_request`` y ``segundo_request`` de ``--ruta``, y
+* ``proceso``: desde lanzar el interprete hasta la primera respuesta.
+
+Se mide con la base ya al dia (``--url`` o ``DATABASE_URL``) y con una base
+vacia en un directorio temporal, donde ``create_app`` crea el esquema.
+
+Uso::
+
+    python -m bench.arranque --repeticiones 5
+    python -m bench.arranque --url sqlite:///bench.db --ruta /api/estadisticas
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HIJO = '''
+import json, sys, time
+t0 = time.perf_counter()
+import flask, flask_sqlalchemy, sqlalchemy, models
+t1 = time.perf_counter()
+import app
+t2 = time.perf_counter()
+aplicacion = app.create_app()
+t3 = time.perf_counter()
+cliente = aplicacion.test_client()
+estado = cliente.get(sys.argv[1]).status_code
+t4 = time.perf_counter()
+cliente.get(sys.argv[1])
+t5 = time.perf_counter()
+print(json.dumps({
+    'deps': t1 - t0, 'import': t2 - t1, 'create_app': t3 - t2,
+    'primer_request': t4 - t3, 'segundo_request': t5 - t4, 'status': estado,
+}))
+'''
+
+MEDIDAS = ['deps', 'import', 'create_app', 'primer_request', 'segundo_request', 'proceso']
+
+
+def _medir(ruta, env):
+    inicio = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, '-c', HIJO, ruta], cwd=RAIZ, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    # La ultima linea es el JSON; antes puede haber logs de la aplicacion
+    resultado = json.loads(salida.strip().splitlines()[-1])
+    resultado['proceso'] = time.perf_counter() - inicio
+    return resultado
+
+
+def _serie(ruta, env, repeticiones, base_vacia):
+    corridas = []
+    for _ in range(repeticiones):
+        if base_vacia:
+            with tempfile.TemporaryDirectory() as carpeta:
+                corridas.append(_medir(ruta, dict(env, DATABASE_URL=f"sqlite:///{os.path.join(carpeta, 'vacia.db')}")))
+        else:
+            corridas.append(_medir(ruta, env))
+    return {
+        m: {
+            'mediana_ms': round(statistics.median(c[m] for c in corridas) * 1000, 1),
+            'max_ms': round(max(c[m] for c in corridas) * 1000, 1),
+        }
+        for m in MEDIDAS
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='base ya migrada (por defecto DATABASE_URL o la de la aplicacion)')
+    parser.add_argument('--ruta', default='/', help='ruta del primer request')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--salida', help='escribe el resultado en JSON')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    if args.url:
+        env['DATABASE_URL'] = args.url
+    _medir(args.ruta, env)  # deja la base al dia y el cache de bytecode caliente
+
+    resultado = {
+        'base al dia': _serie(args.ruta, env, args.repeticiones, base_vacia=False),
+        'base vacia': _serie(args.ruta, env, args.repeticiones, base_vacia=True),
+    }
+    for nombre, serie in resultado.items():
+        print(f'\n{nombre} ({args.repeticiones} repeticiones, {args.ruta}):')
+        for medida in MEDIDAS:
+            print(f"  {medida:<16} mediana {serie[medida]['mediana_ms']:8.1f} ms   max {serie[medida]['max_ms']:8.1f} ms")
+
+    if args.salida:
+        with open(args.salida, 'w') as f:
+            json.dump(resultado, f, indent=2)
+            f.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
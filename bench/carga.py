@@ -0,0 +1,273 @@
+"""Escenarios de carga repetibles y comparacion contra una linea base.
+
+Cada escenario reparte un numero fijo de requests entre varios hilos, cada
+uno con su cliente de pruebas de Flask y su ``random.Random`` sembrado, asi
+dos corridas sobre la misma base (``bench.datos`` con la misma semilla)
+hacen exactamente las mismas llamadas. Informa por escenario throughput,
+latencias p50/p99 y consultas SQL por request (leidas del header
+``Server-Timing`` que agrega ``instrumentacion.py``).
+
+Con ``--guardar-base`` escribe el resultado como linea base; con ``--base``
+lo compara y termina con codigo 1 si hay regresiones: p99 o throughput
+peores que la tolerancia, o mas consultas por request. Los tiempos solo son
+comparables en la misma maquina; las consultas por request, en cualquiera.
+Un escenario que supera ``--max-segundos`` se corta y reporta los requests
+que alcanzo.
+
+Uso::
+
+    python -m bench.datos --url sqlite:///bench.db
+    python -m bench.carga --url sqlite:///bench.db --guardar-base bench/base.json
+    python -m bench.carga --url sqlite:///bench.db --base bench/base.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+
+CONSULTAS_RE = re.compile(r'desc="(\d+) consultas"')
+TOLERANCIA = 0.25
+TOLERANCIA_CONSULTAS = 0.5   # promedio por request; absorbe variaciones de cache
+
+_hilo = threading.local()  # indice del trabajador y cantidad de hilos del escenario
+
+
+class CambioEstado:
+    """Escenario ``cambio_estado`` sin lecturas extra dentro de la operacion medida.
+
+    Guarda en memoria el estado y el paciente de cada cama (leidos al
+    arrancar y actualizados con cada respuesta) y elige el destino en la
+    tabla de transiciones precalculada. Las camas se reparten entre los
+    hilos, y cada paciente queda con el hilo de la cama que ocupa (los
+    libres, por turno): ningun hilo toca camas ni pacientes de otro, asi el
+    estado conocido no queda viejo y los cambios son siempre validos.
+    """
+
+    def __init__(self, camas, pacientes, ocupada, transiciones):
+        self.estado = {cama_id: estado_id for cama_id, estado_id, _ in camas}
+        self.paciente = {cama_id: paciente_id for cama_id, _, paciente_id in camas}
+        self.pacientes = pacientes
+        self.ocupada = ocupada
+        self.transiciones = transiciones
+        self._hilos = None
+        self._lock = threading.Lock()
+
+    def _repartir(self, hilos):
+        camas = sorted(self.estado)
+        dueno = {cama_id: i % hilos for i, cama_id in enumerate(camas)}
+        self._camas = [camas[i::hilos] for i in range(hilos)]
+        self._pacientes = [[] for _ in range(hilos)]
+        ubicados = {}
+        for cama_id, paciente_id in self.paciente.items():
+            if paciente_id is not None:
+                ubicados.setdefault(paciente_id, []).append(cama_id)
+        libres = 0
+        for paciente_id in self.pacientes:
+            if paciente_id not in ubicados:
+                self._pacientes[libres % hilos].append(paciente_id)
+                libres += 1
+            elif len(ubicados[paciente_id]) == 1:  # en mas de una cama: no se usa
+                self._pacientes[dueno[ubicados[paciente_id][0]]].append(paciente_id)
+        self._hilos = hilos
+
+    def __call__(self, cliente, rnd):
+        with self._lock:
+            if self._hilos != _hilo.hilos:
+                self._repartir(_hilo.hilos)
+        cama_id = rnd.choice(self._camas[_hilo.indice])
+        estado_id = rnd.choice(self.transiciones[self.estado[cama_id]])
+        datos = {'estado_id': estado_id, 'comentario': 'bench'}
+        if estado_id == self.ocupada:  # con paciente, trasladandolo si ya tiene cama
+            datos.update(paciente_id=rnd.choice(self._pacientes[_hilo.indice]), confirmar_traslado=True)
+        respuesta = cliente.post(f'/api/cama/{cama_id}/estado', json=datos)
+        cuerpo = respuesta.get_json(silent=True) or {}
+        for clave in ('cama', 'cama_anterior'):
+            if clave in cuerpo:
+                cama = cuerpo[clave]
+                self.estado[cama['id']] = cama['estado_id']
+                self.paciente[cama['id']] = cama['paciente_id']
+        return respuesta
+
+
+def _escenarios(torres, sectores, cambio_estado):
+    """``nombre -> funcion(cliente, rnd) -> response``."""
+    return {
+        'monitor': lambda c, rnd: c.get('/'),
+        'estadisticas': lambda c, rnd: c.get('/api/estadisticas'),
+        'estadisticas_torre': lambda c, rnd: c.get(f'/api/estadisticas?ubicacion_id={rnd.choice(torres)}'),
+        'camas_sector': lambda c, rnd: c.get(f'/api/ubicacion/{rnd.choice(sectores)}/camas'),
+        'dashboard_kpis': lambda c, rnd: c.get('/api/dashboard/kpis'),
+        'dashboard_semana': lambda c, rnd: c.get('/api/dashboard/registros-semana'),
+        'dashboard_tiempos': lambda c, rnd: c.get('/api/dashboard/tiempos-por-estado'),
+        'dashboard_duraciones': lambda c, rnd: c.get('/api/dashboard/duraciones'),
+        'cambio_estado': cambio_estado,
+    }
+
+
+def _percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(q * len(valores)))]
+
+
+def _correr(app, operacion, hilos, peticiones, semilla, max_segundos=None):
+    latencias, consultas, errores = [], [], []
+    lock = threading.Lock()
+    hasta = time.perf_counter() + max_segundos if max_segundos else None
+
+    def trabajador(indice, cantidad):
+        cliente = app.test_client()
+        _hilo.indice, _hilo.hilos = indice, hilos
+        rnd = random.Random(semilla * 1000 + indice)
+        propias, propias_consultas, propios_errores = [], [], []
+        for _ in range(cantidad):
+            if hasta and time.perf_counter() > hasta:
+                break
+            inicio = time.perf_counter()
+            respuesta = operacion(cliente, rnd)
+            propias.append(time.perf_counter() - inicio)
+            encontrado = CONSULTAS_RE.search(respuesta.headers.get('Server-Timing', ''))
+            if encontrado:
+                propias_consultas.append(int(encontrado.group(1)))
+            if respuesta.status_code >= 400:
+                propios_errores.append(respuesta.status_code)
+        with lock:
+            latencias.extend(propias)
+            consultas.extend(propias_consultas)
+            errores.extend(propios_errores)
+
+    por_hilo = [peticiones // hilos + (1 if i < peticiones % hilos else 0) for i in range(hilos)]
+    trabajadores = [threading.Thread(target=trabajador, args=(i, n)) for i, n in enumerate(por_hilo)]
+    inicio = time.perf_counter()
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    duracion = time.perf_counter() - inicio
+
+    return {
+        'peticiones': len(latencias),
+        'por_segundo': round(len(latencias) / duracion, 1),
+        'p50_ms': round(_percentil(latencias, 0.5) * 1000, 2),
+        'p99_ms': round(_percentil(latencias, 0.99) * 1000, 2),
+        'consultas': round(statistics.mean(consultas), 2) if consultas else None,
+        'errores': len(errores),
+    }
+
+
+def comparar(actual, base, tolerancia=TOLERANCIA):
+    """Lista de regresiones de ``actual`` respecto de ``base``."""
+    regresiones = []
+    for nombre, b in base['escenarios'].items():
+        a = actual['escenarios'].get(nombre)
+        if a is None:
+            continue
+        if a['p99_ms'] > b['p99_ms'] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p99 {b['p99_ms']} -> {a['p99_ms']} ms")
+        if a['por_segundo'] < b['por_segundo'] * (1 - tolerancia):
+            regresiones.append(f"{nombre}: throughput {b['por_segundo']} -> {a['por_segundo']}/s")
+        if a['consultas'] is not None and b['consultas'] is not None \
+                and a['consultas'] > b['consultas'] + TOLERANCIA_CONSULTAS:
+            regresiones.append(f"{nombre}: consultas/request {b['consultas']} -> {a['consultas']}")
+        if a['errores'] > b['errores']:
+            regresiones.append(f"{nombre}: errores {b['errores']} -> {a['errores']}")
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='URI de la base generada con bench.datos (por defecto DATABASE_URL)')
+    parser.add_argument('--escenarios', nargs='+', help='subconjunto de escenarios (por defecto todos)')
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--peticiones', type=int, default=200, help='requests por escenario')
+    parser.add_argument('--max-segundos', type=float, default=60,
+                        help='corta un escenario lento antes de completar sus requests')
+    parser.add_argument('--calentamiento', type=int, default=5, help='requests previos sin medir')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--base', help='JSON de linea base contra el que comparar')
+    parser.add_argument('--guardar-base', help='escribe el resultado como nueva linea base')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    args = parser.parse_args(argv)
+
+    if args.url:
+        os.environ['DATABASE_URL'] = args.url
+    # config.py lee DATABASE_URL al importarse
+    from app import create_app
+    from models import db, Cama, EstadoCama, Paciente, Ubicacion
+    import maquina_estados
+
+    app = create_app()
+    with app.app_context():
+        torres = [u.id for u in Ubicacion.query.filter_by(tipo='torre', activo=True)]
+        sectores = [u.id for u in Ubicacion.query.filter_by(tipo='sector', activo=True)]
+        camas = db.session.execute(
+            db.select(Cama.id, Cama.estado_id, Cama.paciente_id).where(Cama.activo == True)
+        ).all()
+        en_camas = {paciente_id for _, _, paciente_id in camas if paciente_id is not None}
+        libres = db.session.execute(
+            db.select(Paciente.id).where(Paciente.activo == True, Paciente.id.not_in(en_camas)).limit(5000)
+        ).scalars().all()
+        ocupada = EstadoCama.query.filter_by(nombre='Ocupada').first()
+        estados = {e.id: e.nombre for e in EstadoCama.query.filter_by(activo=True)}
+        # Destinos declarados en la maquina de estados, sin repetir el estado
+        # actual (un Administrador puede mas, pero no es el flujo normal)
+        transiciones = {
+            origen: [
+                d for d in destinos
+                if d != origen and d in estados
+                and estados[d] in maquina_estados.TRANSICIONES.get(estados.get(origen), {})
+            ]
+            for origen, destinos in maquina_estados.mapa().aristas.items()
+        }
+        datos = {
+            'camas': len(camas),
+            'ubicaciones': Ubicacion.query.count(),
+            # Redondeado: cada corrida agrega algunas filas con cambio_estado
+            'historial': round(db.session.execute(db.text('SELECT count(*) FROM historial_camas')).scalar(), -4),
+        }
+
+    cambio_estado = CambioEstado(camas, sorted(en_camas) + libres, ocupada.id, transiciones)
+    escenarios = _escenarios(torres, sectores, cambio_estado)
+    nombres = args.escenarios or list(escenarios)
+    desconocidos = set(nombres) - set(escenarios)
+    if desconocidos:
+        parser.error(f"escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+    print(f"datos: {datos['camas']} camas, {datos['ubicaciones']} ubicaciones, {datos['historial']} filas de historial")
+    print(f'{"escenario":<22}{"req/s":>9}{"p50 ms":>10}{"p99 ms":>10}{"sql/req":>9}{"errores":>9}')
+    resultado = {'datos': datos, 'hilos': args.hilos, 'peticiones': args.peticiones,
+                 'python': platform.python_version(), 'escenarios': {}}
+    for nombre in nombres:
+        _correr(app, escenarios[nombre], 1, args.calentamiento, args.semilla + 1, args.max_segundos)
+        r = _correr(app, escenarios[nombre], args.hilos, args.peticiones, args.semilla, args.max_segundos)
+        resultado['escenarios'][nombre] = r
+        print(f"{nombre:<22}{r['por_segundo']:>9}{r['p50_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['consultas'] if r['consultas'] is not None else '-':>9}{r['errores']:>9}", flush=True)
+
+    if args.guardar_base:
+        with open(args.guardar_base, 'w') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f'linea base guardada en {args.guardar_base}')
+
+    if args.base:
+        with open(args.base) as f:
+            base = json.load(f)
+        if base.get('datos') != datos:
+            print(f"aviso: la base se midio con otros datos {base.get('datos')}")
+        regresiones = comparar(resultado, base, args.tolerancia)
+        for regresion in regresiones:
+            print(f'REGRESION {regresion}')
+        if regresiones:
+            return 1
+        print('sin regresiones respecto de la linea base')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Generador de datos sinteticos del tamano de una red de hospitales.
+
+Crea desde cero (borra lo que haya) una base con torres, pisos y sectores,
+miles de camas, decenas de miles de pacientes y millones de filas de
+``historial_camas``. El historial recorre el ciclo real de una cama
+(Disponible -> Ocupada -> Alta Medica -> ... -> Disponible) con tiempos
+exponenciales por estado; las filas quedan en orden cronologico y el estado
+final de cada cama coincide con su ultima transicion; catalogos y
+transiciones son los de ``semilla.py``. Al final se reconstruyen los datos
+derivados (busqueda, resumen, secuencia de cambios). Con la misma
+``--semilla`` se obtiene la misma base.
+
+No usa ``DATABASE_URL`` para no borrar la base de la aplicacion por error.
+
+Uso::
+
+    python -m bench.datos --url sqlite:///bench.db --camas 5000 --historial 2000000
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from config import configurar_motor, opciones_motor
+from models import db, Cama, Paciente, Ubicacion
+from migraciones import MIGRACIONES, migrar
+import busqueda
+import cambios
+import catalogos
+import resumen
+import semilla
+
+URL_POR_DEFECTO = 'sqlite:///bench.db'
+# Misma carpeta instance/ que la aplicacion para que las URI relativas coincidan
+INSTANCIA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance')
+TAMANO_LOTE = 20000
+
+NOMBRES = ['Juan', 'María', 'Pedro', 'Ana', 'Carlos', 'Lucía', 'Roberto', 'Carmen', 'José', 'Sofía',
+           'Diego', 'Valentina', 'Matías', 'Camila', 'Tomás', 'Fernanda', 'Benjamín', 'Josefa']
+APELLIDOS = ['Pérez', 'González', 'Soto', 'Martínez', 'Rojas', 'Fernández', 'Silva', 'López', 'Muñoz',
+             'Díaz', 'Contreras', 'Sepúlveda', 'Morales', 'Araya', 'Fuentes', 'Núñez', 'Espinoza', 'Torres']
+SECTORES = ['UCI', 'Urgencias', 'Medicina General', 'Cardiologia', 'Cirugia', 'Traumatologia',
+            'Pediatria', 'Neonatologia', 'Maternidad', 'Ginecologia', 'Oncologia', 'Neurologia']
+
+
+def _app(url):
+    app = Flask(__name__, instance_path=INSTANCIA)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones_motor(url, 1)
+    db.init_app(app)
+    return app
+
+
+def _dv(numero):
+    suma, factor = 0, 2
+    for digito in reversed(str(numero)):
+        suma += int(digito) * factor
+        factor = factor + 1 if factor < 7 else 2
+    resto = 11 - suma % 11
+    return {11: '0', 10: 'K'}.get(resto, str(resto))
+
+
+def _rut(numero):
+    return f'{numero:,}'.replace(',', '.') + '-' + _dv(numero)
+
+
+def _ubicaciones(torres, pisos, sectores):
+    """Inserta la jerarquia con ids y rutas explicitas; retorna los ids de sectores."""
+    filas, ids_sectores = [], []
+    siguiente = 1
+    for t in range(torres):
+        torre_id, siguiente = siguiente, siguiente + 1
+        filas.append({'id': torre_id, 'nombre': f'Torre {chr(65 + t % 26)}{t // 26 or ""}', 'tipo': 'torre',
+                      'padre_id': None, 'ruta': f'/{torre_id}/', 'camas_por_fila': 4, 'orden': t, 'activo': True})
+        for p in range(pisos):
+            piso_id, siguiente = siguiente, siguiente + 1
+            filas.append({'id': piso_id, 'nombre': f'Piso {p + 1}', 'tipo': 'piso', 'padre_id': torre_id,
+                          'ruta': f'/{torre_id}/{piso_id}/', 'camas_por_fila': 3, 'orden': p, 'activo': True})
+            for s in range(sectores):
+                sector_id, siguiente = siguiente, siguiente + 1
+                filas.append({'id': sector_id, 'nombre': SECTORES[s % len(SECTORES)], 'tipo': 'sector',
+                              'padre_id': piso_id, 'ruta': f'/{torre_id}/{piso_id}/{sector_id}/',
+                              'camas_por_fila': 6, 'orden': s, 'activo': True})
+                ids_sectores.append(sector_id)
+    db.session.execute(Ubicacion.__table__.insert(), filas)
+    return ids_sectores
+
+
+def _pacientes(cantidad, rnd):
+    filas = [
+        {'id': i, 'nombre': f'{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}',
+         'rut': _rut(rnd.randint(5_000_000, 25_000_000)), 'activo': True}
+        for i in range(1, cantidad + 1)
+    ]
+    for i in range(0, len(filas), TAMANO_LOTE):
+        db.session.execute(Paciente.__table__.insert(), filas[i:i + TAMANO_LOTE])
+
+
+def generar(args):
+    rnd = random.Random(args.semilla)
+    ahora = datetime.utcnow()
+    inicio = ahora - timedelta(days=args.dias)
+
+    db.drop_all()
+    migrar()
+
+    perfiles, estados = catalogos.sembrar()
+    sectores = _ubicaciones(args.torres, args.pisos, args.sectores)
+    semilla.sembrar_slas(estados)
+    _pacientes(args.pacientes, rnd)
+    db.session.commit()
+
+    camas = [{
+        'id': i, 'codigo': f'C-{i:05d}', 'nombre': f'Cama {i}', 'estado_id': estados['Disponible'],
+        'ubicacion_id': sectores[(i - 1) % len(sectores)], 'orden': (i - 1) // len(sectores) + 1,
+        'activo': True, 'version': 1,
+    } for i in range(1, args.camas + 1)]
+    for i in range(0, len(camas), TAMANO_LOTE):
+        db.session.execute(Cama.__table__.insert(), camas[i:i + TAMANO_LOTE])
+
+    ciclo = semilla.ciclo_para(args.historial, args.camas, args.dias)
+    pacientes = range(1, args.pacientes + 1)
+    flujos = [semilla.transiciones(c['id'], inicio, ahora, ciclo, estados, pacientes, rnd) for c in camas]
+    ultimas, total = semilla.insertar_historial(
+        heapq.merge(*flujos), perfiles, rnd,
+        al_insertar=lambda n: print(f'\r  historial: {n:,} filas', end='', file=sys.stderr)
+    )
+    print(f'\r  historial: {total:,} filas', file=sys.stderr)
+    semilla.fijar_estado_final(ultimas)
+    db.session.commit()
+
+    # Datos derivados que los eventos del ORM mantendrian en una carga normal
+    busqueda.reindexar()
+    cambios.renumerar()
+    db.session.commit()
+    resumen.backfill()
+
+    return {
+        'ubicaciones': db.session.query(Ubicacion).count(),
+        'camas': args.camas,
+        'pacientes': args.pacientes,
+        'historial': total,
+        'version_esquema': MIGRACIONES[-1][0],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=URL_POR_DEFECTO, help='URI de SQLAlchemy de la base a generar')
+    parser.add_argument('--torres', type=int, default=6)
+    parser.add_argument('--pisos', type=int, default=8, help='pisos por torre')
+    parser.add_argument('--sectores', type=int, default=6, help='sectores por piso')
+    parser.add_argument('--camas', type=int, default=5000)
+    parser.add_argument('--pacientes', type=int, default=50000)
+    parser.add_argument('--historial', type=int, default=2000000, help='filas aproximadas de historial')
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    app = _app(args.url)
+    with app.app_context():
+        configurar_motor(db.engine)
+        inicio = time.perf_counter()
+        resultado = generar(args)
+        resultado['segundos'] = round(time.perf_counter() - inicio, 1)
+    print(resultado)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Rendimiento de lecturas mientras hay escrituras concurrentes.
+
+Corre dos fases de la misma duracion sobre el cliente de pruebas de Flask:
+primero solo lectores (monitor y estadisticas) y luego los mismos lectores
+con escritores cambiando estados de camas. Informa throughput, latencias
+p50/p99 y errores (p.ej. "database is locked") de cada fase.
+
+Uso::
+
+    python -m bench.lectura_escritura --lectores 6 --escritores 2 --segundos 10
+    DATABASE_URL=postgresql://... python -m bench.lectura_escritura
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+from app import create_app
+from models import db, Cama, EstadoCama
+
+LECTURAS = ['/', '/api/estadisticas', '/api/dashboard/kpis']
+
+
+def _percentil(valores, q):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(q * len(valores)))]
+
+
+def _bucle(app, hasta, operacion, latencias, errores):
+    cliente = app.test_client()
+    while time.perf_counter() < hasta:
+        inicio = time.perf_counter()
+        respuesta = operacion(cliente)
+        latencias.append(time.perf_counter() - inicio)
+        if respuesta.status_code >= 500:
+            errores.append(respuesta.status_code)
+
+
+def _fase(app, lectores, escritores, segundos, camas, estados):
+    hasta = time.perf_counter() + segundos
+    lecturas, errores_lectura = [], []
+    escrituras, errores_escritura = [], []
+
+    def leer(cliente):
+        return cliente.get(random.choice(LECTURAS))
+
+    def escribir(cliente):
+        return cliente.post(f'/api/cama/{random.choice(camas)}/estado', json={
+            'estado_id': random.choice(estados), 'comentario': 'bench'
+        })
+
+    hilos = [threading.Thread(target=_bucle, args=(app, hasta, leer, lecturas, errores_lectura)) for _ in range(lectores)]
+    hilos += [threading.Thread(target=_bucle, args=(app, hasta, escribir, escrituras, errores_escritura)) for _ in range(escritores)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    return {
+        'lecturas_por_segundo': len(lecturas) / segundos,
+        'lectura_p50_ms': _percentil(lecturas, 0.5) * 1000,
+        'lectura_p99_ms': _percentil(lecturas, 0.99) * 1000,
+        'errores_lectura': len(errores_lectura),
+        'escrituras_por_segundo': len(escrituras) / segundos,
+        'escritura_p50_ms': _percentil(escrituras, 0.5) * 1000,
+        'escritura_p99_ms': _percentil(escrituras, 0.99) * 1000,
+        'errores_escritura': len(errores_escritura),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lectores', type=int, default=6)
+    parser.add_argument('--escritores', type=int, default=2)
+    parser.add_argument('--segundos', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        print(f'motor: {db.engine.url.render_as_string(hide_password=True)}')
+        camas = [c.id for c in Cama.query.filter_by(activo=True)]
+        # Sin 'Ocupada' para no crear pacientes durante la carga
+        estados = [e.id for e in EstadoCama.query.filter(EstadoCama.activo == True, EstadoCama.nombre != 'Ocupada')]
+
+    fases = [
+        ('solo lecturas', _fase(app, args.lectores, 0, args.segundos, camas, estados)),
+        ('lecturas + escrituras', _fase(app, args.lectores, args.escritores, args.segundos, camas, estados)),
+    ]
+    for nombre, r in fases:
+        print(f'\n{nombre}:')
+        print(f"  lecturas   {r['lecturas_por_segundo']:8.1f}/s  p50 {r['lectura_p50_ms']:7.1f} ms  "
+              f"p99 {r['lectura_p99_ms']:7.1f} ms  errores {r['errores_lectura']}")
+        if r['escrituras_por_segundo']:
+            print(f"  escrituras {r['escrituras_por_segundo']:8.1f}/s  p50 {r['escritura_p50_ms']:7.1f} ms  "
+                  f"p99 {r['escritura_p99_ms']:7.1f} ms  errores {r['errores_escritura']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
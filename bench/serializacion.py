@@ -0,0 +1,88 @@
+"""Micro-benchmark: ``to_dict()`` + ``jsonify`` contra ``serializacion``.
+
+Usa una base SQLite en memoria propia (no toca la de la aplicacion) con N
+camas, la mitad ocupadas, y mide el tiempo de armar la respuesta JSON de la
+lista completa por cada camino.
+
+Uso::
+
+    python -m bench.serializacion --filas 1000 10000 --repeticiones 5
+"""
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask, jsonify
+
+from models import db, Cama, EstadoCama, Paciente, Ubicacion
+import serializacion
+
+
+def _app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    return app
+
+
+def _poblar(filas):
+    db.drop_all()
+    db.create_all()
+    db.session.add(Ubicacion(id=1, nombre='Bench', tipo='sector'))
+    db.session.add_all([
+        EstadoCama(id=i, nombre=f'Estado {i}', color='#000000', orden=i) for i in range(1, 8)
+    ])
+    ahora = datetime.utcnow()
+    db.session.execute(Paciente.__table__.insert(), [
+        {'id': i, 'nombre': f'Paciente {i}', 'rut': f'{i}-K', 'activo': True} for i in range(1, filas // 2 + 1)
+    ])
+    db.session.execute(Cama.__table__.insert(), [
+        {
+            'id': i, 'codigo': f'B-{i:05d}', 'nombre': f'Cama {i}', 'ubicacion_id': 1,
+            'estado_id': i % 7 + 1, 'paciente_id': i // 2 if i % 2 == 0 else None,
+            'estado_inicio': ahora - timedelta(minutes=i), 'orden': i, 'activo': True, 'version': 1,
+        }
+        for i in range(1, filas + 1)
+    ])
+    db.session.commit()
+
+
+def _orm():
+    camas = Cama.query.filter_by(ubicacion_id=1, activo=True).order_by(Cama.orden).all()
+    return jsonify({'camas': [c.to_dict() for c in camas]}).get_data()
+
+
+def _columnar():
+    return serializacion.respuesta_json({'camas': serializacion.camas(Cama.ubicacion_id == 1)}).get_data()
+
+
+def _medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        db.session.expunge_all()  # cada request parte con la sesion vacia
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filas', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"encoder: {'orjson' if serializacion.orjson else 'json'}")
+    with _app().app_context():
+        for filas in args.filas:
+            _poblar(filas)
+            orm = _medir(_orm, args.repeticiones)
+            columnar = _medir(_columnar, args.repeticiones)
+            print(f'{filas:>7} camas  to_dict+jsonify {orm:8.1f} ms  columnar {columnar:8.1f} ms  x{orm / columnar:.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
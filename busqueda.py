@@ -0,0 +1,174 @@
+"""Busqueda de pacientes por nombre y RUT normalizados.
+
+Cada paciente tiene filas en ``paciente_terminos``: una por palabra de su
+nombre (minusculas, sin tildes) y una con su RUT sin puntos ni guion. Una
+busqueda exige que cada palabra de la consulta sea prefijo de algun termino
+del paciente (no hay coincidencias en medio de una palabra). Una palabra
+selectiva se resuelve con un rango sobre la PK ``(termino, paciente_id)``;
+con prefijos que coinciden con miles de pacientes se recorre el indice por
+nombre en orden hasta llenar la pagina. Los terminos se mantienen con
+eventos del mapper al insertar o al cambiar nombre/RUT.
+"""
+import re
+import unicodedata
+
+from sqlalchemy import and_, case, event, func, inspect, intersect, or_
+
+from models import db, Paciente, TerminoPaciente
+
+LIMITE_POR_DEFECTO = 10
+LIMITE_MAXIMO = 50
+MAX_PALABRAS = 5
+MAX_CANDIDATOS = 500
+
+_PATRON_RUT = re.compile(r'^[0-9.\-]*[0-9][0-9.\-]*[kK]?$')
+
+
+def normalizar_rut(rut):
+    """'12.345.678-k' -> '12345678K'"""
+    return re.sub(r'[^0-9kK]', '', rut or '').upper()
+
+
+def normalizar_texto(texto):
+    """Minusculas, sin tildes y con espacios simples."""
+    sin_tildes = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return ' '.join(sin_tildes.lower().split())
+
+
+def _normalizar_palabra(palabra):
+    return normalizar_rut(palabra) if _PATRON_RUT.match(palabra) else normalizar_texto(palabra)
+
+
+def terminos(nombre, rut):
+    resultado = set(normalizar_texto(nombre).split())
+    if normalizar_rut(rut):
+        resultado.add(normalizar_rut(rut))
+    return {t[:100] for t in resultado}
+
+
+def _rango_prefijo(columna, prefijo):
+    # Rango [prefijo, prefijo con el ultimo caracter + 1) usa el indice; LIKE no
+    return columna >= prefijo, columna < prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+
+
+def por_rut(rut):
+    """Paciente con el mismo RUT, sin importar puntos, guion ni mayusculas."""
+    normalizado = normalizar_rut(rut)
+    if not normalizado:
+        return None
+    return Paciente.query.filter_by(rut_normalizado=normalizado).first()
+
+
+def _contar_hasta(consulta, tope):
+    return db.session.scalar(db.select(func.count()).select_from(consulta.limit(tope).subquery()))
+
+
+def _tiene_termino(palabra):
+    """Condicion por fila equivalente a un termino del paciente con prefijo ``palabra``."""
+    return or_(
+        func.instr(' ' + Paciente.nombre_normalizado, ' ' + palabra) > 0,
+        and_(*_rango_prefijo(Paciente.rut_normalizado, palabra))
+    )
+
+
+def buscar(q, limite=LIMITE_POR_DEFECTO):
+    """Pacientes activos que coinciden con ``q``, mejores primero.
+
+    Orden: RUT exacto, nombres que empiezan con la primera palabra y luego el
+    resto, alfabetico dentro de cada grupo.
+    """
+    palabras = list(dict.fromkeys(
+        p for p in (_normalizar_palabra(p) for p in (q or '').split()) if p
+    ))[:MAX_PALABRAS]
+    if not palabras:
+        return []
+
+    def pagina(*condiciones, orden=(), limite=limite):
+        filas = db.session.execute(
+            db.select(Paciente.id, Paciente.nombre, Paciente.rut)
+            .where(Paciente.activo == True, *condiciones)
+            .order_by(*orden, Paciente.nombre_normalizado, Paciente.id)
+            .limit(limite)
+        )
+        return [{'id': id_, 'nombre': nombre, 'rut': rut} for id_, nombre, rut in filas]
+
+    def con_termino(palabra):
+        return db.select(TerminoPaciente.paciente_id).where(*_rango_prefijo(TerminoPaciente.termino, palabra))
+
+    if _PATRON_RUT.match(q.strip()):
+        candidatos = con_termino(palabras[0]) if len(palabras) == 1 else intersect(*map(con_termino, palabras))
+        return pagina(
+            Paciente.id.in_(candidatos),
+            orden=[case((Paciente.rut_normalizado == normalizar_rut(q), 0), else_=1)]
+        )
+
+    # Cada palabra se cuenta hasta MAX_CANDIDATOS en paciente_terminos. Si
+    # alguna tiene pocos pacientes, esos son los candidatos y se ordenan; si
+    # todas tienen muchos (p.ej. un prefijo de una o dos letras) se recorre
+    # ix_pacientes_nombre_normalizado ya en orden y se corta en ``limite``,
+    # sin juntar los miles de candidatos. Las demas palabras se revisan en
+    # la misma fila con _tiene_termino.
+    conteos = {p: _contar_hasta(con_termino(p), MAX_CANDIDATOS) for p in palabras}
+    guia = min(palabras, key=conteos.get)
+    if conteos[guia] == 0:
+        return []
+    selectiva = conteos[guia] < MAX_CANDIDATOS
+    filtros = [Paciente.id.in_(con_termino(guia))] if selectiva else []
+    filtros += [_tiene_termino(p) for p in palabras if not (selectiva and p == guia)]
+
+    # Primero los nombres que empiezan con la primera palabra, luego el resto
+    primera = normalizar_texto(q).split()[0]
+    empieza = and_(*_rango_prefijo(Paciente.nombre_normalizado, primera))
+    resultado = pagina(empieza, *filtros)
+    if len(resultado) < limite:
+        resultado += pagina(~empieza, *filtros, limite=limite - len(resultado))
+    return resultado
+
+
+def reindexar():
+    """Recalcula las claves normalizadas y ``paciente_terminos`` de todos los pacientes."""
+    pacientes = db.session.execute(db.select(Paciente.id, Paciente.nombre, Paciente.rut)).all()
+    tabla = Paciente.__table__
+    db.session.execute(TerminoPaciente.__table__.delete())
+    if pacientes:
+        db.session.execute(
+            tabla.update().where(tabla.c.id == db.bindparam('p_id')).values(
+                rut_normalizado=db.bindparam('p_rut'), nombre_normalizado=db.bindparam('p_nombre')
+            ),
+            [
+                {'p_id': id_, 'p_rut': normalizar_rut(rut), 'p_nombre': normalizar_texto(nombre)}
+                for id_, nombre, rut in pacientes
+            ]
+        )
+        filas = [{'termino': t, 'paciente_id': id_} for id_, nombre, rut in pacientes for t in terminos(nombre, rut)]
+        if filas:
+            db.session.execute(TerminoPaciente.__table__.insert(), filas)
+    db.session.commit()
+    return len(pacientes)
+
+
+@event.listens_for(Paciente, 'before_insert')
+@event.listens_for(Paciente, 'before_update')
+def _normalizar(mapper, connection, target):
+    target.rut_normalizado = normalizar_rut(target.rut)
+    target.nombre_normalizado = normalizar_texto(target.nombre)
+
+
+def _escribir_terminos(connection, target):
+    tabla = TerminoPaciente.__table__
+    connection.execute(tabla.delete().where(tabla.c.paciente_id == target.id))
+    filas = [{'termino': t, 'paciente_id': target.id} for t in terminos(target.nombre, target.rut)]
+    if filas:
+        connection.execute(tabla.insert(), filas)
+
+
+@event.listens_for(Paciente, 'after_insert')
+def _terminos_al_insertar(mapper, connection, target):
+    _escribir_terminos(connection, target)
+
+
+@event.listens_for(Paciente, 'after_update')
+def _terminos_al_actualizar(mapper, connection, target):
+    estado = inspect(target)
+    if estado.attrs.nombre.history.has_changes() or estado.attrs.rut.history.has_changes():
+        _escribir_terminos(connection, target)
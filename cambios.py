@@ -0,0 +1,89 @@
+"""Feed de cambios de camas para que los clientes se pongan al dia.
+
+Cada INSERT o UPDATE de una ``Cama`` por el ORM recibe en ``before_flush``
+el siguiente valor del contador ``cambio_seq_camas`` (en
+``parametros_sistema``) y lo guarda en ``Cama.cambio_seq``. El contador se
+incrementa con un UPDATE dentro de la misma transaccion, asi que el lock
+sobre esa fila se mantiene hasta el commit: una transaccion no puede tomar
+un numero mayor mientras otra con un numero menor sigue sin confirmar. Por
+eso un cliente que ya vio todo hasta ``N`` puede pedir ``cambio_seq > N`` sin
+perder cambios que se confirmen despues.
+
+El token que recibe el cliente es simplemente el ultimo ``cambio_seq`` visto.
+Las camas desactivadas salen como tombstone (solo el id).
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Cama, ParametroSistema
+import serializacion
+
+CLAVE_SECUENCIA = 'cambio_seq_camas'
+LIMITE_CAMBIOS = 500
+
+
+def reservar(connection, cantidad):
+    """Incrementa el contador en ``cantidad`` y retorna el ultimo numero reservado."""
+    tabla = ParametroSistema.__table__
+    actualizadas = connection.execute(
+        tabla.update().where(tabla.c.clave == CLAVE_SECUENCIA).values(valor=tabla.c.valor + cantidad)
+    ).rowcount
+    if not actualizadas:
+        connection.execute(tabla.insert().values(clave=CLAVE_SECUENCIA, valor=cantidad))
+    return connection.execute(
+        db.select(tabla.c.valor).where(tabla.c.clave == CLAVE_SECUENCIA)
+    ).scalar_one()
+
+
+def token_actual():
+    """Ultimo ``cambio_seq`` confirmado; sirve como token inicial de una pagina."""
+    return db.session.query(ParametroSistema.valor).filter_by(clave=CLAVE_SECUENCIA).scalar() or 0
+
+
+def renumerar():
+    """Numera todas las camas por id y deja el contador en el maximo."""
+    tabla = Cama.__table__
+    db.session.execute(tabla.update().values(cambio_seq=tabla.c.id))
+    maximo = db.session.query(db.func.max(Cama.id)).scalar() or 0
+    parametro = db.session.get(ParametroSistema, CLAVE_SECUENCIA)
+    if parametro is None:
+        db.session.add(ParametroSistema(clave=CLAVE_SECUENCIA, valor=maximo))
+    else:
+        parametro.valor = max(parametro.valor, maximo)
+
+
+def cambios_desde(desde, limite=LIMITE_CAMBIOS):
+    """Camas con ``cambio_seq > desde`` en orden de secuencia.
+
+    Retorna ``{token, camas, eliminadas, mas}``: ``camas`` con la forma de
+    ``Cama.to_dict()``, ``eliminadas`` con los ids de camas desactivadas y
+    ``mas`` en verdadero si quedaron cambios para una siguiente llamada con
+    el ``token`` retornado.
+    """
+    filas = db.session.execute(
+        db.select(Cama.id, Cama.activo, Cama.cambio_seq)
+        .where(Cama.cambio_seq > desde)
+        .order_by(Cama.cambio_seq)
+        .limit(limite + 1)
+    ).all()
+    mas = len(filas) > limite
+    filas = filas[:limite]
+
+    activas = [id_ for id_, activo, _ in filas if activo]
+    return {
+        'token': filas[-1].cambio_seq if filas else desde,
+        'camas': serializacion.camas(Cama.id.in_(activas)) if activas else [],
+        'eliminadas': [id_ for id_, activo, _ in filas if not activo],
+        'mas': mas,
+    }
+
+
+@event.listens_for(Session, 'before_flush')
+def _numerar_cambios(session, flush_context, instances):
+    camas = [obj for obj in session.new if isinstance(obj, Cama)]
+    camas += [obj for obj in session.dirty if isinstance(obj, Cama) and session.is_modified(obj)]
+    if not camas:
+        return
+    ultimo = reservar(session.connection(), len(camas))
+    for seq, cama in enumerate(camas, start=ultimo - len(camas) + 1):
+        cama.cambio_seq = seq
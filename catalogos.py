@@ -0,0 +1,68 @@
+"""Catalogos oficiales: perfiles, estados de cama y SLA por estado.
+
+Sin ellos la aplicacion no funciona (el monitor queda vacio y no se pueden
+crear camas), asi que no dependen de la carga demo: ``sembrar()`` corre en
+una migracion, tanto en bases nuevas como existentes, y ``flask seed-demo``
+la vuelve a llamar. Es idempotente: perfiles y estados se insertan o
+actualizan con un upsert por nombre y los SLA solo se insertan si faltan
+(no pisan valores ajustados).
+"""
+from models import db, insert_upsert, EstadoCama, Perfil, SlaEstado
+import alertas_sla
+import referencias
+
+# Perfiles de usuario — con nivel_acceso para RBAC (#18)
+PERFILES = [
+    {'nombre': 'Administrador',     'color': '#2F7E81', 'nivel_acceso': 1},
+    {'nombre': 'Staff de Limpieza', 'color': '#8AC52F', 'nivel_acceso': 2},
+    {'nombre': 'Enfermera',         'color': '#60B2B2', 'nivel_acceso': 2},
+    {'nombre': 'Movilizador',       'color': '#9C27B0', 'nivel_acceso': 3},
+]
+
+# Estados de cama — paleta oficial RedSalud (issue #13)
+# border_color != None → estilo borde (fill transparente + borde coloreado)
+ESTADOS = [
+    {'nombre': 'Disponible',            'color': '#4CAF50', 'border_color': None,      'descripcion': 'Cama lista para recibir paciente',          'orden': 1},
+    {'nombre': 'Ocupada',               'color': '#F44336', 'border_color': None,      'descripcion': 'Cama con paciente',                         'orden': 2},
+    {'nombre': 'Alta Medica',           'color': '#F44336', 'border_color': '#F44336', 'descripcion': 'Alta medica con fecha definida en sistema', 'orden': 3},
+    {'nombre': 'Esperando Traslado',    'color': '#9C27B0', 'border_color': None,      'descripcion': 'Esperando traslado de paciente',            'orden': 4},
+    {'nombre': 'Esperando Higiene',     'color': '#FFC107', 'border_color': None,      'descripcion': 'Cama esperando ser higienizada',            'orden': 5},
+    {'nombre': 'Higiene Realizado',     'color': '#FFC107', 'border_color': '#FFC107', 'descripcion': 'Cama disponible — higiene ya realizado',    'orden': 6},
+    {'nombre': 'Proceso de Liberacion', 'color': '#4CAF50', 'border_color': '#4CAF50', 'descripcion': 'Cama en proceso de liberacion en sistema',  'orden': 7},
+    {'nombre': 'Bloqueada',             'color': '#9E9E9E', 'border_color': None,      'descripcion': 'Cama no disponible',                        'orden': 8},
+]
+
+# Minutos maximos por estado antes de generar una alerta (alertas_sla.py)
+SLAS = {
+    'Alta Medica': 240,
+    'Esperando Traslado': 120,
+    'Esperando Higiene': 60,
+    'Higiene Realizado': 30,
+    'Proceso de Liberacion': 30,
+}
+
+
+def _upsert_por_nombre(modelo, filas, columnas):
+    """INSERT ... ON CONFLICT (nombre) DO UPDATE de ``columnas``."""
+    stmt = insert_upsert(modelo.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['nombre'],
+        set_={c: stmt.excluded[c] for c in columnas}
+    )
+    db.session.execute(stmt, filas)
+
+
+def sembrar():
+    """Upsert de perfiles y estados y SLA generales; retorna ``{nombre: id}`` de perfiles y estados."""
+    _upsert_por_nombre(Perfil, PERFILES, ['nivel_acceso'])
+    _upsert_por_nombre(EstadoCama, ESTADOS, ['color', 'border_color', 'orden'])
+    # Los upserts de Core no disparan after_flush: avisar a los demas workers
+    referencias.marcar_modificadas(db.session)
+    perfiles = dict(db.session.execute(db.select(Perfil.nombre, Perfil.id)).all())
+    estados = dict(db.session.execute(db.select(EstadoCama.nombre, EstadoCama.id)).all())
+    stmt = insert_upsert(SlaEstado.__table__).on_conflict_do_nothing(index_elements=['estado_id', 'ubicacion_id'])
+    db.session.execute(stmt, [
+        {'estado_id': estados[nombre], 'ubicacion_id': 0, 'minutos': m} for nombre, m in SLAS.items()
+    ])
+    alertas_sla.incrementar_version(db.session.connection())
+    return perfiles, estados
@@ -0,0 +1,103 @@
+"""Configuracion desde variables de entorno y ajuste del motor de base de datos.
+
+* ``DATABASE_URL``: URI de SQLAlchemy. Por defecto SQLite local en
+  ``instance/``; con ``postgresql://...`` se usa PostgreSQL (requiere
+  instalar el driver, p.ej. ``psycopg2-binary``).
+* ``WEB_THREADS``: hilos por worker de gunicorn (``--threads``). El pool de
+  conexiones se dimensiona con este valor para que ningun hilo espere una
+  conexion.
+* ``SQLITE_BUSY_TIMEOUT_MS`` / ``SQLITE_MMAP_MB``: ajuste fino de SQLite.
+* ``SECRET_KEY``: clave de sesion de Flask.
+* ``SLOW_REQUEST_MS``: umbral del log de requests lentos (instrumentacion.py).
+* ``ALERTAS_SLA``: ``proceso`` (por defecto) arranca el programador de
+  alertas de SLA en cada worker, aunque solo el que tiene el turno trabaja;
+  ``no`` lo desactiva para correrlo aparte con ``flask alertas-sla``.
+  ``ALERTAS_SLA_INTERVALO``: segundos entre lecturas de cambios hechos por
+  otros procesos (y renovacion del turno).
+* ``SSE_MAX_CLIENTES``: streams ``/api/eventos`` abiertos por worker (por
+  defecto la mitad de ``WEB_THREADS``); cada uno retiene un hilo y el resto
+  de los navegadores usa polling. ``SSE_MAX_SEGUNDOS``: duracion de cada
+  stream antes de que el navegador reconecte.
+* ``RESUMEN_HISTORIAL``: ``1`` (por defecto) lee las metricas historicas del
+  dashboard desde el resumen diario (resumen.py); ``0`` usa el historial
+  crudo. ``RESUMEN_ACTUALIZAR``: ``proceso`` (por defecto) lo pone al dia
+  con un hilo por worker cada ``RESUMEN_INTERVALO`` segundos; ``no`` deja
+  esa tarea a ``flask resumen-actualizar``. Con mas de
+  ``RESUMEN_MAX_PENDIENTES`` filas sin resumir se vuelve al historial crudo.
+"""
+import os
+
+from sqlalchemy import event
+
+URI_POR_DEFECTO = 'sqlite:///centro_comandos.db'
+
+
+def _entero(nombre, defecto):
+    return int(os.environ.get(nombre, defecto))
+
+
+def url_base_datos():
+    url = os.environ.get('DATABASE_URL', URI_POR_DEFECTO)
+    # Cloud SQL / Heroku entregan 'postgres://', que SQLAlchemy ya no acepta
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def opciones_motor(url, hilos):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` segun el motor y la cantidad de hilos."""
+    if url.startswith('sqlite'):
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            return {}  # Flask-SQLAlchemy usa StaticPool para memoria
+        return {
+            'pool_size': hilos,
+            'max_overflow': hilos,
+            'pool_timeout': 10,
+            # Espera de pysqlite por el lock; el PRAGMA busy_timeout la complementa
+            'connect_args': {'timeout': _entero('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000},
+        }
+    return {
+        'pool_size': hilos,
+        'max_overflow': hilos,
+        'pool_timeout': 10,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = url_base_datos()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = opciones_motor(SQLALCHEMY_DATABASE_URI, _entero('WEB_THREADS', 8))
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+    RESUMEN_HISTORIAL = os.environ.get('RESUMEN_HISTORIAL', '1') == '1'
+    RESUMEN_ACTUALIZAR = os.environ.get('RESUMEN_ACTUALIZAR', 'proceso')
+    RESUMEN_INTERVALO = _entero('RESUMEN_INTERVALO', 60)
+    RESUMEN_MAX_PENDIENTES = _entero('RESUMEN_MAX_PENDIENTES', 20000)
+    SLOW_REQUEST_MS = _entero('SLOW_REQUEST_MS', 500)
+    SSE_MAX_CLIENTES = _entero('SSE_MAX_CLIENTES', max(1, _entero('WEB_THREADS', 8) // 2))
+    SSE_MAX_SEGUNDOS = _entero('SSE_MAX_SEGUNDOS', 300)
+    ALERTAS_SLA = os.environ.get('ALERTAS_SLA', 'proceso')
+    ALERTAS_SLA_INTERVALO = _entero('ALERTAS_SLA_INTERVALO', 10)
+
+
+def configurar_motor(engine):
+    """Aplica los PRAGMA de SQLite a cada conexion nueva del pool.
+
+    WAL permite que las lecturas sigan mientras hay una escritura en curso;
+    con ``synchronous=NORMAL`` el fsync se hace en los checkpoints y no en
+    cada commit (seguro ante caidas del proceso en modo WAL).
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    busy_timeout = _entero('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    mmap_bytes = _entero('SQLITE_MMAP_MB', 256) * 1024 * 1024
+
+    @event.listens_for(engine, 'connect')
+    def _pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.execute(f'PRAGMA mmap_size={mmap_bytes}')
+        cursor.close()
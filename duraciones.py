@@ -0,0 +1,178 @@
+"""Analitica de permanencia por estado sobre ``historial_camas``.
+
+Recorre el historial en streaming, ordenado por ``(cama_id, created_at)``,
+reconstruye cada episodio (estado, inicio, fin) a partir de transiciones
+consecutivas de la misma cama y alimenta sketches de cuantiles de tamaño
+acotado. La memoria depende solo de la cantidad de grupos pedidos, no de la
+cantidad de filas del historial, asi que sirve para rangos de anos; el
+tiempo crece con las filas del rango. Sin ``desde`` el endpoint cubre
+``VENTANA_POR_DEFECTO``.
+"""
+import math
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from models import db, Cama, HistorialCama
+
+TAMANO_STREAM = 2000
+VENTANA_POR_DEFECTO = timedelta(days=7)
+
+
+class SketchCuantiles:
+    """Sketch de cuantiles con error relativo acotado (estilo DDSketch).
+
+    Los valores se agrupan en buckets logaritmicos de razon ``gamma``, por lo
+    que cualquier cuantil se estima con error relativo <= ``precision``. Si se
+    superan ``max_buckets`` se fusionan los buckets mas bajos, sacrificando
+    precision solo en la cola inferior.
+    """
+
+    def __init__(self, precision=0.01, max_buckets=1024):
+        self.gamma = (1 + precision) / (1 - precision)
+        self._log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.buckets = {}
+        self.ceros = 0
+        self.count = 0
+        self.suma = 0.0
+        self.minimo = None
+        self.maximo = None
+
+    def agregar(self, valor):
+        self.count += 1
+        self.suma += valor
+        self.minimo = valor if self.minimo is None else min(self.minimo, valor)
+        self.maximo = valor if self.maximo is None else max(self.maximo, valor)
+        if valor <= 0:
+            self.ceros += 1
+            return
+        indice = math.ceil(math.log(valor) / self._log_gamma)
+        self.buckets[indice] = self.buckets.get(indice, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            primero, segundo = sorted(self.buckets)[:2]
+            self.buckets[segundo] += self.buckets.pop(primero)
+
+    def cuantil(self, q):
+        if not self.count:
+            return None
+        rango = q * (self.count - 1)
+        acumulado = self.ceros
+        if rango < acumulado:
+            return 0.0
+        for indice in sorted(self.buckets):
+            acumulado += self.buckets[indice]
+            if acumulado > rango:
+                estimado = 2 * self.gamma ** indice / (self.gamma + 1)
+                return min(max(estimado, self.minimo), self.maximo)
+        return self.maximo
+
+    @property
+    def promedio(self):
+        return self.suma / self.count if self.count else None
+
+
+def _inicios_abiertos(desde, filtros=()):
+    """``cama_id -> fecha`` de la ultima transicion de cada cama antes de ``desde``.
+
+    Una sola consulta sobre ``camas``: una busqueda en el indice
+    (cama_id, created_at) por cama, sin importar cuantas filas tenga el rango.
+    """
+    ultima = db.select(func.max(HistorialCama.created_at)).where(
+        HistorialCama.cama_id == Cama.id,
+        HistorialCama.created_at < desde
+    ).scalar_subquery()
+    return {
+        cama_id: fecha
+        for cama_id, fecha in db.session.execute(db.select(Cama.id, ultima).where(*filtros))
+        if fecha is not None
+    }
+
+
+def episodios(desde=None, hasta=None, filtros=()):
+    """Genera ``(estado_id, ubicacion_id, inicio, fin)`` por cada episodio cerrado.
+
+    Un episodio termina con la transicion siguiente de la misma cama dentro
+    del rango. Con ``desde`` se recupera ademas el inicio del episodio que
+    estaba abierto al comienzo del rango (``_inicios_abiertos``).
+    """
+    condiciones = [HistorialCama.created_at.isnot(None), *filtros]
+    inicios = {}
+    if desde:
+        condiciones.append(HistorialCama.created_at >= desde)
+        inicios = _inicios_abiertos(desde, filtros)
+    if hasta:
+        condiciones.append(HistorialCama.created_at < hasta)
+
+    # Con rango, el orden por una expresion impide que SQLite recorra todo
+    # (cama_id, created_at) para evitar el sort: busca el rango por fecha
+    # y ordena solo esas filas
+    orden_cama = HistorialCama.cama_id + 0 if desde or hasta else HistorialCama.cama_id
+    consulta = (
+        db.select(
+            HistorialCama.cama_id,
+            HistorialCama.estado_anterior_id,
+            HistorialCama.estado_nuevo_id,
+            HistorialCama.created_at,
+            Cama.ubicacion_id,
+        )
+        .join(Cama, Cama.id == HistorialCama.cama_id)
+        .where(*condiciones)
+        .order_by(orden_cama, HistorialCama.created_at, HistorialCama.id)
+        .execution_options(yield_per=TAMANO_STREAM)
+    )
+
+    cama_actual = estado_actual = inicio_actual = None
+    for cama_id, anterior_id, nuevo_id, created_at, ubicacion_id in db.session.execute(consulta):
+        if cama_id == cama_actual:
+            yield estado_actual, ubicacion_id, inicio_actual, created_at
+        elif anterior_id and cama_id in inicios:
+            # Primer registro de la cama en el rango: cierra el episodio previo
+            yield anterior_id, ubicacion_id, inicios[cama_id], created_at
+        cama_actual, estado_actual, inicio_actual = cama_id, nuevo_id, created_at
+
+
+def _ventana(fecha, agrupar):
+    if 'semana' in agrupar:
+        return (fecha.date() - timedelta(days=fecha.weekday())).isoformat()
+    if 'dia' in agrupar:
+        return fecha.date().isoformat()
+    return None
+
+
+def calcular(desde=None, hasta=None, filtros=(), agrupar=(), estados=None, cuantiles=(0.5, 0.9, 0.99)):
+    """Percentiles de permanencia por estado y, opcionalmente, sector/ventana.
+
+    ``agrupar`` acepta 'sector' y una ventana 'semana' o 'dia' (por fecha de
+    termino del episodio). ``estados`` limita a un conjunto de estado_id.
+    """
+    sketches = {}
+    for estado_id, ubicacion_id, inicio, fin in episodios(desde, hasta, filtros):
+        if estados and estado_id not in estados:
+            continue
+        clave = (
+            estado_id,
+            ubicacion_id if 'sector' in agrupar else None,
+            _ventana(fin, agrupar),
+        )
+        sketch = sketches.get(clave)
+        if sketch is None:
+            sketch = sketches[clave] = SketchCuantiles()
+        sketch.agregar((fin - inicio).total_seconds())
+
+    resultado = []
+    for (estado_id, ubicacion_id, ventana), sketch in sorted(sketches.items(), key=lambda i: (i[0][0], i[0][1] or 0, i[0][2] or '')):
+        fila = {
+            'estado_id': estado_id,
+            'episodios': sketch.count,
+            'promedio_segundos': round(sketch.promedio),
+            'max_segundos': round(sketch.maximo),
+        }
+        for q in cuantiles:
+            fila[f'p{round(q * 100)}_segundos'] = round(sketch.cuantil(q))
+        if 'sector' in agrupar:
+            fila['ubicacion_id'] = ubicacion_id
+        if ventana:
+            fila['ventana'] = ventana
+        resultado.append(fila)
+    return resultado
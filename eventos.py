@@ -0,0 +1,109 @@
+import json
+import queue
+import threading
+import time
+
+
+class CanalEventos:
+    """Hub en proceso que reparte eventos a los clientes suscritos (SSE).
+
+    Cada cliente tiene su propia cola acotada: si un cliente lento llena su
+    cola se le descarta el evento más antiguo y se marca como atrasado, de
+    modo que ``publicar`` nunca bloquea al hilo que hizo el commit.
+
+    Los streams SSE se cuentan aparte de los suscriptores internos (como el
+    programador de alertas): cada uno ocupa un hilo del worker mientras esta
+    abierto, por eso ``suscribir_stream`` tiene un cupo.
+    """
+
+    def __init__(self, max_cola=100):
+        self.max_cola = max_cola
+        self._clientes = set()
+        self._streams = set()
+        self._lock = threading.Lock()
+
+    def suscribir(self):
+        cola = queue.Queue(maxsize=self.max_cola)
+        with self._lock:
+            self._clientes.add(cola)
+        return cola
+
+    def suscribir_stream(self, max_streams):
+        """Cola para un cliente SSE, o None si ya hay ``max_streams`` abiertos."""
+        cola = queue.Queue(maxsize=self.max_cola)
+        with self._lock:
+            if len(self._streams) >= max_streams:
+                return None
+            self._streams.add(cola)
+            self._clientes.add(cola)
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self._clientes.discard(cola)
+            self._streams.discard(cola)
+
+    def publicar(self, tipo, datos):
+        mensaje = (tipo, datos)
+        with self._lock:
+            clientes = list(self._clientes)
+        for cola in clientes:
+            try:
+                cola.put_nowait(mensaje)
+            except queue.Full:
+                # Cliente atrasado: descartar el evento más antiguo y avisarle
+                try:
+                    cola.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    cola.put_nowait(('resync', {}))
+                except queue.Full:
+                    pass
+
+    @property
+    def total_clientes(self):
+        with self._lock:
+            return len(self._clientes)
+
+    @property
+    def total_streams(self):
+        with self._lock:
+            return len(self._streams)
+
+    def stream(self, cola, heartbeat=15, duracion=None):
+        """Generador de mensajes en formato text/event-stream.
+
+        Con ``duracion`` (segundos) termina el stream; el navegador reconecta
+        solo tras el ``retry`` y los cupos rotan entre los clientes.
+        """
+        hasta = time.monotonic() + duracion if duracion else None
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                espera = heartbeat
+                if hasta is not None:
+                    espera = min(espera, hasta - time.monotonic())
+                    if espera <= 0:
+                        return
+                try:
+                    tipo, datos = cola.get(timeout=espera)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                yield f'event: {tipo}\ndata: {json.dumps(datos)}\n\n'
+        finally:
+            self.desuscribir(cola)
+
+
+canal = CanalEventos()
+
+
+def evento_cama(cama):
+    """Payload compacto publicado cuando cambia el estado de una cama."""
+    return {
+        'cama_id': cama.id,
+        'estado_id': cama.estado_id,
+        'version': cama.version,
+        'estado_inicio': cama.estado_inicio.isoformat() if cama.estado_inicio else None,
+    }
@@ -0,0 +1,177 @@
+"""Instrumentacion por request: latencia, cantidad y tiempo de SQL.
+
+``instalar(app, engine)`` mide cada request (de ``before_request`` a
+``teardown_request``, que corre tambien cuando el request termina en una
+excepcion no manejada) y cada sentencia que ejecuta el motor durante ese
+request. Con eso:
+
+* agrega histogramas por endpoint que ``/metrics`` expone en formato de
+  texto de Prometheus,
+* agrega el header ``Server-Timing`` (``app`` y ``sql``) para verlo en las
+  devtools del navegador, y
+* escribe en el logger ``centro_comandos.lento`` los requests que superan
+  ``SLOW_REQUEST_MS``, con sus sentencias mas lentas.
+
+Las metricas viven en memoria de cada proceso: con varios workers de
+gunicorn cada scrape ve solo el worker que atendio.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger('centro_comandos.lento')
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+MAX_SENTENCIAS = 200     # sentencias guardadas por request para el log de lentos
+SENTENCIAS_EN_LOG = 5
+LARGO_SENTENCIA = 300
+
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)  # el ultimo es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.conteos[bisect.bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+
+class Metricas:
+    """Histogramas por ``(endpoint, metodo)`` y conteo por status, seguro entre hilos."""
+
+    HISTOGRAMAS = (
+        ('http_request_duration_seconds', 'Duracion del request', BUCKETS_SEGUNDOS),
+        ('http_request_sql_queries', 'Sentencias SQL por request', BUCKETS_CONSULTAS),
+        ('http_request_sql_duration_seconds', 'Tiempo en SQL por request', BUCKETS_SEGUNDOS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {nombre: {} for nombre, _, _ in self.HISTOGRAMAS}
+        self._requests = {}
+
+    def registrar(self, endpoint, metodo, status, duracion, consultas, duracion_sql):
+        clave = (endpoint, metodo)
+        valores = (duracion, consultas, duracion_sql)
+        with self._lock:
+            for (nombre, _, buckets), valor in zip(self.HISTOGRAMAS, valores):
+                por_clave = self._histogramas[nombre]
+                if clave not in por_clave:
+                    por_clave[clave] = Histograma(buckets)
+                por_clave[clave].observar(valor)
+            clave_status = (endpoint, metodo, status)
+            self._requests[clave_status] = self._requests.get(clave_status, 0) + 1
+
+    def prometheus(self):
+        """Texto de exposicion de Prometheus (version 0.0.4)."""
+        lineas = []
+        with self._lock:
+            lineas += [
+                '# HELP http_requests_total Requests atendidos',
+                '# TYPE http_requests_total counter',
+            ]
+            for (endpoint, metodo, status), total in sorted(self._requests.items()):
+                lineas.append(f'http_requests_total{{{_etiquetas(endpoint, metodo)},status="{status}"}} {total}')
+
+            for nombre, ayuda, buckets in self.HISTOGRAMAS:
+                lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} histogram']
+                for (endpoint, metodo), h in sorted(self._histogramas[nombre].items()):
+                    etiquetas = _etiquetas(endpoint, metodo)
+                    acumulado = 0
+                    for limite, conteo in zip(buckets + ('+Inf',), h.conteos):
+                        acumulado += conteo
+                        lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+                    lineas.append(f'{nombre}_sum{{{etiquetas}}} {h.suma:.6f}')
+                    lineas.append(f'{nombre}_count{{{etiquetas}}} {h.total}')
+        return '\n'.join(lineas) + '\n'
+
+
+def _etiquetas(endpoint, metodo):
+    endpoint = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+    return f'endpoint="{endpoint}",method="{metodo}"'
+
+
+metricas = Metricas()
+
+
+def _antes_de_sentencia(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('instr_inicio', []).append(time.perf_counter())
+
+
+def _despues_de_sentencia(conn, cursor, statement, parameters, context, executemany):
+    duracion = time.perf_counter() - conn.info['instr_inicio'].pop()
+    if not has_request_context():
+        return
+    medicion = g.get('instr')
+    if medicion is None:
+        return
+    medicion['consultas'] += 1
+    medicion['sql'] += duracion
+    if len(medicion['sentencias']) < MAX_SENTENCIAS:
+        medicion['sentencias'].append((duracion, statement))
+
+
+def _error_de_sentencia(contexto):
+    # Sin after_cursor_execute: descartar el inicio para no desalinear la pila
+    if contexto.connection is not None and contexto.connection.info.get('instr_inicio'):
+        contexto.connection.info['instr_inicio'].pop()
+
+
+def _iniciar_request():
+    g.instr = {'inicio': time.perf_counter(), 'consultas': 0, 'sql': 0.0, 'sentencias': []}
+
+
+def _agregar_server_timing(response):
+    medicion = g.get('instr')
+    if medicion is None:
+        return response
+    medicion['status'] = response.status_code
+    duracion = time.perf_counter() - medicion['inicio']
+    response.headers.add(
+        'Server-Timing',
+        f'app;dur={duracion * 1000:.1f}, '
+        f'sql;desc="{medicion["consultas"]} consultas";dur={medicion["sql"] * 1000:.1f}'
+    )
+    return response
+
+
+def _cerrar_request(error, lento_ms):
+    # teardown: si after_request no llego a correr (excepcion propagada o en
+    # otro hook) el request igual se cuenta, como 500
+    medicion = g.pop('instr', None)
+    if medicion is None:
+        return
+    duracion = time.perf_counter() - medicion['inicio']
+    endpoint = request.endpoint or 'sin_ruta'
+    status = 500 if error is not None else medicion.get('status', 500)
+    metricas.registrar(endpoint, request.method, status,
+                       duracion, medicion['consultas'], medicion['sql'])
+
+    if duracion * 1000 >= lento_ms:
+        peores = sorted(medicion['sentencias'], key=lambda s: s[0], reverse=True)[:SENTENCIAS_EN_LOG]
+        logger.warning(
+            'request lento %s %s (%s): %.0f ms, %d consultas, %.0f ms en SQL\n%s',
+            request.method, request.full_path.rstrip('?'), endpoint, duracion * 1000,
+            medicion['consultas'], medicion['sql'] * 1000,
+            '\n'.join(f'  {d * 1000:8.1f} ms  {" ".join(s.split())[:LARGO_SENTENCIA]}' for d, s in peores)
+        )
+
+
+def instalar(app, engine):
+    """Registra los hooks de Flask y los eventos de cursor de ``engine``."""
+    lento_ms = app.config.get('SLOW_REQUEST_MS', 500)
+    event.listen(engine, 'before_cursor_execute', _antes_de_sentencia)
+    event.listen(engine, 'after_cursor_execute', _despues_de_sentencia)
+    event.listen(engine, 'handle_error', _error_de_sentencia)
+    app.before_request(_iniciar_request)
+    app.after_request(_agregar_server_timing)
+    app.teardown_request(lambda error: _cerrar_request(error, lento_ms))
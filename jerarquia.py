@@ -0,0 +1,120 @@
+"""Consultas sobre la jerarquia Torre/Piso/Sector de ``Ubicacion``.
+
+Dos mecanismos complementarios:
+
+* CTE recursivos (``subarbol_cte`` / ``ancestros_cte``) que funcionan solo con
+  ``padre_id`` y no dependen de datos derivados.
+* Ruta materializada ``Ubicacion.ruta`` (``/1/4/9/``), indexada, que permite
+  filtrar un subarbol completo con un rango sobre el indice. Se mantiene con
+  eventos del mapper al insertar o al cambiar ``padre_id``.
+"""
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, Ubicacion
+
+
+def subarbol_cte(ubicacion_id):
+    """CTE recursivo con el id de la ubicacion y los de todos sus descendientes."""
+    subarbol = db.select(Ubicacion.id).where(Ubicacion.id == ubicacion_id).cte('subarbol', recursive=True)
+    return subarbol.union_all(
+        db.select(Ubicacion.id).where(Ubicacion.padre_id == subarbol.c.id)
+    )
+
+
+def ancestros_cte(ubicacion_id):
+    """CTE recursivo (id, padre_id, nivel) desde la ubicacion hasta la raiz."""
+    ancestros = db.select(
+        Ubicacion.id, Ubicacion.padre_id, db.literal(0).label('nivel')
+    ).where(Ubicacion.id == ubicacion_id).cte('ancestros', recursive=True)
+    return ancestros.union_all(
+        db.select(Ubicacion.id, Ubicacion.padre_id, (ancestros.c.nivel + 1).label('nivel'))
+        .where(Ubicacion.id == ancestros.c.padre_id)
+    )
+
+
+def ancestros(ubicacion_id):
+    """Lista de ubicaciones desde la raiz hasta ``ubicacion_id`` (inclusive)."""
+    cte = ancestros_cte(ubicacion_id)
+    return Ubicacion.query.join(cte, Ubicacion.id == cte.c.id).order_by(cte.c.nivel.desc()).all()
+
+
+def _rango_ruta(ruta):
+    # '/' (0x2F) es seguido por '0' (0x30): [ruta, ruta sin '/' + '0') cubre
+    # exactamente los descendientes y usa el indice (LIKE no lo usa en SQLite)
+    return ruta, ruta[:-1] + '0'
+
+
+def filtro_subarbol(columna_ubicacion_id, ubicacion):
+    """Expresion ``columna IN (subarbol de ubicacion)`` para cualquier consulta.
+
+    Usa la ruta materializada cuando la ubicacion la tiene y el CTE recursivo
+    en caso contrario.
+    """
+    if ubicacion.ruta:
+        desde, hasta = _rango_ruta(ubicacion.ruta)
+        ids = db.select(Ubicacion.id).where(Ubicacion.ruta >= desde, Ubicacion.ruta < hasta)
+    else:
+        ids = db.select(subarbol_cte(ubicacion.id).c.id)
+    return columna_ubicacion_id.in_(ids)
+
+
+def es_descendiente(ubicacion, candidato_id):
+    """True si ``candidato_id`` es la ubicacion o esta dentro de su subarbol."""
+    consulta = db.select(func.count()).where(filtro_subarbol(Ubicacion.id, ubicacion), Ubicacion.id == candidato_id)
+    return db.session.execute(consulta).scalar() > 0
+
+
+def recalcular_rutas():
+    """Reconstruye ``ruta`` de todas las ubicaciones con un CTE recursivo."""
+    rutas = db.select(
+        Ubicacion.id, ('/' + db.cast(Ubicacion.id, db.String) + '/').label('ruta')
+    ).where(Ubicacion.padre_id.is_(None)).cte('rutas', recursive=True)
+    rutas = rutas.union_all(
+        db.select(Ubicacion.id, (rutas.c.ruta + db.cast(Ubicacion.id, db.String) + '/'))
+        .where(Ubicacion.padre_id == rutas.c.id)
+    )
+    filas = db.session.execute(db.select(rutas.c.id, rutas.c.ruta)).all()
+    if filas:
+        tabla = Ubicacion.__table__
+        db.session.execute(
+            tabla.update().where(tabla.c.id == db.bindparam('u_id')).values(ruta=db.bindparam('u_ruta')),
+            [{'u_id': id_, 'u_ruta': ruta} for id_, ruta in filas]
+        )
+    db.session.commit()
+    return len(filas)
+
+
+def _ruta_padre(connection, padre_id):
+    if padre_id is None:
+        return '/'
+    tabla = Ubicacion.__table__
+    return connection.execute(db.select(tabla.c.ruta).where(tabla.c.id == padre_id)).scalar() or '/'
+
+
+@event.listens_for(Ubicacion, 'after_insert')
+def _ruta_al_insertar(mapper, connection, target):
+    ruta = f'{_ruta_padre(connection, target.padre_id)}{target.id}/'
+    tabla = Ubicacion.__table__
+    connection.execute(tabla.update().where(tabla.c.id == target.id).values(ruta=ruta))
+    set_committed_value(target, 'ruta', ruta)
+
+
+@event.listens_for(Ubicacion, 'after_update')
+def _ruta_al_mover(mapper, connection, target):
+    if not inspect(target).attrs.padre_id.history.has_changes():
+        return
+    tabla = Ubicacion.__table__
+    vieja = connection.execute(db.select(tabla.c.ruta).where(tabla.c.id == target.id)).scalar()
+    nueva = f'{_ruta_padre(connection, target.padre_id)}{target.id}/'
+    if vieja:
+        # Reescribe el prefijo de todo el subarbol en un solo UPDATE
+        desde, hasta = _rango_ruta(vieja)
+        connection.execute(
+            tabla.update()
+            .where(tabla.c.ruta >= desde, tabla.c.ruta < hasta)
+            .values(ruta=nueva + func.substr(tabla.c.ruta, len(vieja) + 1))
+        )
+    else:
+        connection.execute(tabla.update().where(tabla.c.id == target.id).values(ruta=nueva))
+    set_committed_value(target, 'ruta', nueva)
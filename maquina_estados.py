@@ -0,0 +1,134 @@
+"""Maquina de estados de las camas: transiciones permitidas, roles y efectos.
+
+La tabla se declara por nombre de estado y se resuelve a ids con el cache de
+``referencias``: el mapa de adyacencia ``origen_id -> {destino_id: nivel}``
+se arma una vez por carga de las referencias y validar un cambio es una
+busqueda en dos diccionarios.
+
+El nivel de cada transicion es el ``nivel_acceso`` maximo que puede hacerla
+(1 Administrador, 2 personal clinico y de higiene, 3 Movilizador). Repetir el
+estado actual (para comentar o cambiar de paciente) siempre se permite. Un
+Administrador puede hacer ademas cualquier cambio que la tabla no declara
+(p.ej. corregir un escaneo equivocado de Ocupada a Disponible); lo mismo
+vale para los estados que no figuran en la tabla.
+"""
+from dataclasses import dataclass
+
+from referencias import cache as referencias
+
+ADMINISTRADOR = 1
+PERSONAL = 2
+TODOS = 3
+
+# origen -> {destino: nivel_acceso maximo}
+TRANSICIONES = {
+    'Disponible': {
+        'Ocupada': PERSONAL,
+        'Esperando Higiene': PERSONAL,
+        'Bloqueada': ADMINISTRADOR,
+    },
+    'Ocupada': {
+        'Alta Medica': PERSONAL,
+        'Esperando Traslado': PERSONAL,
+        'Esperando Higiene': TODOS,
+    },
+    'Alta Medica': {
+        'Ocupada': PERSONAL,
+        'Esperando Traslado': PERSONAL,
+        'Esperando Higiene': TODOS,
+    },
+    'Esperando Traslado': {
+        'Ocupada': PERSONAL,
+        'Esperando Higiene': TODOS,
+    },
+    'Esperando Higiene': {
+        'Higiene Realizado': PERSONAL,
+        'Proceso de Liberacion': PERSONAL,
+        'Bloqueada': ADMINISTRADOR,
+    },
+    'Higiene Realizado': {
+        'Proceso de Liberacion': PERSONAL,
+        'Disponible': PERSONAL,
+        'Esperando Higiene': PERSONAL,
+    },
+    'Proceso de Liberacion': {
+        'Disponible': PERSONAL,
+        'Esperando Higiene': PERSONAL,
+    },
+    'Bloqueada': {
+        'Disponible': ADMINISTRADOR,
+        'Esperando Higiene': ADMINISTRADOR,
+    },
+}
+MISMO_ESTADO = TODOS
+# Cambios no declarados en TRANSICIONES: solo el Administrador
+SIN_REGLAS = ADMINISTRADOR
+
+# Efectos al entrar a un estado:
+# * asignar_paciente: asigna (o crea) el paciente indicado en el cambio,
+# * liberar_anterior: si el paciente estaba en otra cama, esa cama queda sin
+#   paciente y pasa a ESTADO_TRAS_TRASLADO,
+# * limpiar_paciente: la cama queda sin paciente.
+EFECTOS = {
+    'Ocupada': ('asignar_paciente', 'liberar_anterior'),
+    'Disponible': ('limpiar_paciente',),
+}
+ESTADO_TRAS_TRASLADO = 'Esperando Higiene'
+
+
+@dataclass(frozen=True)
+class MapaTransiciones:
+    aristas: dict
+    efectos: dict
+    tras_traslado: object
+
+    def nivel_requerido(self, origen_id, destino_id):
+        """``nivel_acceso`` maximo para el cambio; None si algun estado no existe."""
+        return self.aristas.get(origen_id, {}).get(destino_id)
+
+    def to_dict(self):
+        return {
+            'transiciones': {
+                str(origen): {str(destino): nivel for destino, nivel in destinos.items()}
+                for origen, destinos in self.aristas.items()
+            },
+            'efectos': {str(estado_id): list(efectos) for estado_id, efectos in self.efectos.items()},
+        }
+
+
+def _construir(refs):
+    estados = refs.estados(activos=False)
+    ids = {e.nombre: e.id for e in estados}
+    aristas = {}
+    for origen in estados:
+        declaradas = TRANSICIONES.get(origen.nombre)
+        destinos = {}
+        for destino in estados:
+            if destino.id == origen.id:
+                destinos[destino.id] = MISMO_ESTADO
+            elif declaradas and destino.nombre in declaradas:
+                destinos[destino.id] = declaradas[destino.nombre]
+            else:
+                destinos[destino.id] = SIN_REGLAS
+        aristas[origen.id] = destinos
+    efectos = {ids[nombre]: e for nombre, e in EFECTOS.items() if nombre in ids}
+    return MapaTransiciones(aristas, efectos, refs.estado(ESTADO_TRAS_TRASLADO))
+
+
+def mapa():
+    """Mapa de transiciones vigente (se rearma cuando se recargan los estados)."""
+    return referencias.derivado('maquina_estados', _construir)
+
+
+def nivel_requerido(origen_id, destino_id):
+    return mapa().nivel_requerido(origen_id, destino_id)
+
+
+def efectos(estado_id):
+    """Nombres de los efectos de entrar a ``estado_id``."""
+    return mapa().efectos.get(estado_id, ())
+
+
+def estado_tras_traslado():
+    """Estado en que queda la cama de la que sale un paciente trasladado."""
+    return mapa().tras_traslado
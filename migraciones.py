@@ -0,0 +1,150 @@
+"""Migraciones de esquema versionadas.
+
+``db.create_all()`` crea las tablas que faltan (con sus indices) pero no
+altera tablas existentes. Cada migracion agrega columnas o indices a bases
+ya creadas y debe ser idempotente, porque en una base nueva ``create_all``
+ya dejo el esquema al dia. La ultima version aplicada se guarda en
+``version_esquema``.
+"""
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from models import db, VersionEsquema
+import altas
+import busqueda
+import catalogos
+import cambios
+import jerarquia
+
+
+def _agregar_columna(tabla, columna, ddl):
+    columnas = {c['name'] for c in inspect(db.engine).get_columns(tabla)}
+    if columna not in columnas:
+        db.session.execute(text(f'ALTER TABLE {tabla} ADD COLUMN {columna} {ddl}'))
+
+
+def _crear_indices(tabla, nombres):
+    """Crea los indices declarados en models.py que aun no existen."""
+    indices = {i.name: i for i in db.metadata.tables[tabla].indexes}
+    for nombre in nombres:
+        indices[nombre].create(bind=db.session.connection(), checkfirst=True)
+
+
+def _m001_ruta_ubicaciones():
+    _agregar_columna('ubicaciones', 'ruta', 'VARCHAR(255)')
+    _crear_indices('ubicaciones', ['ix_ubicaciones_ruta'])
+    db.session.flush()
+    jerarquia.recalcular_rutas()
+
+
+def _m002_indices_consultas():
+    _crear_indices('historial_camas', [
+        'ix_historial_cama_fecha',
+        'ix_historial_estado_fecha',
+        'ix_historial_perfil_fecha',
+        'ix_historial_fecha',
+    ])
+    _crear_indices('camas', [
+        'ix_camas_ubicacion_activo_orden',
+        'ix_camas_activo_estado_ubicacion',
+        'ix_camas_paciente',
+    ])
+    _crear_indices('pacientes', ['ix_pacientes_rut'])
+
+
+def _m003_version_camas():
+    _agregar_columna('camas', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+
+def _m004_indice_historial_paciente():
+    _crear_indices('historial_camas', ['ix_historial_paciente_fecha'])
+
+
+def _m005_busqueda_pacientes():
+    _agregar_columna('pacientes', 'rut_normalizado', 'VARCHAR(12)')
+    _agregar_columna('pacientes', 'nombre_normalizado', 'VARCHAR(200)')
+    _crear_indices('pacientes', ['ix_pacientes_rut_normalizado'])
+    db.session.flush()
+    busqueda.reindexar()
+
+
+def _m006_secuencia_cambios_camas():
+    _agregar_columna('camas', 'cambio_seq', 'BIGINT NOT NULL DEFAULT 0')
+    _crear_indices('camas', ['ix_camas_cambio_seq'])
+    db.session.flush()
+    cambios.renumerar()
+
+
+def _m007_nombre_unico_estados():
+    _crear_indices('estados_cama', ['ix_estados_cama_nombre'])
+
+
+def _m008_alertas_sla():
+    # create_all ya creo sla_estados y alertas_sla; los SLA generales los carga la migracion 12
+    _crear_indices('alertas_sla', ['ix_alertas_sla_episodio', 'ix_alertas_sla_resuelta_detectada'])
+
+
+def _m009_resumen_diario():
+    # create_all ya creo las tablas diarias; la marca vuelve a 0 para llenarlas
+    db.session.execute(text('DROP TABLE IF EXISTS resumen_historial'))
+    db.session.execute(text("DELETE FROM parametros_sistema WHERE clave = 'resumen_historial_id'"))
+
+
+def _m010_altas_camas():
+    # create_all ya creo altas_camas; se llena desde el historial existente
+    altas.reconstruir()
+
+
+def _m011_indice_nombre_pacientes():
+    _crear_indices('pacientes', ['ix_pacientes_nombre_normalizado'])
+
+
+def _m012_catalogos():
+    # Perfiles, estados y SLA oficiales: la aplicacion los necesita sin datos demo
+    catalogos.sembrar()
+
+
+MIGRACIONES = [
+    (1, 'Ruta materializada en ubicaciones', _m001_ruta_ubicaciones),
+    (2, 'Indices para consultas del monitor, dashboard y cambios de estado', _m002_indices_consultas),
+    (3, 'Version de camas para control de concurrencia optimista', _m003_version_camas),
+    (4, 'Indice de historial por paciente', _m004_indice_historial_paciente),
+    (5, 'Claves normalizadas e indice de terminos para buscar pacientes', _m005_busqueda_pacientes),
+    (6, 'Secuencia de cambios de camas para sincronizacion incremental', _m006_secuencia_cambios_camas),
+    (7, 'Nombre unico en estados de cama', _m007_nombre_unico_estados),
+    (8, 'SLA por estado y alertas de SLA', _m008_alertas_sla),
+    (9, 'Resumen del historial con grano diario', _m009_resumen_diario),
+    (10, 'Episodios de alta para el KPI de cierre exitoso', _m010_altas_camas),
+    (11, 'Indice por nombre normalizado para buscar pacientes', _m011_indice_nombre_pacientes),
+    (12, 'Catalogos oficiales de perfiles, estados y SLA', _m012_catalogos),
+]
+
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+
+def version_aplicada():
+    return db.session.query(func.max(VersionEsquema.version)).scalar() or 0
+
+
+def esquema_al_dia():
+    """True si ya se aplico ``VERSION_ACTUAL``; en una base vacia retorna False."""
+    try:
+        return version_aplicada() >= VERSION_ACTUAL
+    except (OperationalError, ProgrammingError):  # aun no existe version_esquema
+        db.session.rollback()
+        return False
+
+
+def migrar():
+    """Crea tablas nuevas y aplica en orden las migraciones pendientes."""
+    db.create_all()
+    actual = version_aplicada()
+    aplicadas = []
+    for version, descripcion, migracion in MIGRACIONES:
+        if version <= actual:
+            continue
+        migracion()
+        db.session.add(VersionEsquema(version=version, descripcion=descripcion))
+        db.session.commit()
+        aplicadas.append(version)
+    return aplicadas
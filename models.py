@@ -4,6 +4,27 @@ from datetime import datetime, timedelta
 db = SQLAlchemy()
 
 
+def insert_upsert(tabla):
+    """``insert()`` del dialecto en uso, que admite ``on_conflict_do_update``.
+
+    Importa solo el dialecto necesario (el de PostgreSQL es caro de cargar).
+    """
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(tabla)
+
+
+def formato_duracion(total_seconds):
+    """Formatea segundos como H:MM:SS"""
+    total_seconds = int(total_seconds)
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
 class Perfil(db.Model):
     """Modelo para perfiles de usuario (roles)"""
     __tablename__ = 'perfiles'
@@ -11,7 +32,8 @@ class Perfil(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(50), nullable=False, unique=True)
     color = db.Column(db.String(7), default='#2F7E81')
-    # RBAC #18: 1=ver+editar, 2=solo ver, 3=sin acceso
+    # RBAC #18 (ver maquina_estados.py): 1 Administrador (cualquier cambio),
+    # 2 personal clinico y de higiene, 3 Movilizador (solo sus transiciones)
     nivel_acceso = db.Column(db.Integer, default=1)
     activo = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -31,10 +53,20 @@ class Perfil(db.Model):
 class Paciente(db.Model):
     """Modelo para pacientes"""
     __tablename__ = 'pacientes'
+    __table_args__ = (
+        db.Index('ix_pacientes_rut', 'rut'),
+        db.Index('ix_pacientes_rut_normalizado', 'rut_normalizado'),
+        # Busqueda: nombres que empiezan con un prefijo, ya en orden alfabetico
+        db.Index('ix_pacientes_nombre_normalizado', 'nombre_normalizado'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(200))
     rut = db.Column(db.String(12))
+    # Claves de busqueda mantenidas por busqueda.py: RUT sin puntos ni guion,
+    # nombre en minusculas y sin tildes
+    rut_normalizado = db.Column(db.String(12))
+    nombre_normalizado = db.Column(db.String(200))
     activo = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -57,6 +89,8 @@ class Ubicacion(db.Model):
     nombre = db.Column(db.String(100), nullable=False)
     tipo = db.Column(db.String(50), nullable=False)  # torre, piso, sector
     padre_id = db.Column(db.Integer, db.ForeignKey('ubicaciones.id'), nullable=True)
+    # Ruta materializada '/torre/piso/sector/' para consultas de subarbol (ver jerarquia.py)
+    ruta = db.Column(db.String(255), index=True)
     camas_por_fila = db.Column(db.Integer, default=3)
     orden = db.Column(db.Integer, default=0)
     activo = db.Column(db.Boolean, default=True)
@@ -75,6 +109,7 @@ class Ubicacion(db.Model):
             'nombre': self.nombre,
             'tipo': self.tipo,
             'padre_id': self.padre_id,
+            'ruta': self.ruta,
             'camas_por_fila': self.camas_por_fila,
             'orden': self.orden,
             'activo': self.activo
@@ -84,6 +119,10 @@ class Ubicacion(db.Model):
 class EstadoCama(db.Model):
     """Modelo para estados de cama"""
     __tablename__ = 'estados_cama'
+    __table_args__ = (
+        # Upsert por nombre de semilla.py
+        db.Index('ix_estados_cama_nombre', 'nombre', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(50), nullable=False)
@@ -109,6 +148,16 @@ class EstadoCama(db.Model):
 class Cama(db.Model):
     """Modelo para camas"""
     __tablename__ = 'camas'
+    __table_args__ = (
+        # Camas de un sector ordenadas (monitor, /api/ubicacion/<id>/camas)
+        db.Index('ix_camas_ubicacion_activo_orden', 'ubicacion_id', 'activo', 'orden'),
+        # Conteos por estado (estadisticas, tiempos por estado); cubre el GROUP BY
+        db.Index('ix_camas_activo_estado_ubicacion', 'activo', 'estado_id', 'ubicacion_id'),
+        # Deteccion de traslado: cama actual de un paciente
+        db.Index('ix_camas_paciente', 'paciente_id'),
+        # Feed de cambios (/api/camas/cambios?since=)
+        db.Index('ix_camas_cambio_seq', 'cambio_seq'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(20), nullable=False)
@@ -120,6 +169,12 @@ class Cama(db.Model):
     orden = db.Column(db.Integer, default=0)
     activo = db.Column(db.Boolean, default=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Control de concurrencia optimista: cada UPDATE lleva WHERE version = ?
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Numero del ultimo cambio confirmado, asignado por cambios.py
+    cambio_seq = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __mapper_args__ = {'version_id_col': version}
 
     # Relaciones
     estado = db.relationship('EstadoCama', backref='camas')
@@ -137,12 +192,7 @@ class Cama(db.Model):
 
     def tiempo_en_estado_str(self):
         """Retorna el tiempo en formato HH:MM:SS"""
-        delta = self.tiempo_en_estado()
-        total_seconds = int(delta.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        return f"{hours}:{minutes:02d}:{seconds:02d}"
+        return formato_duracion(self.tiempo_en_estado().total_seconds())
 
     def tiempo_en_estado_minutos(self):
         """Retorna el tiempo en minutos"""
@@ -161,13 +211,26 @@ class Cama(db.Model):
             'paciente_id': self.paciente_id,
             'tiempo_estado': self.tiempo_en_estado_str(),
             'tiempo_minutos': self.tiempo_en_estado_minutos(),
-            'orden': self.orden
+            'orden': self.orden,
+            'version': self.version
         }
 
 
 class HistorialCama(db.Model):
     """Historial de cambios de estado de camas"""
     __tablename__ = 'historial_camas'
+    __table_args__ = (
+        # Linea de tiempo de una cama y EXISTS del KPI de cierre exitoso
+        db.Index('ix_historial_cama_fecha', 'cama_id', 'created_at'),
+        # Altas gestionadas / filtros por estado con rango de fechas
+        db.Index('ix_historial_estado_fecha', 'estado_nuevo_id', 'created_at'),
+        # Registros por semana y perfil
+        db.Index('ix_historial_perfil_fecha', 'perfil_id', 'created_at'),
+        # Rangos de fechas sin otro filtro (KPIs, exportaciones)
+        db.Index('ix_historial_fecha', 'created_at'),
+        # Linea de tiempo paginada de un paciente
+        db.Index('ix_historial_paciente_fecha', 'paciente_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     cama_id = db.Column(db.Integer, db.ForeignKey('camas.id'), nullable=False)
@@ -200,3 +263,155 @@ class HistorialCama(db.Model):
             'comentario': self.comentario,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class TerminoPaciente(db.Model):
+    """Indice de busqueda: una fila por palabra normalizada del nombre y por RUT"""
+    __tablename__ = 'paciente_terminos'
+
+    # La PK (termino, paciente_id) es el indice de los rangos por prefijo
+    termino = db.Column(db.String(100), primary_key=True)
+    paciente_id = db.Column(db.Integer, db.ForeignKey('pacientes.id'), primary_key=True)
+
+
+class VersionEsquema(db.Model):
+    """Migraciones de esquema aplicadas (ver migraciones.py)"""
+    __tablename__ = 'version_esquema'
+
+    version = db.Column(db.Integer, primary_key=True)
+    descripcion = db.Column(db.String(200))
+    aplicada_en = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<VersionEsquema {self.version}>'
+
+
+class ParametroSistema(db.Model):
+    """Contadores y marcas internas del sistema (clave -> entero)"""
+    __tablename__ = 'parametros_sistema'
+
+    clave = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ParametroSistema {self.clave}={self.valor}>'
+
+
+class AltaCama(db.Model):
+    """Episodio de alta medica de una cama (ver altas.py)
+
+    Una fila por transicion a Alta Medica, con su ``created_at``;
+    ``cerrada_en`` es la primera llegada posterior de la cama a Disponible o
+    Proceso de Liberacion (NULL mientras no ocurra).
+    """
+    __tablename__ = 'altas_camas'
+    __table_args__ = (
+        # Cubre el KPI (camas distintas, con o sin rango, sin leer la tabla) y
+        # el cierre de las altas abiertas de una cama
+        db.Index('ix_altas_cama', 'cama_id', 'created_at', 'cerrada_en'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    cama_id = db.Column(db.Integer, db.ForeignKey('camas.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    cerrada_en = db.Column(db.DateTime)
+
+
+class ResumenEstado(db.Model):
+    """Resumen diario de historial_camas por estado (ver resumen.py)
+
+    ``entradas`` cuenta las transiciones hacia el estado; ``salidas`` y
+    ``segundos_en_estado`` acumulan los episodios del estado que terminaron
+    ese dia.
+    """
+    __tablename__ = 'resumen_estado_dia'
+    # Clave primaria agrupada: las lecturas por rango de clave no saltan por la tabla
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    dia = db.Column(db.Date, primary_key=True)
+    estado_id = db.Column(db.Integer, primary_key=True)
+    entradas = db.Column(db.Integer, nullable=False, default=0)
+    salidas = db.Column(db.Integer, nullable=False, default=0)
+    segundos_en_estado = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ResumenEstado {self.dia} estado={self.estado_id}>'
+
+
+class ResumenPerfil(db.Model):
+    """Transiciones por dia y perfil (``perfil_id`` 0 = sin perfil)"""
+    __tablename__ = 'resumen_perfil_dia'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    dia = db.Column(db.Date, primary_key=True)
+    perfil_id = db.Column(db.Integer, primary_key=True, default=0)
+    entradas = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ResumenUbicacion(db.Model):
+    """Transiciones por sector, dia y estado destino, para filtrar por subarbol"""
+    __tablename__ = 'resumen_ubicacion_dia'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    ubicacion_id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, primary_key=True)
+    estado_id = db.Column(db.Integer, primary_key=True)
+    entradas = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SlaEstado(db.Model):
+    """Tiempo maximo en un estado (ver alertas_sla.py)
+
+    ``ubicacion_id`` puede ser una torre, piso o sector y vale para todo su
+    subarbol; 0 = valor por defecto para todas las ubicaciones.
+    """
+    __tablename__ = 'sla_estados'
+
+    estado_id = db.Column(db.Integer, db.ForeignKey('estados_cama.id'), primary_key=True)
+    ubicacion_id = db.Column(db.Integer, primary_key=True, default=0)
+    minutos = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<SlaEstado estado={self.estado_id} ubicacion={self.ubicacion_id} {self.minutos} min>'
+
+
+class AlertaSla(db.Model):
+    """Cama que supero el SLA de su estado; una por episodio (cama, estado_inicio)"""
+    __tablename__ = 'alertas_sla'
+    __table_args__ = (
+        # Un solo registro por episodio aunque varios procesos lo detecten
+        db.Index('ix_alertas_sla_episodio', 'cama_id', 'estado_inicio', unique=True),
+        # Alertas abiertas / recientes para /api/alertas
+        db.Index('ix_alertas_sla_resuelta_detectada', 'resuelta_en', 'detectada_en'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    cama_id = db.Column(db.Integer, db.ForeignKey('camas.id'), nullable=False)
+    estado_id = db.Column(db.Integer, db.ForeignKey('estados_cama.id'), nullable=False)
+    ubicacion_id = db.Column(db.Integer, db.ForeignKey('ubicaciones.id'), nullable=False)
+    estado_inicio = db.Column(db.DateTime, nullable=False)
+    vence_en = db.Column(db.DateTime, nullable=False)
+    sla_minutos = db.Column(db.Integer, nullable=False)
+    detectada_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Momento en que la cama salio del estado (o None si sigue excedida)
+    resuelta_en = db.Column(db.DateTime)
+
+    cama = db.relationship('Cama')
+
+    def __repr__(self):
+        return f'<AlertaSla cama={self.cama_id} estado={self.estado_id}>'
+
+    def to_dict(self):
+        fin = self.resuelta_en or datetime.utcnow()
+        return {
+            'id': self.id,
+            'cama_id': self.cama_id,
+            'estado_id': self.estado_id,
+            'ubicacion_id': self.ubicacion_id,
+            'estado_inicio': self.estado_inicio.isoformat(),
+            'vence_en': self.vence_en.isoformat(),
+            'sla_minutos': self.sla_minutos,
+            'minutos_excedidos': int((fin - self.vence_en).total_seconds() // 60),
+            'detectada_en': self.detectada_en.isoformat(),
+            'resuelta_en': self.resuelta_en.isoformat() if self.resuelta_en else None,
+        }
@@ -0,0 +1,86 @@
+"""Paginacion keyset de la linea de tiempo de ``historial_camas``.
+
+Las paginas se ordenan por ``(created_at, id)`` descendente y el cursor
+codifica la ultima clave entregada, asi que cada pagina cuesta O(limite)
+sobre el indice ``(cama_id | paciente_id, created_at)`` sin importar cuantas
+transiciones tenga la cama. A diferencia de OFFSET, el cursor es estable
+aunque entren movimientos nuevos mientras se pagina.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import aliased
+
+from models import db, Cama, EstadoCama, HistorialCama, Paciente, Perfil
+
+LIMITE_POR_DEFECTO = 20
+LIMITE_MAXIMO = 100
+
+
+def codificar_cursor(created_at, id_):
+    datos = json.dumps([created_at.isoformat(), id_], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(datos).decode().rstrip('=')
+
+
+def decodificar_cursor(token):
+    """Retorna ``(created_at, id)``; lanza ValueError si el token no es valido."""
+    try:
+        relleno = '=' * (-len(token) % 4)
+        fecha, id_ = json.loads(base64.urlsafe_b64decode(token + relleno))
+        return datetime.fromisoformat(fecha), int(id_)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('cursor invalido') from e
+
+
+def pagina_historial(filtro, cursor=None, limite=LIMITE_POR_DEFECTO):
+    """Una pagina de la linea de tiempo que cumple ``filtro``, mas reciente primero.
+
+    Retorna ``{'items': [...], 'siguiente': token | None}`` con items en la
+    forma de ``HistorialCama.to_dict()`` (nombres resueltos por JOIN).
+    """
+    anterior = aliased(EstadoCama)
+    nuevo = aliased(EstadoCama)
+    consulta = db.select(
+        HistorialCama.id, HistorialCama.cama_id, Cama.codigo,
+        HistorialCama.estado_anterior_id, anterior.nombre, HistorialCama.estado_nuevo_id, nuevo.nombre,
+        HistorialCama.perfil_id, Perfil.nombre, HistorialCama.paciente_id, Paciente.nombre, Paciente.rut,
+        HistorialCama.usuario, HistorialCama.comentario, HistorialCama.created_at
+    ).join(Cama, Cama.id == HistorialCama.cama_id) \
+        .outerjoin(anterior, anterior.id == HistorialCama.estado_anterior_id) \
+        .outerjoin(nuevo, nuevo.id == HistorialCama.estado_nuevo_id) \
+        .outerjoin(Perfil, Perfil.id == HistorialCama.perfil_id) \
+        .outerjoin(Paciente, Paciente.id == HistorialCama.paciente_id) \
+        .where(filtro, HistorialCama.created_at.isnot(None))
+    if cursor:
+        consulta = consulta.where(tuple_(HistorialCama.created_at, HistorialCama.id) < tuple_(*cursor))
+    filas = db.session.execute(
+        consulta.order_by(HistorialCama.created_at.desc(), HistorialCama.id.desc()).limit(limite + 1)
+    ).all()
+
+    items = [
+        {
+            'id': id_,
+            'cama_id': cama_id,
+            'cama': codigo,
+            'estado_anterior_id': anterior_id,
+            'estado_anterior': anterior_nombre,
+            'estado_nuevo_id': nuevo_id,
+            'estado_nuevo': nuevo_nombre,
+            'perfil': perfil_nombre,
+            'perfil_id': perfil_id,
+            'paciente': {'id': paciente_id, 'nombre': paciente_nombre, 'rut': paciente_rut} if paciente_id else None,
+            'usuario': usuario,
+            'comentario': comentario,
+            'created_at': created_at.isoformat(),
+        }
+        for (id_, cama_id, codigo, anterior_id, anterior_nombre, nuevo_id, nuevo_nombre, perfil_id,
+             perfil_nombre, paciente_id, paciente_nombre, paciente_rut, usuario, comentario, created_at)
+        in filas[:limite]
+    ]
+    siguiente = None
+    if len(filas) > limite:
+        ultima = filas[limite - 1]
+        siguiente = codificar_cursor(ultima[-1], ultima[0])
+    return {'items': items, 'siguiente': siguiente}
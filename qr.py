@@ -0,0 +1,180 @@
+"""Imagenes QR de confirmacion de hitos y hojas imprimibles.
+
+El PNG de un QR es deterministico para una URL, asi que se guarda en un
+cache LRU en memoria junto con su ETag. Las hojas de impresion de un sector,
+piso o torre generan los QR que faltan en un pool de procesos (la
+codificacion es CPU pura y no debe ocupar el hilo web) y los componen en
+paginas A4, de a una.
+"""
+import hashlib
+import io
+import math
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Pagina A4 a 150 dpi
+ANCHO_PAGINA, ALTO_PAGINA, DPI = 1240, 1754, 150
+MARGEN = 60
+COLUMNAS, FILAS = 4, 5
+LADO_QR = 220
+MIN_PARA_POOL = 16
+
+
+def generar_png(url):
+    """Codifica ``url`` como QR y retorna los bytes PNG."""
+    import qrcode
+
+    buf = io.BytesIO()
+    qrcode.make(url).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+class CacheQR:
+    """LRU de ``url -> (png, etag)`` seguro entre hilos."""
+
+    def __init__(self, max_items=2048):
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, url):
+        with self._lock:
+            item = self._items.get(url)
+            if item is not None:
+                self._items.move_to_end(url)
+                self.hits += 1
+                return item
+            self.misses += 1
+        return self.guardar(url, generar_png(url))
+
+    def faltantes(self, urls):
+        with self._lock:
+            return [u for u in dict.fromkeys(urls) if u not in self._items]
+
+    def guardar(self, url, png):
+        item = (png, hashlib.sha1(png).hexdigest())
+        with self._lock:
+            self._items[url] = item
+            self._items.move_to_end(url)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return item
+
+    def stats(self):
+        return {'items': len(self._items), 'hits': self.hits, 'misses': self.misses}
+
+
+cache = CacheQR()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pool_procesos():
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn': no hereda los hilos ni conexiones del worker web
+            _pool = ProcessPoolExecutor(
+                max_workers=int(os.environ.get('QR_PROCESOS', max(1, (os.cpu_count() or 2) // 2))),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def precalentar(urls):
+    """Genera en paralelo los PNG que no estan en cache."""
+    faltantes = cache.faltantes(urls)
+    if len(faltantes) < MIN_PARA_POOL:
+        for url in faltantes:
+            cache.obtener(url)
+        return
+    chunk = max(1, len(faltantes) // 32)
+    for url, png in zip(faltantes, _pool_procesos().map(generar_png, faltantes, chunksize=chunk)):
+        cache.guardar(url, png)
+
+
+def _fuente(tamano):
+    """Retorna ``(fuente, unicode)``; la fuente por defecto solo trae ASCII."""
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype('DejaVuSans.ttf', tamano), True
+    except OSError:
+        pass
+    try:
+        return ImageFont.load_default(size=tamano), False
+    except TypeError:  # Pillow < 10.1 sin fuentes escalables
+        return ImageFont.load_default(), False
+
+
+def _texto(dibujo, xy, texto, fuente, centrado=False):
+    fuente, es_unicode = fuente
+    if not es_unicode:
+        texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+    x, y = xy
+    if centrado:
+        x -= dibujo.textlength(texto, font=fuente) / 2
+    dibujo.text((x, y), texto, fill='black', font=fuente)
+
+
+def total_paginas(etiquetas):
+    return max(1, math.ceil(len(etiquetas) / (COLUMNAS * FILAS)))
+
+
+def componer_hoja(titulo, etiquetas, pagina=None):
+    """Arma las paginas de ``etiquetas`` = ``[(url, linea1, linea2), ...]``.
+
+    Generador de imagenes PIL en escala de grises con ``COLUMNAS x FILAS`` QR
+    por pagina; con ``pagina`` (desde 1) se compone solo esa. Cada pagina se
+    arma cuando se pide, asi que en memoria hay una sola a la vez.
+    """
+    from PIL import Image, ImageDraw
+
+    por_pagina = COLUMNAS * FILAS
+    total = total_paginas(etiquetas)
+    numeros = range(total) if pagina is None else [pagina - 1]
+    precalentar([url for n in numeros for url, _, _ in etiquetas[n * por_pagina:(n + 1) * por_pagina]])
+    fuente_titulo, fuente_codigo, fuente_accion = _fuente(28), _fuente(22), _fuente(15)
+    ancho_celda = (ANCHO_PAGINA - 2 * MARGEN) / COLUMNAS
+    alto_celda = (ALTO_PAGINA - 2 * MARGEN - 50) / FILAS
+
+    for numero in numeros:
+        # 'L' (1 byte por pixel): el contenido es blanco y negro
+        hoja = Image.new('L', (ANCHO_PAGINA, ALTO_PAGINA), 'white')
+        dibujo = ImageDraw.Draw(hoja)
+        _texto(dibujo, (MARGEN, MARGEN - 20), f'{titulo} - página {numero + 1}/{total}', fuente_titulo)
+        for i, (url, linea1, linea2) in enumerate(etiquetas[numero * por_pagina:(numero + 1) * por_pagina]):
+            fila, columna = divmod(i, COLUMNAS)
+            x = MARGEN + columna * ancho_celda
+            y = MARGEN + 50 + fila * alto_celda
+            png, _ = cache.obtener(url)
+            imagen = Image.open(io.BytesIO(png)).convert('L').resize((LADO_QR, LADO_QR), Image.NEAREST)
+            hoja.paste(imagen, (int(x + (ancho_celda - LADO_QR) / 2), int(y)))
+            _texto(dibujo, (x + ancho_celda / 2, y + LADO_QR + 4), linea1, fuente_codigo, centrado=True)
+            _texto(dibujo, (x + ancho_celda / 2, y + LADO_QR + 32), linea2, fuente_accion, centrado=True)
+        yield hoja
+
+
+def exportar(paginas, formato):
+    """Serializa las paginas como un PDF multipagina o la primera como PNG.
+
+    El PDF se escribe pagina por pagina (``append=True``) para no retener
+    todas las imagenes; ``paginas`` puede ser un generador.
+    """
+    buf = io.BytesIO()
+    paginas = iter(paginas)
+    if formato != 'pdf':
+        next(paginas).save(buf, format='PNG', optimize=True)
+        return buf.getvalue()
+    for i, hoja in enumerate(paginas):
+        hoja.save(buf, format='PDF', append=i > 0, resolution=DPI)
+        hoja.close()
+    return buf.getvalue()
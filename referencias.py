@@ -0,0 +1,197 @@
+"""Cache en proceso de las tablas de referencia (``EstadoCama``, ``Perfil``).
+
+Estas tablas casi nunca cambian pero se consultan en casi todos los
+requests. El cache guarda copias inmutables (desacopladas de la sesion) con
+busqueda por id y por nombre, y se recarga completo cuando:
+
+* vence el TTL,
+* una escritura a estas tablas se confirma en este proceso, o
+* otro worker incremento ``version_referencias`` en ``parametros_sistema``
+  (se revisa como maximo cada ``intervalo_version`` segundos).
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, EstadoCama, ParametroSistema, Perfil
+
+CLAVE_VERSION = 'version_referencias'
+
+
+@dataclass(frozen=True)
+class EstadoRef:
+    id: int
+    nombre: str
+    color: str
+    border_color: str
+    descripcion: str
+    orden: int
+    activo: bool
+
+    def to_dict(self):
+        return EstadoCama.to_dict(self)
+
+
+@dataclass(frozen=True)
+class PerfilRef:
+    id: int
+    nombre: str
+    color: str
+    nivel_acceso: int
+    activo: bool
+
+    def to_dict(self):
+        return Perfil.to_dict(self)
+
+
+def _como_id(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+class CacheReferencias:
+    def __init__(self, ttl=300, intervalo_version=2):
+        self.ttl = ttl
+        self.intervalo_version = intervalo_version
+        self.hits = 0
+        self.misses = 0
+        self.recargas = 0
+        self._lock = threading.Lock()
+        self._datos = None
+        self._cargado_en = 0
+        self._version = None
+        self._version_revisada_en = 0
+
+    def invalidar(self):
+        self._datos = None
+
+    def _version_db(self):
+        return db.session.query(ParametroSistema.valor).filter_by(clave=CLAVE_VERSION).scalar() or 0
+
+    def _recargar(self):
+        estados = [
+            EstadoRef(e.id, e.nombre, e.color, e.border_color, e.descripcion, e.orden, e.activo)
+            for e in EstadoCama.query.order_by(EstadoCama.orden, EstadoCama.id)
+        ]
+        perfiles = [
+            PerfilRef(p.id, p.nombre, p.color, p.nivel_acceso, p.activo)
+            for p in Perfil.query.order_by(Perfil.id)
+        ]
+        self._datos = {
+            'estados': estados,
+            'estados_id': {e.id: e for e in estados},
+            'estados_nombre': {e.nombre: e for e in estados},
+            'perfiles': perfiles,
+            'perfiles_id': {p.id: p for p in perfiles},
+            'perfiles_nombre': {p.nombre: p for p in perfiles},
+            'derivados': {},
+        }
+        self._cargado_en = time.monotonic()
+        self.recargas += 1
+
+    def _vigentes(self):
+        ahora = time.monotonic()
+        datos = self._datos
+        if datos is not None and ahora - self._cargado_en < self.ttl:
+            if ahora - self._version_revisada_en < self.intervalo_version:
+                self.hits += 1
+                return datos
+            version = self._version_db()
+            self._version_revisada_en = ahora
+            if version == self._version:
+                self.hits += 1
+                return datos
+
+        with self._lock:
+            if self._datos is not None and self._datos is not datos:
+                # Otro hilo recargo mientras se esperaba el lock
+                self.hits += 1
+                return self._datos
+            self.misses += 1
+            self._version = self._version_db()
+            self._version_revisada_en = ahora
+            self._recargar()
+            return self._datos
+
+    def estado(self, nombre):
+        return self._vigentes()['estados_nombre'].get(nombre)
+
+    def estado_por_id(self, estado_id):
+        return self._vigentes()['estados_id'].get(_como_id(estado_id))
+
+    def estados(self, activos=True):
+        return [e for e in self._vigentes()['estados'] if e.activo or not activos]
+
+    def perfil(self, nombre):
+        return self._vigentes()['perfiles_nombre'].get(nombre)
+
+    def perfil_por_id(self, perfil_id):
+        return self._vigentes()['perfiles_id'].get(_como_id(perfil_id))
+
+    def perfiles(self, activos=True):
+        return [p for p in self._vigentes()['perfiles'] if p.activo or not activos]
+
+    def derivado(self, clave, construir):
+        """``construir(cache)`` calculado una vez por carga de las referencias."""
+        derivados = self._vigentes()['derivados']
+        if clave not in derivados:
+            derivados[clave] = construir(self)
+        return derivados[clave]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'recargas': self.recargas,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+            'version': self._version,
+            'edad_segundos': round(time.monotonic() - self._cargado_en, 1) if self._datos else None,
+            'ttl': self.ttl,
+        }
+
+
+cache = CacheReferencias()
+
+
+def incrementar_version(connection, clave=CLAVE_VERSION):
+    """Avisa a todos los workers que las tablas de referencia cambiaron."""
+    tabla = ParametroSistema.__table__
+    actualizadas = connection.execute(
+        tabla.update().where(tabla.c.clave == clave).values(valor=tabla.c.valor + 1)
+    ).rowcount
+    if not actualizadas:
+        connection.execute(tabla.insert().values(clave=clave, valor=1))
+
+
+def marcar_modificadas(session):
+    """Incrementa la version e invalida el cache al confirmar ``session``.
+
+    Las escrituras con Core (upserts masivos) no pasan por ``after_flush``;
+    quien las hace debe llamar a esta funcion en la misma transaccion.
+    """
+    incrementar_version(session.connection())
+    session.info['referencias_modificadas'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _detectar_cambios(session, flush_context):
+    modificados = list(session.new) + list(session.deleted) + [o for o in session.dirty if session.is_modified(o)]
+    if any(isinstance(obj, (EstadoCama, Perfil)) for obj in modificados):
+        marcar_modificadas(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_al_confirmar(session):
+    if session.info.pop('referencias_modificadas', False):
+        cache.invalidar()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_al_revertir(session):
+    session.info.pop('referencias_modificadas', None)
@@ -0,0 +1,278 @@
+"""Resumen diario pre-agregado de ``historial_camas``.
+
+El dashboard lee de tablas chicas en vez de recorrer el historial crudo:
+
+* ``resumen_estado_dia`` (dia, estado): entradas, salidas y segundos en el
+  estado; alcanza para los KPIs sin filtro y la permanencia promedio.
+* ``resumen_perfil_dia`` (dia, perfil): transiciones por perfil.
+* ``resumen_ubicacion_dia`` (sector, dia, estado): solo para los KPIs
+  filtrados por ubicacion.
+
+El grano es diario porque ninguna vista lo necesita mas fino; con grano
+horario por estado, perfil y sector el resumen tenia mas filas que el
+historial. Se pone al dia de forma incremental: ``actualizar()`` procesa
+las filas con id mayor a la marca guardada en ``parametros_sistema``. No
+corre en los requests: lo llama un hilo por worker (``iniciar_en_proceso``)
+o ``flask resumen-actualizar``. Las lecturas suman el resumen hasta la
+marca y el historial crudo posterior (``pendientes()``), y vuelven al
+historial crudo si la marca quedo muy atras. ``backfill()`` lo reconstruye
+completo y ``verificar()`` lo compara contra el historial crudo.
+"""
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+
+from models import (
+    db, insert_upsert, Cama, HistorialCama, ParametroSistema, ResumenEstado, ResumenPerfil, ResumenUbicacion
+)
+
+logger = logging.getLogger('centro_comandos.resumen')
+
+CLAVE_MARCA = 'resumen_historial_id'
+TAMANO_LOTE = 5000
+TOLERANCIA_SEGUNDOS = 1.0  # sumas de float en distinto orden
+
+_lock = threading.Lock()
+
+
+def _marca():
+    return db.session.query(ParametroSistema.valor).filter_by(clave=CLAVE_MARCA).scalar()
+
+
+def pendientes():
+    """``(marca, filas de historial posteriores)``; marca None si nunca se armo."""
+    marca, tope = db.session.execute(db.select(
+        db.select(ParametroSistema.valor).where(ParametroSistema.clave == CLAVE_MARCA).scalar_subquery(),
+        db.select(func.max(HistorialCama.id)).scalar_subquery()
+    )).one()
+    if marca is None:
+        return None, None
+    return marca, max(0, (tope or 0) - marca)
+
+
+def _upsert(modelo, claves, filas):
+    """INSERT ... ON CONFLICT que suma los contadores a la fila existente."""
+    tabla = modelo.__table__
+    stmt = insert_upsert(tabla)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=claves,
+        set_={
+            columna.name: columna + stmt.excluded[columna.name]
+            for columna in tabla.columns if columna.name not in claves
+        }
+    )
+    db.session.execute(stmt, filas)
+
+
+def _procesar_lote(desde_id, hasta_id):
+    """Agrega las filas de historial con id en (desde_id, hasta_id]."""
+    previo = aliased(HistorialCama)
+    inicio_previo = db.select(func.max(previo.created_at)).where(
+        previo.cama_id == HistorialCama.cama_id,
+        previo.created_at < HistorialCama.created_at
+    ).scalar_subquery()
+
+    filas = db.session.execute(
+        db.select(
+            HistorialCama.created_at,
+            HistorialCama.estado_anterior_id,
+            HistorialCama.estado_nuevo_id,
+            HistorialCama.perfil_id,
+            Cama.ubicacion_id,
+            inicio_previo
+        ).join(Cama, Cama.id == HistorialCama.cama_id)
+        .where(HistorialCama.id > desde_id, HistorialCama.id <= hasta_id)
+    )
+
+    por_estado = defaultdict(lambda: [0, 0, 0.0])
+    por_perfil = defaultdict(int)
+    por_ubicacion = defaultdict(int)
+    for created_at, anterior_id, nuevo_id, perfil_id, ubicacion_id, inicio in filas:
+        if created_at is None:
+            continue
+        dia = created_at.date()
+        por_estado[(dia, nuevo_id)][0] += 1
+        por_perfil[(dia, perfil_id or 0)] += 1
+        por_ubicacion[(ubicacion_id, dia, nuevo_id)] += 1
+        if anterior_id and inicio is not None:
+            # Episodio del estado anterior que termina con esta transicion
+            fila = por_estado[(dia, anterior_id)]
+            fila[1] += 1
+            fila[2] += (created_at - inicio).total_seconds()
+
+    if por_estado:
+        _upsert(ResumenEstado, ['dia', 'estado_id'], [
+            {'dia': dia, 'estado_id': estado_id, 'entradas': e, 'salidas': s, 'segundos_en_estado': seg}
+            for (dia, estado_id), (e, s, seg) in por_estado.items()
+        ])
+        _upsert(ResumenPerfil, ['dia', 'perfil_id'], [
+            {'dia': dia, 'perfil_id': perfil_id, 'entradas': n} for (dia, perfil_id), n in por_perfil.items()
+        ])
+        _upsert(ResumenUbicacion, ['ubicacion_id', 'dia', 'estado_id'], [
+            {'ubicacion_id': ubicacion_id, 'dia': dia, 'estado_id': estado_id, 'entradas': n}
+            for (ubicacion_id, dia, estado_id), n in por_ubicacion.items()
+        ])
+
+
+def actualizar():
+    """Pone el resumen al dia con el historial nuevo. Retorna filas procesadas."""
+    with _lock:
+        marca = _marca()
+        if marca is None:
+            db.session.add(ParametroSistema(clave=CLAVE_MARCA, valor=0))
+            db.session.commit()
+            marca = 0
+        tope = db.session.query(func.max(HistorialCama.id)).scalar() or 0
+        procesadas = 0
+        while marca < tope:
+            hasta = min(marca + TAMANO_LOTE, tope)
+            _procesar_lote(marca, hasta)
+            # Compare-and-set de la marca: si otro worker ya proceso el lote se descarta
+            movida = db.session.query(ParametroSistema).filter_by(clave=CLAVE_MARCA, valor=marca).update(
+                {'valor': hasta}, synchronize_session=False
+            )
+            if not movida:
+                db.session.rollback()
+                return procesadas
+            db.session.commit()
+            procesadas += hasta - marca
+            marca = hasta
+        return procesadas
+
+
+def backfill():
+    """Reconstruye el resumen completo desde el historial crudo."""
+    with _lock:
+        for modelo in (ResumenEstado, ResumenPerfil, ResumenUbicacion):
+            db.session.query(modelo).delete()
+        db.session.query(ParametroSistema).filter_by(clave=CLAVE_MARCA).delete()
+        db.session.commit()
+    return actualizar()
+
+
+def _crudo(marca):
+    """Los mismos agregados que ``_procesar_lote``, recorriendo el historial por cama."""
+    por_estado = defaultdict(lambda: [0, 0, 0.0])
+    por_perfil = defaultdict(int)
+    por_ubicacion = defaultdict(int)
+    filas = db.session.execute(
+        db.select(
+            HistorialCama.id, HistorialCama.cama_id, HistorialCama.created_at,
+            HistorialCama.estado_anterior_id, HistorialCama.estado_nuevo_id, HistorialCama.perfil_id
+        ).join(Cama, Cama.id == HistorialCama.cama_id)
+        .where(HistorialCama.created_at.isnot(None))
+        .order_by(HistorialCama.cama_id, HistorialCama.created_at)
+        .execution_options(yield_per=TAMANO_LOTE)
+    )
+    cama_actual, anterior, ultimo = None, None, None
+    for id_, cama_id, created_at, anterior_id, nuevo_id, perfil_id in filas:
+        if cama_id != cama_actual:
+            cama_actual, anterior, ultimo = cama_id, None, None
+        if ultimo is not None and ultimo < created_at:
+            # Inicio del episodio = ultima fecha estrictamente anterior de la cama
+            anterior = ultimo
+        ultimo = created_at
+        if id_ > marca:
+            continue
+        dia = created_at.date()
+        por_estado[(dia, nuevo_id)][0] += 1
+        por_perfil[(dia, perfil_id or 0)] += 1
+        por_ubicacion[(dia, nuevo_id)] += 1
+        if anterior_id and anterior is not None:
+            fila = por_estado[(dia, anterior_id)]
+            fila[1] += 1
+            fila[2] += (created_at - anterior).total_seconds()
+    return por_estado, por_perfil, por_ubicacion
+
+
+def verificar():
+    """Compara las tres tablas del resumen contra ``historial_camas``.
+
+    Revisa entradas, salidas y segundos por dia y estado, entradas por dia y
+    perfil, y el total por dia y estado del resumen por ubicacion. Retorna la
+    lista de diferencias ``{tabla, dia, clave, campo, resumen, historial}``;
+    una lista vacia significa que el resumen es consistente hasta la marca.
+    """
+    marca = _marca() or 0
+    crudo_estado, crudo_perfil, crudo_ubicacion = _crudo(marca)
+    resumen_estado = {
+        (dia, estado_id): (e, s, seg) for dia, estado_id, e, s, seg in db.session.query(
+            ResumenEstado.dia, ResumenEstado.estado_id, ResumenEstado.entradas,
+            ResumenEstado.salidas, ResumenEstado.segundos_en_estado
+        )
+    }
+    resumen_perfil = dict(((dia, perfil_id), n) for dia, perfil_id, n in db.session.query(
+        ResumenPerfil.dia, ResumenPerfil.perfil_id, ResumenPerfil.entradas
+    ))
+    resumen_ubicacion = dict(((dia, estado_id), n) for dia, estado_id, n in db.session.query(
+        ResumenUbicacion.dia, ResumenUbicacion.estado_id, func.sum(ResumenUbicacion.entradas)
+    ).group_by(ResumenUbicacion.dia, ResumenUbicacion.estado_id))
+
+    diferencias = []
+
+    def comparar(tabla, campo, resumen, historial, tolerancia=0):
+        for clave in sorted(set(resumen) | set(historial)):
+            r, h = resumen.get(clave, 0), historial.get(clave, 0)
+            if abs(r - h) > tolerancia:
+                diferencias.append({
+                    'tabla': tabla, 'dia': clave[0].isoformat(), 'clave': clave[1],
+                    'campo': campo, 'resumen': r, 'historial': h
+                })
+
+    for i, campo in enumerate(('entradas', 'salidas', 'segundos_en_estado')):
+        comparar(
+            'estado', campo,
+            {clave: fila[i] for clave, fila in resumen_estado.items()},
+            {clave: fila[i] for clave, fila in crudo_estado.items()},
+            TOLERANCIA_SEGUNDOS if campo == 'segundos_en_estado' else 0
+        )
+    comparar('perfil', 'entradas', resumen_perfil, crudo_perfil)
+    comparar('ubicacion', 'entradas', resumen_ubicacion, crudo_ubicacion)
+    return diferencias
+
+
+def alineado_a_dia(fecha):
+    """El resumen es diario: solo sirve para rangos con limites a medianoche."""
+    return fecha is None or fecha == fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def ejecutar(app, intervalo, detener):
+    """Llama ``actualizar()`` cada ``intervalo`` segundos hasta que se fije ``detener``."""
+    while True:
+        try:
+            with app.app_context():
+                procesadas = actualizar()
+            if procesadas:
+                logger.info('resumen del historial: %s filas nuevas', procesadas)
+        except Exception:
+            logger.exception('error al actualizar el resumen del historial')
+        if detener.wait(intervalo):
+            return
+
+
+_en_proceso = None  # (pid, threading.Event)
+_lock_proceso = threading.Lock()
+
+
+def iniciar_en_proceso(app):
+    """Arranca el hilo que mantiene el resumen, una vez por proceso.
+
+    Varios workers pueden correrlo: la marca se mueve con compare-and-set y
+    el que pierde descarta su lote.
+    """
+    global _en_proceso
+    if _en_proceso is not None and _en_proceso[0] == os.getpid():
+        return _en_proceso[1]
+    with _lock_proceso:
+        if _en_proceso is None or _en_proceso[0] != os.getpid():
+            detener = threading.Event()
+            threading.Thread(
+                target=ejecutar, args=(app, app.config.get('RESUMEN_INTERVALO', 60), detener),
+                name='resumen-historial', daemon=True
+            ).start()
+            _en_proceso = (os.getpid(), detener)
+    return _en_proceso[1]
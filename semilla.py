@@ -0,0 +1,268 @@
+"""Datos de demostracion cargados con inserciones masivas.
+
+``sembrar()`` deja la base con la jerarquia Torre/Piso/Sector de ejemplo,
+camas, pacientes e historial (los perfiles, estados y SLA oficiales los
+carga la migracion de catalogos, ver catalogos.py). Se ejecuta con
+``flask seed-demo`` (no al importar la aplicacion) y es idempotente:
+
+* los catalogos se vuelven a asegurar con ``catalogos.sembrar()``,
+* los SLA de los sectores demo se insertan solo si faltan,
+* pacientes y torres se insertan solo si faltan (una consulta cada uno), y
+* las camas e historial se generan solo para las torres nuevas, asi una
+  segunda corrida no agrega nada.
+
+Todo va en una transaccion con ``executemany``; el historial recorre el
+ciclo real de una cama con tiempos exponenciales por estado y cada cama
+termina en el estado de su ultima transicion.
+"""
+import heapq
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from models import db, insert_upsert, Cama, HistorialCama, Paciente, SlaEstado, TerminoPaciente, Ubicacion
+import alertas_sla
+import altas
+import catalogos
+import busqueda
+import cambios
+import jerarquia
+import resumen
+
+HISTORIAL_POR_DEFECTO = 2000
+DIAS_POR_DEFECTO = 42
+TAMANO_LOTE = 20000
+
+# Ciclo de una cama y fraccion del ciclo que pasa en cada estado
+CICLO = [
+    ('Disponible', 0.10),
+    ('Ocupada', 0.70),
+    ('Alta Medica', 0.05),
+    ('Esperando Traslado', 0.04),
+    ('Esperando Higiene', 0.04),
+    ('Higiene Realizado', 0.04),
+    ('Proceso de Liberacion', 0.03),
+]
+BLOQUEADA = 'Bloqueada'
+PESO_BLOQUEADA = 0.02
+PROB_BLOQUEO = 0.01
+CON_PACIENTE = {'Ocupada', 'Alta Medica', 'Esperando Traslado'}
+
+# Sectores criticos con plazos mas cortos
+SLAS_POR_SECTOR = {
+    'UCI': {'Esperando Higiene': 30, 'Higiene Realizado': 15},
+    'Urgencias': {'Esperando Higiene': 30, 'Higiene Realizado': 15},
+}
+
+ESTRUCTURAS = [
+    {
+        'nombre': 'Torre A',
+        'pisos': [
+            {'nombre': 'Piso 1', 'sectores': ['UCI', 'Urgencias']},
+            {'nombre': 'Piso 2', 'sectores': ['Medicina General', 'Cardiologia']},
+            {'nombre': 'Piso 3', 'sectores': ['Cirugia', 'Traumatologia']},
+        ]
+    },
+    {
+        'nombre': 'Torre B',
+        'pisos': [
+            {'nombre': 'Piso 1', 'sectores': ['Pediatria', 'Neonatologia']},
+            {'nombre': 'Piso 2', 'sectores': ['Maternidad', 'Ginecologia']},
+        ]
+    },
+]
+CAMAS_POR_SECTOR = (4, 9)
+
+PACIENTES = [
+    {'nombre': 'Juan Pérez', 'rut': '12.345.678-9'},
+    {'nombre': 'María González', 'rut': '9.876.543-2'},
+    {'nombre': 'Pedro Soto', 'rut': '15.432.167-K'},
+    {'nombre': 'Ana Martínez', 'rut': '8.765.432-1'},
+    {'nombre': 'Carlos Rojas', 'rut': '11.222.333-4'},
+    {'nombre': 'Lucía Fernández', 'rut': '14.555.666-7'},
+    {'nombre': 'Roberto Silva', 'rut': '7.888.999-0'},
+    {'nombre': 'Carmen López', 'rut': '16.111.222-3'},
+]
+
+
+def sembrar_slas(estados):
+    """Inserta los SLA de ``SLAS_POR_SECTOR`` que falten (los generales van en catalogos.py)."""
+    sectores = db.session.execute(
+        db.select(Ubicacion.id, Ubicacion.nombre).where(Ubicacion.tipo == 'sector', Ubicacion.nombre.in_(SLAS_POR_SECTOR))
+    )
+    filas = [
+        {'estado_id': estados[nombre], 'ubicacion_id': sector_id, 'minutos': m}
+        for sector_id, sector in sectores
+        for nombre, m in SLAS_POR_SECTOR[sector].items()
+    ]
+    if filas:
+        stmt = insert_upsert(SlaEstado.__table__).on_conflict_do_nothing(index_elements=['estado_id', 'ubicacion_id'])
+        db.session.execute(stmt, filas)
+    # SLA y ubicaciones nuevas entran con Core: el programador debe rearmar su heap
+    alertas_sla.incrementar_version(db.session.connection())
+
+
+def _sembrar_pacientes():
+    """Inserta los pacientes demo que faltan (por RUT); retorna todos sus ids."""
+    ruts = [p['rut'] for p in PACIENTES]
+    existentes = set(db.session.scalars(db.select(Paciente.rut).where(Paciente.rut.in_(ruts))))
+    nuevos = [
+        dict(p, rut_normalizado=busqueda.normalizar_rut(p['rut']),
+             nombre_normalizado=busqueda.normalizar_texto(p['nombre']), activo=True)
+        for p in PACIENTES if p['rut'] not in existentes
+    ]
+    if nuevos:
+        # Insercion masiva: sin eventos del mapper, los terminos se escriben aca
+        ids = db.session.scalars(insert(Paciente).returning(Paciente.id, sort_by_parameter_order=True), nuevos).all()
+        db.session.execute(TerminoPaciente.__table__.insert(), [
+            {'termino': t, 'paciente_id': id_}
+            for id_, p in zip(ids, nuevos) for t in busqueda.terminos(p['nombre'], p['rut'])
+        ])
+    return list(db.session.scalars(db.select(Paciente.id).where(Paciente.rut.in_(ruts))))
+
+
+def _insertar_ubicaciones(filas):
+    return db.session.scalars(insert(Ubicacion).returning(Ubicacion.id, sort_by_parameter_order=True), filas).all()
+
+
+def _sembrar_estructura():
+    """Crea las torres que faltan con sus pisos y sectores; retorna los sectores nuevos."""
+    existentes = set(db.session.scalars(
+        db.select(Ubicacion.nombre).where(Ubicacion.tipo == 'torre', Ubicacion.nombre.in_([t['nombre'] for t in ESTRUCTURAS]))
+    ))
+    torres = [t for t in ESTRUCTURAS if t['nombre'] not in existentes]
+    if not torres:
+        return []
+
+    # Un INSERT por nivel: cada nivel necesita los ids del anterior
+    ids_torres = _insertar_ubicaciones([
+        {'nombre': t['nombre'], 'tipo': 'torre', 'camas_por_fila': 4} for t in torres
+    ])
+    pisos = [(torre_id, p) for torre_id, t in zip(ids_torres, torres) for p in t['pisos']]
+    ids_pisos = _insertar_ubicaciones([
+        {'nombre': p['nombre'], 'tipo': 'piso', 'padre_id': torre_id, 'camas_por_fila': 3} for torre_id, p in pisos
+    ])
+    sectores = [(piso_id, nombre) for piso_id, (_, p) in zip(ids_pisos, pisos) for nombre in p['sectores']]
+    ids_sectores = _insertar_ubicaciones([
+        {'nombre': nombre, 'tipo': 'sector', 'padre_id': piso_id, 'camas_por_fila': 3} for piso_id, nombre in sectores
+    ])
+    jerarquia.recalcular_rutas()
+    return [(sector_id, nombre) for sector_id, (_, nombre) in zip(ids_sectores, sectores)]
+
+
+def transiciones(cama_id, inicio, fin, ciclo_segundos, estados, pacientes, rnd):
+    """Genera ``(fecha, cama_id, anterior_id, nuevo_id, paciente_id)`` de una cama hasta ``fin``.
+
+    ``estados`` es ``{nombre: id}``; ``pacientes`` la lista de ids a asignar
+    al entrar a Ocupada.
+    """
+    fecha = inicio + timedelta(seconds=rnd.uniform(0, ciclo_segundos))
+    anterior, paso, paciente = None, 0, None
+    while True:
+        if anterior != BLOQUEADA and rnd.random() < PROB_BLOQUEO:
+            nuevo, peso = BLOQUEADA, PESO_BLOQUEADA
+        else:
+            nuevo, peso = CICLO[paso % len(CICLO)]
+            paso += 1
+        if nuevo == 'Ocupada':
+            paciente = rnd.choice(pacientes) if pacientes else None
+        elif nuevo not in CON_PACIENTE:
+            paciente = None
+        yield fecha, cama_id, estados.get(anterior), estados[nuevo], paciente
+        fecha += timedelta(seconds=rnd.expovariate(1 / (peso * ciclo_segundos)))
+        if fecha >= fin:
+            return
+        anterior = nuevo
+
+
+def ciclo_para(filas, camas, dias):
+    """Duracion media del ciclo para que ``camas`` acumulen ~``filas`` en ``dias``."""
+    filas_por_cama = max(1, filas // max(1, camas))
+    return dias * 86400 / max(1, filas_por_cama / len(CICLO))
+
+
+def insertar_historial(filas, perfiles, rnd, al_insertar=None):
+    """Inserta en lotes las tuplas de ``transiciones`` (en orden cronologico).
+
+    Retorna ``({cama_id: (estado_id, paciente_id, fecha)}, total)`` con la
+    ultima transicion de cada cama.
+    """
+    nombres = {id_: nombre for nombre, id_ in perfiles.items()}
+    ids_perfil = list(nombres)
+    ultimas, lote, total = {}, [], 0
+    for fecha, cama_id, anterior, nuevo, paciente in filas:
+        perfil = rnd.choice(ids_perfil)
+        lote.append({
+            'cama_id': cama_id, 'estado_anterior_id': anterior, 'estado_nuevo_id': nuevo,
+            'perfil_id': perfil, 'paciente_id': paciente, 'usuario': f'Usuario {nombres[perfil]}',
+            'created_at': fecha,
+        })
+        ultimas[cama_id] = (nuevo, paciente, fecha)
+        if len(lote) >= TAMANO_LOTE:
+            db.session.execute(HistorialCama.__table__.insert(), lote)
+            altas.registrar(lote)
+            total += len(lote)
+            lote = []
+            if al_insertar:
+                al_insertar(total)
+    if lote:
+        db.session.execute(HistorialCama.__table__.insert(), lote)
+        altas.registrar(lote)
+        total += len(lote)
+    return ultimas, total
+
+
+def fijar_estado_final(ultimas):
+    """Deja cada cama en el estado, paciente e inicio de su ultima transicion."""
+    if not ultimas:
+        return
+    tabla = Cama.__table__
+    db.session.execute(
+        tabla.update().where(tabla.c.id == db.bindparam('c_id')).values(
+            estado_id=db.bindparam('c_estado'), paciente_id=db.bindparam('c_paciente'),
+            estado_inicio=db.bindparam('c_inicio'), updated_at=db.bindparam('c_inicio')
+        ),
+        [{'c_id': c, 'c_estado': e, 'c_paciente': p, 'c_inicio': f} for c, (e, p, f) in ultimas.items()]
+    )
+
+
+def sembrar(historial=HISTORIAL_POR_DEFECTO, dias=DIAS_POR_DEFECTO, semilla=None):
+    """Carga los datos demo que falten; retorna cuantas filas se insertaron."""
+    rnd = random.Random(semilla)
+    perfiles, estados = catalogos.sembrar()
+    pacientes = _sembrar_pacientes()
+    sectores = _sembrar_estructura()
+    sembrar_slas(estados)
+
+    camas = [
+        {'codigo': f'{nombre[:3].upper()}-{i:02d}', 'nombre': f'Cama {i}', 'ubicacion_id': sector_id,
+         'estado_id': estados['Disponible'], 'orden': i, 'activo': True, 'version': 1}
+        for sector_id, nombre in sectores
+        for i in range(1, rnd.randint(*CAMAS_POR_SECTOR) + 1)
+    ]
+    total_historial = 0
+    if camas:
+        ultimo = cambios.reservar(db.session.connection(), len(camas))
+        for seq, cama in enumerate(camas, start=ultimo - len(camas) + 1):
+            cama['cambio_seq'] = seq
+        ids = db.session.scalars(insert(Cama).returning(Cama.id, sort_by_parameter_order=True), camas).all()
+
+        # Transiciones de todas las camas intercaladas en orden cronologico
+        fin = datetime.utcnow()
+        inicio = fin - timedelta(days=dias)
+        ciclo = ciclo_para(historial, len(ids), dias)
+        flujos = [transiciones(id_, inicio, fin, ciclo, estados, pacientes, rnd) for id_ in ids]
+        ultimas, total_historial = insertar_historial(heapq.merge(*flujos), perfiles, rnd)
+        # Un paciente demo queda en a lo mas una cama
+        ocupados = set()
+        for cama_id, (estado, paciente, fecha) in ultimas.items():
+            if paciente in ocupados:
+                ultimas[cama_id] = (estado, None, fecha)
+            ocupados.add(paciente)
+        fijar_estado_final(ultimas)
+
+    db.session.commit()
+    if total_historial:
+        resumen.actualizar()
+    return {'camas': len(camas), 'historial': total_historial, 'pacientes': len(pacientes)}
@@ -0,0 +1,78 @@
+"""Serializacion rapida para endpoints de listas.
+
+En vez de cargar objetos ORM y llamar ``to_dict()`` por fila (con sus
+relaciones), se seleccionan tuplas planas con Core y se arman los mismos
+diccionarios que produce ``to_dict()``. Los estados salen del cache de
+referencias y el JSON se codifica con ``orjson`` cuando esta instalado.
+"""
+import json
+from datetime import date, datetime
+
+from flask import Response
+
+from models import db, Cama, Paciente, formato_duracion
+from referencias import cache as referencias
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional
+    orjson = None
+
+
+def _por_defecto(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f'{type(valor).__name__} no es serializable')
+
+
+def dumps(datos):
+    """Codifica ``datos`` como JSON en bytes."""
+    if orjson is not None:
+        return orjson.dumps(datos, default=_por_defecto)
+    return json.dumps(datos, ensure_ascii=False, separators=(',', ':'), default=_por_defecto).encode()
+
+
+def respuesta_json(datos, status=200):
+    return Response(dumps(datos), status=status, mimetype='application/json')
+
+
+def camas(*filtros):
+    """Camas activas que cumplen ``filtros`` con la forma de ``Cama.to_dict()``."""
+    filas = db.session.execute(
+        db.select(
+            Cama.id, Cama.codigo, Cama.nombre, Cama.ubicacion_id, Cama.estado_id,
+            Cama.paciente_id, Cama.estado_inicio, Cama.orden, Cama.version,
+            Paciente.nombre, Paciente.rut
+        ).outerjoin(Paciente, Paciente.id == Cama.paciente_id)
+        .where(Cama.activo == True, *filtros)
+        .order_by(Cama.orden)
+    )
+    estados = {e.id: e.to_dict() for e in referencias.estados(activos=False)}
+    ahora = datetime.utcnow()
+    resultado = []
+    for (id_, codigo, nombre, ubicacion_id, estado_id, paciente_id, inicio, orden, version,
+         paciente_nombre, paciente_rut) in filas:
+        segundos = (ahora - inicio).total_seconds() if inicio else 0
+        resultado.append({
+            'id': id_,
+            'codigo': codigo,
+            'nombre': nombre,
+            'ubicacion_id': ubicacion_id,
+            'estado_id': estado_id,
+            'estado': estados.get(estado_id),
+            'paciente': {'id': paciente_id, 'nombre': paciente_nombre, 'rut': paciente_rut} if paciente_id else None,
+            'paciente_id': paciente_id,
+            'tiempo_estado': formato_duracion(segundos),
+            'tiempo_minutos': int(segundos // 60),
+            'orden': orden,
+            'version': version,
+        })
+    return resultado
+
+
+def pacientes(*filtros):
+    """Pacientes activos con la forma de ``Paciente.to_dict()``."""
+    filas = db.session.execute(
+        db.select(Paciente.id, Paciente.nombre, Paciente.rut).where(Paciente.activo == True, *filtros)
+    )
+    return [{'id': id_, 'nombre': nombre, 'rut': rut} for id_, nombre, rut in filas]
@@ -5,6 +5,8 @@ let selectedPerfilId = null;
 let selectedPacienteId = null;
 let pacienteMode = 'nuevo';
 let currentCamaData = null;
+let historialCursor = null;
+let transicionesEstados = null;  // {transiciones: {origen: {destino: nivel}}, nivel_acceso}
 
 // ==========================================
 // MONITOR DE CAMAS
@@ -35,6 +37,25 @@ function initMonitor() {
 
     // Modal handlers
     initModalHandlers();
+    cargarTransiciones();
+}
+
+// Transiciones permitidas por la maquina de estados; sin ellas no se restringe nada
+async function cargarTransiciones() {
+    try {
+        const response = await fetch('/api/estados/transiciones');
+        if (response.ok) {
+            transicionesEstados = await response.json();
+        }
+    } catch (e) {
+        transicionesEstados = null;
+    }
+}
+
+function transicionPermitida(origenId, destinoId) {
+    if (!transicionesEstados) return true;
+    const nivel = (transicionesEstados.transiciones[origenId] || {})[destinoId];
+    return nivel !== undefined && transicionesEstados.nivel_acceso <= nivel;
 }
 
 async function openEstadoModal(cell) {
@@ -74,9 +95,10 @@ async function openEstadoModal(cell) {
     selectedPerfilId = null;
     document.querySelectorAll('.perfil-btn').forEach(btn => btn.classList.remove('selected'));
 
-    // Limpiar seleccion de estado
+    // Limpiar seleccion de estado y deshabilitar los no alcanzables desde el actual
     document.querySelectorAll('.estado-btn').forEach(btn => {
         btn.classList.remove('selected');
+        btn.disabled = !transicionPermitida(estadoActual, btn.dataset.estadoId);
         if (btn.dataset.estadoId === estadoActual) {
             btn.classList.add('selected');
             selectedEstadoId = estadoActual;
@@ -95,8 +117,8 @@ async function openEstadoModal(cell) {
     // Limpiar comentario
     document.getElementById('comentario').value = '';
 
-    // Cargar lista de pacientes para el select
-    await loadPacientesSelect();
+    // El historial se carga recien al expandir la seccion
+    resetHistorial();
 
     // Mostrar modal
     document.getElementById('estado-modal').classList.add('active');
@@ -108,11 +130,12 @@ function resetPacienteFields() {
 
     const nombreInput = document.getElementById('paciente-nombre');
     const rutInput = document.getElementById('paciente-rut');
-    const selectPaciente = document.getElementById('paciente-select');
+    const buscarPaciente = document.getElementById('paciente-buscar');
 
     if (nombreInput) nombreInput.value = '';
     if (rutInput) rutInput.value = '';
-    if (selectPaciente) selectPaciente.value = '';
+    if (buscarPaciente) buscarPaciente.value = '';
+    mostrarResultadosPacientes([]);
 
     // Resetear toggles
     document.querySelectorAll('.paciente-toggle-btn').forEach(btn => {
@@ -126,23 +149,44 @@ function resetPacienteFields() {
     if (existenteFields) existenteFields.style.display = 'none';
 }
 
-async function loadPacientesSelect() {
-    try {
-        const response = await fetch('/api/pacientes');
-        const pacientes = await response.json();
-
-        const select = document.getElementById('paciente-select');
-        if (select) {
-            select.innerHTML = '<option value="">Seleccione un paciente...</option>';
-            pacientes.forEach(p => {
-                const nombre = p.nombre || 'Sin nombre';
-                const rut = p.rut || 'Sin RUT';
-                select.innerHTML += `<option value="${p.id}">${nombre} - ${rut}</option>`;
-            });
-        }
-    } catch (error) {
-        console.error('Error cargando pacientes:', error);
+// Busqueda type-ahead de pacientes existentes (/api/pacientes/buscar)
+let busquedaPacienteTimer = null;
+let busquedaPacienteSeq = 0;
+
+function buscarPacientes(q) {
+    clearTimeout(busquedaPacienteTimer);
+    selectedPacienteId = null;
+    if (q.trim().length < 2) {
+        mostrarResultadosPacientes([]);
+        return;
     }
+    busquedaPacienteTimer = setTimeout(async () => {
+        const seq = ++busquedaPacienteSeq;
+        try {
+            const response = await fetch(`/api/pacientes/buscar?q=${encodeURIComponent(q)}&limite=10`);
+            const pacientes = await response.json();
+            // Ignorar respuestas de busquedas anteriores que llegan tarde
+            if (seq === busquedaPacienteSeq) mostrarResultadosPacientes(pacientes);
+        } catch (error) {
+            console.error('Error buscando pacientes:', error);
+        }
+    }, 200);
+}
+
+function mostrarResultadosPacientes(pacientes) {
+    const lista = document.getElementById('paciente-resultados');
+    if (!lista) return;
+    lista.innerHTML = '';
+    pacientes.forEach(p => {
+        const li = document.createElement('li');
+        li.textContent = `${p.nombre || 'Sin nombre'} - ${p.rut || 'Sin RUT'}`;
+        li.addEventListener('click', () => {
+            selectedPacienteId = p.id;
+            document.getElementById('paciente-buscar').value = li.textContent;
+            mostrarResultadosPacientes([]);
+        });
+        lista.appendChild(li);
+    });
 }
 
 function initModalHandlers() {
@@ -204,13 +248,60 @@ function initModalHandlers() {
         });
     });
 
-    // Seleccionar paciente existente
-    document.getElementById('paciente-select')?.addEventListener('change', function () {
-        selectedPacienteId = this.value || null;
+    // Buscar paciente existente
+    document.getElementById('paciente-buscar')?.addEventListener('input', function () {
+        buscarPacientes(this.value);
     });
 
     // Guardar estado
     document.getElementById('btn-guardar-estado')?.addEventListener('click', guardarEstado);
+
+    // Historial de la cama (paginado por cursor)
+    document.getElementById('historial-section')?.addEventListener('toggle', function () {
+        if (this.open && !document.getElementById('historial-lista').children.length) {
+            cargarHistorial();
+        }
+    });
+    document.getElementById('historial-mas')?.addEventListener('click', () => cargarHistorial(historialCursor));
+}
+
+function resetHistorial() {
+    historialCursor = null;
+    const section = document.getElementById('historial-section');
+    if (!section) return;
+    section.open = false;
+    document.getElementById('historial-lista').innerHTML = '';
+    document.getElementById('historial-mas').style.display = 'none';
+}
+
+async function cargarHistorial(cursor = null) {
+    const camaId = selectedCamaId;
+    const params = new URLSearchParams({ limite: 10 });
+    if (cursor) params.set('cursor', cursor);
+
+    try {
+        const response = await fetch(`/api/cama/${camaId}/historial?${params}`);
+        const data = await response.json();
+        if (camaId !== selectedCamaId) return;  // el modal cambio de cama
+
+        const lista = document.getElementById('historial-lista');
+        data.items.forEach(item => {
+            const li = document.createElement('li');
+            const fecha = new Date(item.created_at + 'Z').toLocaleString('es-CL');
+            const quien = item.perfil || item.usuario || '';
+            li.textContent = `${fecha} · ${item.estado_anterior || '—'} → ${item.estado_nuevo || '—'}${quien ? ' · ' + quien : ''}`;
+            if (item.comentario) li.title = item.comentario;
+            lista.appendChild(li);
+        });
+        if (!lista.children.length) {
+            lista.innerHTML = '<li class="historial-vacio">Sin movimientos registrados</li>';
+        }
+
+        historialCursor = data.siguiente;
+        document.getElementById('historial-mas').style.display = historialCursor ? 'block' : 'none';
+    } catch (error) {
+        console.error('Error cargando historial:', error);
+    }
 }
 
 async function guardarEstado(confirmarTraslado = false) {
@@ -260,15 +351,32 @@ async function guardarEstado(confirmarTraslado = false) {
                 paciente_nombre: pacienteNombre,
                 paciente_rut: pacienteRut,
                 paciente_id: pacienteId ? parseInt(pacienteId) : null,
-                confirmar_traslado: confirmarTraslado
+                confirmar_traslado: confirmarTraslado,
+                // Version vista al abrir el modal: el servidor responde 409 si la cama cambio
+                version: currentCamaData ? currentCamaData.version : null
             })
         });
 
         const data = await response.json();
 
+        if (response.status === 409 && data.cama) {
+            actualizarCeldaCama(data.cama.id, data.cama.estado_id, data.cama.version);
+            currentCamaData = data.cama;
+            document.querySelectorAll('.estado-btn').forEach(btn => {
+                btn.disabled = !transicionPermitida(String(data.cama.estado_id), btn.dataset.estadoId);
+            });
+            alert(`${data.error}\n\nEstado actual: ${data.cama.estado ? data.cama.estado.nombre : ''}`);
+            return;
+        }
+
+        if (!response.ok) {
+            alert(data.error || 'Error al guardar el estado');
+            return;
+        }
+
         // Si hay advertencia de traslado, preguntar al usuario
         if (data.warning) {
-            const confirmar = confirm(data.message + '\n\nLa cama anterior pasará a estado "Esperando Limpieza".');
+            const confirmar = confirm(data.message + '\n\nLa cama anterior pasará a estado "Esperando Higiene".');
             if (confirmar) {
                 // Reintentar con confirmación
                 guardarEstado(true);
@@ -278,21 +386,11 @@ async function guardarEstado(confirmarTraslado = false) {
 
         if (data.success) {
             // Actualizar celda de la cama principal
-            const cell = document.querySelector(`.hex-cell[data-cama-id="${selectedCamaId}"]`);
-            cell.style.setProperty('--cell-color', data.cama.estado.color);
-            cell.dataset.estadoId = data.cama.estado.id;
-            cell.querySelector('.cama-estado').textContent = data.cama.estado.nombre;
-            cell.title = `${data.cama.codigo} - ${data.cama.estado.nombre}`;
+            actualizarCeldaCama(data.cama.id, data.cama.estado_id, data.cama.version);
 
             // Si hubo traslado, actualizar también la cama anterior
             if (data.traslado && data.cama_anterior) {
-                const cellAnterior = document.querySelector(`.hex-cell[data-cama-id="${data.cama_anterior.id}"]`);
-                if (cellAnterior) {
-                    cellAnterior.style.setProperty('--cell-color', data.cama_anterior.estado.color);
-                    cellAnterior.dataset.estadoId = data.cama_anterior.estado.id;
-                    cellAnterior.querySelector('.cama-estado').textContent = data.cama_anterior.estado.nombre;
-                    cellAnterior.title = `${data.cama_anterior.codigo} - ${data.cama_anterior.estado.nombre}`;
-                }
+                actualizarCeldaCama(data.cama_anterior.id, data.cama_anterior.estado_id, data.cama_anterior.version);
             }
 
             // Cerrar modal
@@ -307,6 +405,141 @@ async function guardarEstado(confirmarTraslado = false) {
     }
 }
 
+// Aplica un estado a la celda hexagonal de una cama sin recargar la página
+function actualizarCeldaCama(camaId, estadoId, version) {
+    const cell = document.querySelector(`.hex-cell[data-cama-id="${camaId}"]`);
+    const estadoBtn = document.querySelector(`.estado-btn[data-estado-id="${estadoId}"]`);
+    if (!cell || !estadoBtn) return;
+
+    const nombre = estadoBtn.dataset.estadoNombre;
+    const codigo = cell.querySelector('.cama-codigo').textContent;
+
+    cell.style.setProperty('--cell-color', estadoBtn.dataset.estadoColor);
+    cell.classList.toggle('border-state', !!estadoBtn.dataset.estadoBorder);
+    cell.dataset.estadoId = estadoId;
+    if (version !== undefined) cell.dataset.version = version;
+    cell.querySelector('.cama-estado').textContent = nombre;
+    cell.title = `${codigo} - ${nombre}`;
+
+    cell.dispatchEvent(new CustomEvent('cama-actualizada', { bubbles: true }));
+}
+
+// ==========================================
+// EVENTOS EN VIVO (SSE)
+// ==========================================
+
+const REINTENTO_STREAM_MS = 60000;
+
+// Se suscribe a /api/eventos y llama onCama({cama_id, estado_id, version, estado_inicio}).
+// onResync se llama cuando el servidor descarto eventos y al reconectar tras un corte.
+// Sin EventSource, o si el servidor rechaza el stream (503: sin cupo), llama
+// onResync cada intervaloPolling ms y reintenta el stream cada minuto.
+function suscribirEventosCamas(onCama, onResync, intervaloPolling) {
+    let polling = null;
+    const iniciarPolling = () => {
+        if (!polling) polling = setInterval(onResync, intervaloPolling);
+    };
+    if (!window.EventSource) {
+        iniciarPolling();
+        return;
+    }
+
+    const conectar = () => {
+        const source = new EventSource('/api/eventos');
+        let desconectado = false;
+        source.addEventListener('cama', e => onCama(JSON.parse(e.data)));
+        source.addEventListener('resync', () => onResync());
+        source.addEventListener('error', () => {
+            desconectado = true;
+            // CLOSED: respuesta distinta de 200, el navegador no reintenta solo
+            if (source.readyState === EventSource.CLOSED) {
+                iniciarPolling();
+                setTimeout(conectar, REINTENTO_STREAM_MS);
+            }
+        });
+        source.addEventListener('open', () => {
+            clearInterval(polling);
+            polling = null;
+            if (desconectado) onResync();
+            desconectado = false;
+        });
+    };
+    conectar();
+}
+
+// ==========================================
+// SINCRONIZACION INCREMENTAL (/api/camas/cambios)
+// ==========================================
+
+let tokenCambios = null;
+let sincronizacionEnCurso = null;
+
+// Pide los cambios posteriores a tokenCambios y los aplica sobre las celdas.
+// Si cambio la estructura (cama nueva, desactivada o movida de sector) recarga.
+function sincronizarCambios() {
+    if (tokenCambios === null) return Promise.resolve();
+    if (!sincronizacionEnCurso) {
+        sincronizacionEnCurso = aplicarCambiosPendientes().finally(() => { sincronizacionEnCurso = null; });
+    }
+    return sincronizacionEnCurso;
+}
+
+async function aplicarCambiosPendientes() {
+    let mas = true;
+    let hubo = false;
+    try {
+        while (mas) {
+            const response = await fetch(`/api/camas/cambios?since=${tokenCambios}`);
+            if (!response.ok) return;
+            const data = await response.json();
+
+            for (const cama of data.camas) {
+                const cell = document.querySelector(`.hex-cell[data-cama-id="${cama.id}"]`);
+                const sector = cell?.closest('.sector-card');
+                if (!cell || (sector && Number(sector.dataset.sectorId) !== cama.ubicacion_id)) {
+                    location.reload();
+                    return;
+                }
+                actualizarCeldaCama(cama.id, cama.estado_id, cama.version);
+            }
+            if (data.eliminadas.some(id => document.querySelector(`.hex-cell[data-cama-id="${id}"]`))) {
+                location.reload();
+                return;
+            }
+
+            hubo = hubo || data.camas.length > 0;
+            tokenCambios = data.token;
+            mas = data.mas;
+        }
+        if (hubo) loadStats();
+    } catch (error) {
+        console.error('Error sincronizando cambios:', error);
+    }
+}
+
+function initEventosMonitor() {
+    let statsTimer = null;
+    const token = document.querySelector('.monitor-container')?.dataset.tokenCambios;
+    tokenCambios = token !== undefined ? Number(token) : null;
+
+    // Los eventos en vivo no mueven el token: un corte a mitad de una rafaga
+    // se recupera igual desde el ultimo token confirmado por el feed.
+    // Sin stream, el feed reemplaza al push cada 15 segundos
+    suscribirEventosCamas(evento => {
+        actualizarCeldaCama(evento.cama_id, evento.estado_id, evento.version);
+
+        // Agrupar recargas de estadisticas cuando llegan varios eventos seguidos
+        clearTimeout(statsTimer);
+        statsTimer = setTimeout(loadStats, 500);
+    }, sincronizarCambios, 15000);
+
+    // Al volver de suspension o de un corte de red
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') sincronizarCambios();
+    });
+    window.addEventListener('online', sincronizarCambios);
+}
+
 // ==========================================
 // ESTADISTICAS
 // ==========================================
@@ -0,0 +1,62 @@
+"""Fixtures: una aplicacion sobre una base SQLite temporal con datos demo."""
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from config import Config, opciones_motor  # noqa: E402
+from models import db  # noqa: E402
+import semilla  # noqa: E402
+
+
+def _crear_app(tmp_path):
+    url = f'sqlite:///{tmp_path / "centro_comandos.db"}'
+
+    class ConfigPrueba(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = url
+        SQLALCHEMY_ENGINE_OPTIONS = opciones_motor(url, 2)
+        ALERTAS_SLA = 'no'
+        RESUMEN_ACTUALIZAR = 'no'
+
+    return create_app(ConfigPrueba)
+
+
+@pytest.fixture
+def app_vacia(tmp_path):
+    """Base recien creada, sin datos demo."""
+    app = _crear_app(tmp_path)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def app(app_vacia):
+    with app_vacia.app_context():
+        semilla.sembrar(historial=500, semilla=1)
+    return app_vacia
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def consultas(app):
+    """Lista de ``(sentencia, parametros)`` ejecutados; ``consultas.clear()`` la reinicia."""
+    ejecutadas = []
+
+    def registrar(conn, cursor, sentencia, parametros, contexto, executemany):
+        ejecutadas.append((sentencia, parametros))
+
+    with app.app_context():
+        motor = db.engine
+    event.listen(motor, 'before_cursor_execute', registrar)
+    yield ejecutadas
+    event.remove(motor, 'before_cursor_execute', registrar)
@@ -0,0 +1,41 @@
+"""El KPI de cierre exitoso sigue al historial tambien con confirmaciones QR."""
+from sqlalchemy import and_, exists
+from sqlalchemy.orm import aliased
+
+from models import db, Cama, HistorialCama
+import referencias
+
+
+def _cierre_crudo():
+    """Camas con un Alta Medica seguida de Disponible o Proceso de Liberacion."""
+    alta = referencias.cache.estado('Alta Medica').id
+    cierre = [referencias.cache.estado(n).id for n in ('Disponible', 'Proceso de Liberacion')]
+    posterior = aliased(HistorialCama)
+    return db.session.query(HistorialCama.cama_id).filter(
+        HistorialCama.estado_nuevo_id == alta,
+        exists().where(and_(
+            posterior.cama_id == HistorialCama.cama_id,
+            posterior.estado_nuevo_id.in_(cierre),
+            posterior.created_at > HistorialCama.created_at
+        ))
+    ).distinct().count()
+
+
+def test_confirmacion_qr_cierra_alta(app, client):
+    with app.app_context():
+        cama = Cama.query.filter_by(activo=True).first()
+        cama.estado_id = referencias.cache.estado('Ocupada').id
+        db.session.commit()
+        cama_id = cama.id
+        alta_id = referencias.cache.estado('Alta Medica').id
+
+    assert client.post(f'/api/cama/{cama_id}/estado', json={'estado_id': alta_id}).status_code == 200
+    assert client.post(f'/qr/confirmar/{cama_id}/traslado').status_code == 200
+    antes = client.get('/api/dashboard/kpis').get_json()['cierre_exitoso']
+    assert client.post(f'/qr/confirmar/{cama_id}/higiene').status_code == 200
+
+    kpis = client.get('/api/dashboard/kpis').get_json()
+    with app.app_context():
+        assert db.session.get(Cama, cama_id).estado.nombre == 'Proceso de Liberacion'
+        assert kpis['cierre_exitoso'] == _cierre_crudo()
+    assert kpis['cierre_exitoso'] == antes + 1
@@ -0,0 +1,34 @@
+"""Busqueda de pacientes: mismo resultado por cualquiera de los dos caminos."""
+import pytest
+
+from models import db, Paciente
+import busqueda
+
+NOMBRES = [
+    'María González Soto', 'Mario Araya', 'Marta Muñoz', 'Ana María Pérez', 'Manuel González',
+    'José Martínez', 'Magdalena Castro', 'Carlos Mansilla', 'Gonzalo Rojas', 'Matías Soto',
+]
+
+
+def _esperado(q, limite):
+    """Referencia en Python: cada palabra prefijo de un termino, mismo orden."""
+    palabras = [busqueda._normalizar_palabra(p) for p in q.split()]
+    primera = busqueda.normalizar_texto(q).split()[0]
+    filas = []
+    for p in Paciente.query.filter_by(activo=True):
+        terminos = busqueda.terminos(p.nombre, p.rut)
+        if all(any(t.startswith(palabra) for t in terminos) for palabra in palabras):
+            filas.append((not p.nombre_normalizado.startswith(primera), p.nombre_normalizado, p.id))
+    return [id_ for _, _, id_ in sorted(filas)[:limite]]
+
+
+@pytest.mark.parametrize('max_candidatos', [1, 500], ids=['recorre_indice', 'candidatos'])
+@pytest.mark.parametrize('q', ['ma', 'm', 'go', 'mar go', 'so ma', 'gonzalez', 'MARÍA', 'ma zz', 'xq'])
+def test_buscar_igual_a_referencia(app, monkeypatch, max_candidatos, q):
+    monkeypatch.setattr(busqueda, 'MAX_CANDIDATOS', max_candidatos)
+    with app.app_context():
+        for i, nombre in enumerate(NOMBRES * 3):
+            db.session.add(Paciente(nombre=nombre, rut=f'{20000000 + i}-{i % 10}', activo=i % 7 != 0))
+        db.session.commit()
+        for limite in (3, 10):
+            assert [p['id'] for p in busqueda.buscar(q, limite)] == _esperado(q, limite), (q, limite)
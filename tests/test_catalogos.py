@@ -0,0 +1,37 @@
+"""Una base nueva trae los catalogos oficiales sin cargar datos demo."""
+from models import db, Cama, EstadoCama, HistorialCama, Perfil, SlaEstado
+import app as aplicacion
+import catalogos
+
+
+def test_base_nueva_tiene_catalogos(app_vacia):
+    with app_vacia.app_context():
+        assert {p.nombre for p in Perfil.query} == {p['nombre'] for p in catalogos.PERFILES}
+        assert {e.nombre for e in EstadoCama.query} == {e['nombre'] for e in catalogos.ESTADOS}
+        assert SlaEstado.query.filter_by(ubicacion_id=0).count() == len(catalogos.SLAS)
+        assert Cama.query.count() == 0
+        assert HistorialCama.query.count() == 0
+
+
+def test_catalogos_idempotente(app_vacia):
+    with app_vacia.app_context():
+        catalogos.sembrar()
+        db.session.commit()
+        assert Perfil.query.count() == len(catalogos.PERFILES)
+        assert SlaEstado.query.count() == len(catalogos.SLAS)
+
+
+def test_crear_cama_en_base_nueva(app_vacia):
+    client = app_vacia.test_client()
+    torre = client.post('/api/ubicacion', json={'nombre': 'Torre', 'tipo': 'torre'}).get_json()['ubicacion']
+    respuesta = client.post('/api/cama', json={'codigo': 'C-01', 'ubicacion_id': torre['id']})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['cama']['estado']['nombre'] == 'Disponible'
+    assert client.get('/').status_code == 200
+
+
+def test_crear_cama_sin_estado_inicial(app_vacia, monkeypatch):
+    monkeypatch.setattr(aplicacion.referencias, 'estado', lambda nombre: None)
+    client = app_vacia.test_client()
+    respuesta = client.post('/api/cama', json={'codigo': 'C-01', 'ubicacion_id': 1})
+    assert respuesta.status_code == 409
@@ -0,0 +1,145 @@
+"""Cambios de estado concurrentes: sin historial perdido ni duplicado.
+
+Varios hilos cambian el estado de unas pocas camas a la vez con
+``POST /api/cama/<id>/estado`` y ``POST /api/camas/estado``. Despues:
+
+* hay una fila de historial nueva por cada cambio confirmado,
+* cada fila parte del estado en que termino la anterior de la misma cama,
+* el estado final de la cama es el de su ultima fila y su ``version`` subio
+  exactamente una vez por cambio.
+"""
+import random
+import threading
+from collections import Counter
+
+from sqlalchemy import update
+
+from models import db, Cama, EstadoCama, HistorialCama
+import app as aplicacion
+
+HILOS = 4
+ITERACIONES = 15
+CAMAS = 2
+
+
+def _trabajador(cliente, camas, estados, rnd, exitos, respuestas, lock):
+    for _ in range(ITERACIONES):
+        if rnd.random() < 0.2:
+            cambios = [{'cama_id': c, 'estado_id': rnd.choice(estados)} for c in camas]
+            r = cliente.post('/api/camas/estado', json={'comentario': 'estres', 'cambios': cambios})
+            aplicadas = [x['cama_id'] for x in (r.get_json() or {}).get('resultados', []) if x.get('success')]
+        else:
+            cama_id = rnd.choice(camas)
+            r = cliente.post(f'/api/cama/{cama_id}/estado', json={'estado_id': rnd.choice(estados), 'comentario': 'estres'})
+            aplicadas = [cama_id] if r.status_code == 200 else []
+        with lock:
+            exitos.update(aplicadas)
+            respuestas[r.status_code] += 1
+
+
+def _estado_inicial(app, camas):
+    with app.app_context():
+        marca = db.session.query(db.func.max(HistorialCama.id)).scalar() or 0
+        versiones = {c.id: c.version for c in Cama.query.filter(Cama.id.in_(camas))}
+    return marca, versiones
+
+
+def _verificar(camas, marca, versiones, exitos):
+    for cama_id in camas:
+        filas = HistorialCama.query.filter(
+            HistorialCama.cama_id == cama_id, HistorialCama.id > marca
+        ).order_by(HistorialCama.id).all()
+        cama = db.session.get(Cama, cama_id)
+        assert len(filas) == exitos[cama_id], cama_id
+        for previa, fila in zip(filas, filas[1:]):
+            assert fila.estado_anterior_id == previa.estado_nuevo_id, (cama_id, fila.id)
+        if filas:
+            assert filas[-1].estado_nuevo_id == cama.estado_id, cama_id
+        assert cama.version - versiones[cama_id] == exitos[cama_id], cama_id
+
+
+def test_cambios_concurrentes_no_pierden_historial(app):
+    with app.app_context():
+        camas = [c.id for c in Cama.query.filter_by(activo=True).order_by(Cama.id).limit(CAMAS)]
+        # Sin 'Ocupada' para no depender de pacientes ni traslados
+        estados = [e.id for e in EstadoCama.query.filter(EstadoCama.activo == True, EstadoCama.nombre != 'Ocupada')]
+    marca, versiones = _estado_inicial(app, camas)
+
+    exitos, respuestas, lock = Counter(), Counter(), threading.Lock()
+    hilos = [
+        threading.Thread(target=_trabajador, args=(
+            app.test_client(), camas, estados, random.Random(i), exitos, respuestas, lock
+        ))
+        for i in range(HILOS)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert set(respuestas) <= {200, 403, 409}, respuestas
+    assert sum(exitos.values()) > 0
+    with app.app_context():
+        _verificar(camas, marca, versiones, exitos)
+
+
+def _escritura_concurrente(app, monkeypatch, veces):
+    """Hace que otro 'request' actualice la cama antes de las primeras ``veces`` flush."""
+    original = aplicacion._aplicar_cambio_estado
+    pendientes = [veces]
+
+    def con_escritura(cama, *args, **kwargs):
+        resultado = original(cama, *args, **kwargs)
+        if pendientes[0]:
+            pendientes[0] -= 1
+            with db.engine.begin() as conexion:
+                conexion.execute(update(Cama).where(Cama.id == cama.id).values(version=Cama.version + 1))
+        return resultado
+
+    monkeypatch.setattr(aplicacion, '_aplicar_cambio_estado', con_escritura)
+
+
+def _cama_y_destino(app):
+    with app.app_context():
+        cama = Cama.query.filter_by(activo=True).order_by(Cama.id).first()
+        bloqueada = EstadoCama.query.filter_by(nombre='Bloqueada').one()
+        cama.estado_id = EstadoCama.query.filter_by(nombre='Disponible').one().id
+        db.session.commit()
+        return cama.id, bloqueada.id
+
+
+def test_stale_data_se_reintenta(app, client, monkeypatch):
+    cama_id, destino = _cama_y_destino(app)
+    marca, versiones = _estado_inicial(app, [cama_id])
+    _escritura_concurrente(app, monkeypatch, veces=1)
+
+    respuesta = client.post(f'/api/cama/{cama_id}/estado', json={'estado_id': destino})
+
+    assert respuesta.status_code == 200
+    with app.app_context():
+        # Una version por la escritura concurrente y otra por el cambio reintentado
+        assert db.session.get(Cama, cama_id).version == versiones[cama_id] + 2
+        assert HistorialCama.query.filter(HistorialCama.cama_id == cama_id, HistorialCama.id > marca).count() == 1
+
+
+def test_conflicto_persistente_responde_409(app, client, monkeypatch):
+    cama_id, destino = _cama_y_destino(app)
+    marca, _ = _estado_inicial(app, [cama_id])
+    _escritura_concurrente(app, monkeypatch, veces=aplicacion.REINTENTOS_CONFLICTO)
+
+    respuesta = client.post(f'/api/cama/{cama_id}/estado', json={'estado_id': destino})
+
+    assert respuesta.status_code == 409
+    assert respuesta.get_json()['conflicto'] is True
+    with app.app_context():
+        assert HistorialCama.query.filter(HistorialCama.cama_id == cama_id, HistorialCama.id > marca).count() == 0
+
+
+def test_version_vieja_responde_409(app, client):
+    cama_id, destino = _cama_y_destino(app)
+    _, versiones = _estado_inicial(app, [cama_id])
+
+    respuesta = client.post(f'/api/cama/{cama_id}/estado', json={'estado_id': destino, 'version': versiones[cama_id] - 1})
+
+    assert respuesta.status_code == 409
+    assert respuesta.get_json()['cama']['version'] == versiones[cama_id]
@@ -0,0 +1,19 @@
+"""Duraciones sobre rangos largos: sin tope de ventana."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from models import db, HistorialCama
+
+
+def test_rango_largo_cubre_todo_el_historial(app, client):
+    desde = (datetime.utcnow() - timedelta(days=400)).date().isoformat()
+    respuesta = client.get(f'/api/dashboard/duraciones?desde={desde}')
+    assert respuesta.status_code == 200
+
+    with app.app_context():
+        filas, camas = db.session.query(
+            func.count(HistorialCama.id), func.count(HistorialCama.cama_id.distinct())
+        ).one()
+    # Cada fila cierra el episodio anterior de su cama, salvo la primera
+    assert sum(f['episodios'] for f in respuesta.get_json()['duraciones']) == filas - camas
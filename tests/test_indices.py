@@ -0,0 +1,78 @@
+"""Las consultas calientes del monitor, el dashboard y el historial usan indices.
+
+Se ejecutan los endpoints, se capturan las sentencias y se pasa cada una por
+``EXPLAIN QUERY PLAN`` con sus mismos parametros.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Cama, HistorialCama
+
+
+def _planes(app, consultas):
+    """Detalle del plan de cada SELECT capturado que toca camas o historial."""
+    planes = []
+    with app.app_context():
+        conexion = db.engine.raw_connection()
+        try:
+            for sentencia, parametros in consultas:
+                if not sentencia.lstrip().upper().startswith(('SELECT', 'WITH')) or 'camas' not in sentencia:
+                    continue
+                filas = conexion.execute('EXPLAIN QUERY PLAN ' + sentencia, parametros).fetchall()
+                planes.append([fila[3] for fila in filas])
+        finally:
+            conexion.close()
+    return planes
+
+
+def _recorre_historial(plan):
+    return any(paso.startswith('SCAN historial_camas') for paso in plan)
+
+
+def _ids(app):
+    with app.app_context():
+        cama_id, paciente_id, sector_id = db.session.query(
+            HistorialCama.cama_id, HistorialCama.paciente_id, Cama.ubicacion_id
+        ).join(Cama, Cama.id == HistorialCama.cama_id).filter(HistorialCama.paciente_id.isnot(None)).first()
+    return cama_id, paciente_id, sector_id
+
+
+def _rango():
+    hoy = datetime.utcnow().date()
+    return f'desde={(hoy - timedelta(days=7)).isoformat()}&hasta={hoy.isoformat()}'
+
+
+def _urls(app, resumen):
+    cama_id, paciente_id, sector_id = _ids(app)
+    rango = _rango()
+    urls = {
+        '/': {'ix_camas_activo_estado_ubicacion'},
+        f'/api/ubicacion/{sector_id}/camas': {'ix_camas_ubicacion_activo_orden'},
+        '/api/estadisticas': {'ix_camas_activo_estado_ubicacion'},
+        '/api/dashboard/tiempos-por-estado': {'ix_camas_activo_estado_ubicacion'},
+        '/api/dashboard/duraciones': {'ix_historial_fecha', 'ix_historial_cama_fecha'},
+        f'/api/cama/{cama_id}/historial': {'ix_historial_cama_fecha'},
+        f'/api/paciente/{paciente_id}/historial': {'ix_historial_paciente_fecha'},
+        f'/api/historial/export?{rango}': {'ix_historial_fecha'},
+        f'/api/dashboard/kpis?{rango}': {'ix_altas_cama'},
+        '/api/dashboard/registros-semana': set() if resumen else {'ix_historial_perfil_fecha'},
+    }
+    if not resumen:
+        urls[f'/api/dashboard/kpis?{rango}'] |= {'ix_historial_fecha'}
+    return urls
+
+
+@pytest.mark.parametrize('resumen', [True, False], ids=['resumen', 'historial_crudo'])
+def test_planes_usan_indices(app, client, consultas, resumen):
+    app.config['RESUMEN_HISTORIAL'] = resumen
+    for url, indices in _urls(app, resumen).items():
+        consultas.clear()
+        assert client.get(url).status_code == 200, url
+        planes = _planes(app, consultas)
+        assert planes, url
+        usados = ' '.join(paso for plan in planes for paso in plan)
+        for indice in indices:
+            assert indice in usados, (url, indice, planes)
+        for plan in planes:
+            assert not _recorre_historial(plan), (url, plan)
@@ -0,0 +1,43 @@
+"""Las metricas por request cuentan tambien los que terminan en excepcion."""
+import pytest
+
+import instrumentacion
+
+
+def _total(endpoint, status):
+    clave = (endpoint, 'GET', status)
+    return instrumentacion.metricas._requests.get(clave, 0)
+
+
+def _ruta_que_falla(app, nombre):
+    def falla():
+        raise RuntimeError('falla de prueba')
+    app.add_url_rule(f'/prueba/{nombre}', nombre, falla)
+
+
+def test_excepcion_propagada_se_cuenta_como_500(app_vacia):
+    _ruta_que_falla(app_vacia, 'falla_propagada')
+    client = app_vacia.test_client()
+    with pytest.raises(RuntimeError):
+        client.get('/prueba/falla_propagada')
+    assert _total('falla_propagada', 500) == 1
+    texto = client.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{endpoint="falla_propagada",method="GET",status="500"} 1' in texto
+    assert 'http_request_duration_seconds_count{endpoint="falla_propagada",method="GET"} 1' in texto
+
+
+def test_excepcion_manejada_por_flask_se_cuenta_una_vez(app_vacia):
+    _ruta_que_falla(app_vacia, 'falla_500')
+    app_vacia.config['PROPAGATE_EXCEPTIONS'] = False
+    respuesta = app_vacia.test_client().get('/prueba/falla_500')
+    assert respuesta.status_code == 500
+    assert _total('falla_500', 500) == 1
+
+
+def test_request_normal_conserva_status_y_server_timing(app_vacia):
+    client = app_vacia.test_client()
+    antes = _total('principal.metricas_prometheus', 200)
+    respuesta = client.get('/metrics')
+    assert respuesta.status_code == 200
+    assert 'sql;desc=' in respuesta.headers['Server-Timing']
+    assert _total('principal.metricas_prometheus', 200) == antes + 1
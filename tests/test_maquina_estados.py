@@ -0,0 +1,42 @@
+"""Permisos de la maquina de estados por nivel de acceso."""
+import pytest
+
+from models import db, Cama, Perfil
+import maquina_estados
+import referencias
+
+
+def _nivel(origen, destino):
+    estado = referencias.cache.estado
+    return maquina_estados.nivel_requerido(estado(origen).id, estado(destino).id)
+
+
+@pytest.mark.parametrize('origen, destino, nivel', [
+    ('Ocupada', 'Alta Medica', maquina_estados.PERSONAL),
+    ('Ocupada', 'Esperando Higiene', maquina_estados.TODOS),
+    ('Ocupada', 'Ocupada', maquina_estados.MISMO_ESTADO),
+    # No declaradas: solo el Administrador, p.ej. para corregir un escaneo
+    ('Ocupada', 'Disponible', maquina_estados.ADMINISTRADOR),
+    ('Ocupada', 'Bloqueada', maquina_estados.ADMINISTRADOR),
+    ('Disponible', 'Proceso de Liberacion', maquina_estados.ADMINISTRADOR),
+])
+def test_nivel_requerido(app_vacia, origen, destino, nivel):
+    with app_vacia.app_context():
+        assert _nivel(origen, destino) == nivel
+
+
+def test_administrador_corrige_y_personal_no(app, client):
+    with app.app_context():
+        cama = Cama.query.filter_by(activo=True).first()
+        cama.estado_id = referencias.cache.estado('Ocupada').id
+        db.session.commit()
+        cama_id = cama.id
+        disponible = referencias.cache.estado('Disponible').id
+        enfermera = Perfil.query.filter_by(nombre='Enfermera').one().id
+
+    client.post('/api/session/perfil', json={'perfil_id': enfermera})
+    assert client.post(f'/api/cama/{cama_id}/estado', json={'estado_id': disponible}).status_code == 403
+
+    with client.session_transaction() as sesion:
+        sesion.pop('perfil_id')
+    assert client.post(f'/api/cama/{cama_id}/estado', json={'estado_id': disponible}).status_code == 200
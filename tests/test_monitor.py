@@ -0,0 +1,41 @@
+"""El monitor de camas se arma en una cantidad fija de consultas."""
+from models import db, Cama, Ubicacion
+import referencias
+
+MAX_CONSULTAS_MONITOR = 4  # token de cambios, ubicaciones, camas y holgura
+
+
+def _agregar_camas(app, cantidad):
+    with app.app_context():
+        disponible = referencias.cache.estado('Disponible')
+        sectores = Ubicacion.query.filter_by(tipo='sector', activo=True).all()
+        db.session.add_all([
+            Cama(codigo=f'T-{i:04d}', nombre=f'Cama {i}', ubicacion_id=sectores[i % len(sectores)].id,
+                 estado_id=disponible.id, orden=100 + i, activo=True)
+            for i in range(cantidad)
+        ])
+        db.session.commit()
+
+
+def _consultas_monitor(client, consultas):
+    # Un request previo carga los catalogos cacheados (referencias)
+    assert client.get('/').status_code == 200
+    consultas.clear()
+    respuesta = client.get('/')
+    assert respuesta.status_code == 200
+    return len(consultas), respuesta
+
+
+def test_monitor_consultas_constantes(app, client, consultas):
+    antes, _ = _consultas_monitor(client, consultas)
+    _agregar_camas(app, 300)
+    despues, respuesta = _consultas_monitor(client, consultas)
+
+    assert b'T-0299' in respuesta.data
+    assert antes <= MAX_CONSULTAS_MONITOR
+    assert despues == antes
+
+
+def test_no_existe_api_monitor(client):
+    # El monitor se sirve en '/'; no hay una ruta JSON aparte
+    assert client.get('/api/monitor').status_code == 404
@@ -0,0 +1,20 @@
+"""Permanencia promedio por estado: igual con y sin el resumen diario."""
+
+
+def _promedios(client):
+    return {
+        estado: datos['promedio_historico_segundos']
+        for estado, datos in client.get('/api/dashboard/tiempos-por-estado').get_json().items()
+    }
+
+
+def test_promedio_sin_resumen_igual_al_resumen(app, client):
+    app.config['RESUMEN_HISTORIAL'] = True
+    con_resumen = _promedios(client)
+    app.config['RESUMEN_HISTORIAL'] = False
+    crudo = _promedios(client)
+
+    assert set(crudo) == set(con_resumen)
+    for estado, promedio in con_resumen.items():
+        assert promedio is not None and crudo[estado] is not None, estado
+        assert abs(crudo[estado] - promedio) <= 1, estado